@@ -0,0 +1,269 @@
+"""Move the history of settled, idle groups out of the hot tables.
+
+Usage:
+    python -m app.archive run [--idle-days 180] [--limit N] [--dry-run]
+    python -m app.archive list
+
+A group qualifies once every member's net balance is zero (settle-up has
+nothing left to suggest) and it has had no expense or journal event for
+--idle-days. Archiving writes the group's
+expenses (with their splits) and journal events to a gzip-compressed NDJSON
+file in ARCHIVE_DIR, deletes them along with the group's balance snapshots
+and pair balances, and folds the totals into a group_archives row.
+All of it happens in one write transaction under the group's lock
+(app.writes), after checking again that the group still qualifies.
+
+The group itself, its members and their zero net balances stay, so it
+still lists and can take new expenses; ledger pages and the expense
+partitions then only hold what came after. Balances as of a time before
+the archive answer 410. The file starts with a "group" line, then one
+"expense" line per expense (amounts and splits in cents), then one
+"event" line per journal event.
+
+Files are NDJSON rather than Parquet because the app does not depend on
+pyarrow; `zcat` and any JSON tool read them back.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, exists, func, select
+
+from . import models, crud, exports, money, writes
+from .database import SessionLocal
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(tempfile.gettempdir(), "expense-archives"))
+IDLE_DAYS = 180
+
+
+def _timestamp(moment):
+    return moment.isoformat() if moment else None
+
+
+def candidates(db, cutoff, limit=None, group_id=None):
+    """Ids of groups with history, every net balance zero and no activity since `cutoff`."""
+    groups = models.Group.__table__
+    expenses = models.Expense.__table__
+    events = models.LedgerEvent.__table__
+    nets = models.NetBalance.__table__
+
+    def any_row(table, *conditions):
+        return exists().where(and_(table.c.group_id == groups.c.id, *conditions))
+
+    query = select(groups.c.id).where(
+        groups.c.deleted_at.is_(None),
+        any_row(expenses),
+        ~any_row(nets, nets.c.net != 0),
+        ~any_row(expenses, expenses.c.created_at >= cutoff),
+        ~any_row(events, events.c.created_at >= cutoff),
+    ).order_by(groups.c.id)
+    if group_id is not None:
+        query = query.where(groups.c.id == group_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return [row[0] for row in db.execute(query)]
+
+
+def _write_expenses(db, group_id, out, summary):
+    expenses = models.Expense.__table__
+    splits = models.ExpenseSplit.__table__
+    statement = select(
+        expenses.c.id, expenses.c.created_at, expenses.c.description, expenses.c.amount,
+        expenses.c.split_type, expenses.c.added_by
+    ).where(expenses.c.group_id == group_id).order_by(expenses.c.created_at, expenses.c.id)
+
+    members = summary["member_totals"]
+    for partition in db.execute(statement.execution_options(stream_results=True)).partitions(exports.PARTITION_SIZE):
+        shares = defaultdict(dict)
+        for expense_id, user_id, amount in db.execute(
+            select(splits.c.expense_id, splits.c.user_id, splits.c.amount)
+            .where(splits.c.expense_id.in_([row.id for row in partition]))
+        ):
+            shares[expense_id][user_id] = amount
+
+        for row in partition:
+            out.write(json.dumps({
+                "type": "expense", "id": row.id, "created_at": _timestamp(row.created_at),
+                "description": row.description, "amount": row.amount, "split_type": row.split_type,
+                "added_by": row.added_by,
+                "splits": {str(user_id): amount for user_id, amount in shares[row.id].items()},
+            }) + "\n")
+            if summary["first_expense_at"] is None:
+                summary["first_expense_at"] = row.created_at
+            if row.split_type == crud.SETTLEMENT:
+                summary["settlement_count"] += 1
+                continue
+            summary["expense_count"] += 1
+            summary["total_amount"] += row.amount
+            members[str(row.added_by)]["paid"] += row.amount
+            for user_id, amount in shares[row.id].items():
+                members[str(user_id)]["share"] += amount
+
+
+def _write_events(db, group_id, out):
+    events = models.LedgerEvent.__table__
+    statement = select(
+        events.c.id, events.c.kind, events.c.expense_id, events.c.user_id,
+        events.c.counterparty_id, events.c.amount, events.c.created_at
+    ).where(events.c.group_id == group_id).order_by(events.c.id)
+
+    last = None
+    for partition in db.execute(statement.execution_options(stream_results=True)).partitions(exports.PARTITION_SIZE):
+        for row in partition:
+            out.write(json.dumps({
+                "type": "event", "id": row.id, "kind": row.kind, "expense_id": row.expense_id,
+                "user_id": row.user_id, "counterparty_id": row.counterparty_id, "amount": row.amount,
+                "created_at": _timestamp(row.created_at),
+            }) + "\n")
+            if row.created_at is not None and (last is None or row.created_at > last):
+                last = row.created_at
+    return last
+
+
+def write_file(db, group_id, path, archived_at):
+    """Write the group's history to `path`; returns the summary columns for its GroupArchive row."""
+    group = db.get(models.Group, group_id)
+    summary = {
+        "expense_count": 0, "settlement_count": 0, "total_amount": 0,
+        "first_expense_at": None, "last_activity_at": None,
+        "member_totals": defaultdict(lambda: {"paid": 0, "share": 0}),
+    }
+    members = [user_id for user_id, in db.query(models.GroupMembership.user_id).filter(
+        models.GroupMembership.group_id == group_id
+    ).order_by(models.GroupMembership.user_id)]
+
+    # Written under a temporary name so a crash never leaves half an archive
+    with gzip.open(path + ".part", "wt", encoding="utf-8") as out:
+        out.write(json.dumps({
+            "type": "group", "id": group_id, "name": group.name,
+            "archived_at": _timestamp(archived_at), "members": members,
+        }) + "\n")
+        _write_expenses(db, group_id, out, summary)
+        last_event = _write_events(db, group_id, out)
+    os.replace(path + ".part", path)
+
+    last_expense = db.query(func.max(models.Expense.created_at)).filter(models.Expense.group_id == group_id).scalar()
+    moments = [moment for moment in (last_expense, last_event) if moment is not None]
+    summary["last_activity_at"] = max(moments) if moments else None
+    summary["member_totals"] = dict(summary["member_totals"])
+    return summary
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as archived:
+        for block in iter(lambda: archived.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _delete_history(db, group_id):
+    expense_ids = select(models.Expense.id).where(models.Expense.group_id == group_id)
+    snapshot_ids = select(models.BalanceSnapshot.id).where(models.BalanceSnapshot.group_id == group_id)
+    db.query(models.ExpenseSplit).filter(models.ExpenseSplit.expense_id.in_(expense_ids)).delete(synchronize_session=False)
+    db.query(models.BalanceSnapshotLine).filter(
+        models.BalanceSnapshotLine.snapshot_id.in_(snapshot_ids)
+    ).delete(synchronize_session=False)
+    # With every net at zero the pair rows only cancel each other out; the
+    # next expense recreates what it needs
+    for model in (models.LedgerEvent, models.Expense, models.BalanceSnapshot, models.Balance):
+        db.query(model).filter(model.group_id == group_id).delete(synchronize_session=False)
+
+
+def _archive(db, group_id, cutoff, path, archived_at):
+    # Checked again under the lock: an expense may have come in since
+    if not candidates(db, cutoff, group_id=group_id):
+        return None
+    try:
+        summary = write_file(db, group_id, path, archived_at)
+        record = models.GroupArchive(
+            group_id=group_id, archived_at=archived_at, path=path, sha256=_sha256(path), **summary
+        )
+        db.add(record)
+        _delete_history(db, group_id)
+        db.query(models.Group).filter(models.Group.id == group_id).update(
+            {models.Group.archived_at: archived_at}, synchronize_session=False
+        )
+        db.flush()
+    except BaseException:
+        remove_file(path)
+        raise
+    return summary
+
+
+def remove_file(path):
+    for name in (path, path + ".part"):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+def archive_group(db, group_id, cutoff, now=None):
+    """Archive one group if it still qualifies; returns its summary, or None if it no longer does."""
+    archived_at = now or datetime.utcnow()
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f"group-{group_id}-{archived_at:%Y%m%dT%H%M%S}.ndjson.gz")
+    try:
+        return writes.write_group_sync(db, group_id, _archive, group_id, cutoff, path, archived_at)
+    except BaseException:
+        # The write may have finished and the commit failed
+        remove_file(path)
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="archive settled groups idle for --idle-days")
+    run_parser.add_argument("--idle-days", type=int, default=IDLE_DAYS)
+    run_parser.add_argument("--limit", type=int, help="archive at most this many groups")
+    run_parser.add_argument("--dry-run", action="store_true", help="only list the groups that qualify")
+    commands.add_parser("list", help="list archived groups")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.command == "list":
+            for record in db.query(models.GroupArchive).order_by(models.GroupArchive.id):
+                print(
+                    f"group {record.group_id} archived {record.archived_at:%Y-%m-%d}: "
+                    f"{record.expense_count} expense(s), {record.settlement_count} settlement(s), "
+                    f"{money.format_cents(record.total_amount)} -> {record.path}"
+                )
+            return 0
+
+        cutoff = datetime.utcnow() - timedelta(days=args.idle_days)
+        group_ids = candidates(db, cutoff, args.limit)
+        # Release the read transaction before taking group locks
+        db.rollback()
+        if args.dry_run:
+            for group_id in group_ids:
+                print(f"group {group_id} qualifies")
+            print(f"{len(group_ids)} group(s) would be archived")
+            return 0
+
+        archived = 0
+        for group_id in group_ids:
+            try:
+                summary = archive_group(db, group_id, cutoff)
+            except writes.GroupNotFound:
+                continue
+            if summary is None:
+                continue
+            archived += 1
+            print(f"group {group_id}: {summary['expense_count']} expense(s), {summary['settlement_count']} settlement(s)")
+        print(f"archived {archived} of {len(group_ids)} group(s) to {ARCHIVE_DIR}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
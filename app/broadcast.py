@@ -0,0 +1,262 @@
+"""Per-group pub/sub for live balance updates.
+
+Every committed write to a group publishes one compact message with what
+changed, built from the notes crud takes while the transaction holds the
+group's lock (crud.lock_group / note_change):
+
+    {"type": "balances", "group_id": 1, "version": 42,
+     "deltas": {"3": 1250, "5": -1250}, "members": false}
+
+`deltas` are net balance changes in cents per user, `version` is the
+group's version after the write, and `members` says whether anyone joined
+or left. A deleted group sends {"type": "deleted", "group_id": 1}.
+GET /group/{group_id}/stream relays them as server-sent events.
+
+Two brokers are available, picked with BROADCAST_URL:
+
+* ``memory://`` (the default) - delivered after commit to this process's
+  subscribers only, so it suits a single worker
+* ``postgres://`` - NOTIFY inside the write transaction (PostgreSQL sends
+  it only if the transaction commits) and one LISTEN connection per
+  process that hands messages to the local subscribers, so every worker
+  sees every write
+
+Subscribers are bounded queues. One that falls more than QUEUE_SIZE
+messages behind is sent {"type": "resync"} instead and should reload.
+An idle subscriber holds no database connection and costs one queue.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import defaultdict, deque
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+
+from . import crud
+from .database import DATABASE_URL
+
+QUEUE_SIZE = int(os.getenv("BROADCAST_QUEUE_SIZE", "100"))
+# Comment lines keep proxies from closing idle streams
+KEEPALIVE_SECONDS = float(os.getenv("BROADCAST_KEEPALIVE_SECONDS", "15"))
+CHANNEL = "group_updates"
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD = 7900
+
+PENDING = "broadcast_pending"
+
+logger = logging.getLogger(__name__)
+
+
+def messages(changes):
+    """Messages for the changes crud noted in one transaction."""
+    result = []
+    for group_id, change in changes.items():
+        if change["deleted"]:
+            result.append({"type": "deleted", "group_id": group_id})
+            continue
+        result.append({
+            "type": "balances",
+            "group_id": group_id,
+            "version": change["version"],
+            "deltas": {str(user_id): delta for user_id, delta in change["deltas"].items() if delta},
+            "members": change["members"],
+        })
+    return result
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    """A viewer's queue of (event type, encoded SSE text) pairs."""
+
+    def __init__(self, group_id, loop):
+        self.group_id = group_id
+        self.loop = loop
+        self._items = deque()
+        self._waiter = None
+
+    def put(self, item):
+        """Queue an item; must run on the subscription's event loop."""
+        if len(self._items) >= QUEUE_SIZE:
+            # Too far behind for deltas to be useful; tell it to start over
+            self._items.clear()
+            resync = {"type": "resync", "group_id": self.group_id}
+            item = ("resync", sse("resync", resync))
+        self._items.append(item)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self, timeout=None):
+        """The next (event, text) pair, or None if `timeout` seconds pass first."""
+        # A bare future and timer rather than asyncio.wait_for, which starts a
+        # task per call: with thousands of viewers that dominates fan-out
+        if not self._items:
+            self._waiter = self.loop.create_future()
+            timer = None
+            if timeout is not None:
+                timer = self.loop.call_later(timeout, _release, self._waiter)
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+                if timer is not None:
+                    timer.cancel()
+        return self._items.popleft() if self._items else None
+
+
+def _release(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def _put_all(subscriptions, item):
+    for subscription in subscriptions:
+        subscription.put(item)
+
+
+class MemoryBroker:
+    name = "memory"
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, group_id):
+        subscription = Subscription(group_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[group_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.group_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.group_id]
+
+    def subscribers(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def dispatch(self, message):
+        """Hand a message to this process's subscribers of its group."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(message["group_id"], ()))
+        if not subscriptions:
+            return
+        # Encoded once, and one wakeup per event loop rather than per viewer
+        item = (message["type"], sse(message["type"], message))
+        by_loop = defaultdict(list)
+        for subscription in subscriptions:
+            by_loop[subscription.loop].append(subscription)
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        for loop, batch in by_loop.items():
+            if loop is current:
+                _put_all(batch, item)
+                continue
+            # Publishers may run on worker threads (bulk import)
+            try:
+                loop.call_soon_threadsafe(_put_all, batch, item)
+            except RuntimeError:
+                # That event loop has shut down
+                pass
+
+    def prepare(self, db):
+        """Turn the transaction's change notes into messages, before commit."""
+        db.info.setdefault(PENDING, []).extend(messages(crud.take_changes(db)))
+
+    def deliver(self, db):
+        """Publish what prepare() staged, once the transaction has committed."""
+        for message in db.info.pop(PENDING, []):
+            self.dispatch(message)
+
+    def discard(self, db):
+        crud.take_changes(db)
+        db.info.pop(PENDING, None)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class PostgresBroker(MemoryBroker):
+    name = "postgres"
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+        self._connection = None
+
+    def prepare(self, db):
+        # NOTIFY is transactional: listeners hear it only if this commits
+        for message in messages(crud.take_changes(db)):
+            payload = json.dumps(message, separators=(",", ":"))
+            if len(payload) > MAX_PAYLOAD:
+                payload = json.dumps({"type": "resync", "group_id": message["group_id"]})
+            db.execute(select(func.pg_notify(CHANNEL, payload)))
+
+    def deliver(self, db):
+        pass
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            self.dispatch(json.loads(payload))
+        except Exception:
+            logger.exception("bad %s payload: %r", CHANNEL, payload)
+
+    async def start(self):
+        import asyncpg
+        dsn = str(make_url(self.url).set(drivername="postgresql"))
+        self._connection = await asyncpg.connect(dsn)
+        await self._connection.add_listener(CHANNEL, self._on_notify)
+
+    async def stop(self):
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+
+async def event_stream(subscription, snapshot, limit=None):
+    """SSE text for a subscription: a snapshot event, then each message; stops after `limit` events."""
+    sent = 0
+    try:
+        yield "retry: 5000\n\n"
+        yield sse("snapshot", {
+            "group_id": subscription.group_id,
+            "version": snapshot["version"],
+            "net": {str(user_id): net for user_id, net in snapshot["net"].items()},
+        })
+        sent += 1
+        while limit is None or sent < limit:
+            item = await subscription.get(KEEPALIVE_SECONDS)
+            if item is None:
+                yield ": keepalive\n\n"
+                continue
+            kind, text = item
+            yield text
+            sent += 1
+            if kind == "deleted":
+                break
+    finally:
+        hub.unsubscribe(subscription)
+
+
+def build_broker(url=None):
+    url = url or os.getenv("BROADCAST_URL", "memory://")
+    if url.startswith("postgres"):
+        return PostgresBroker(DATABASE_URL)
+    return MemoryBroker()
+
+
+hub = build_broker()
@@ -0,0 +1,177 @@
+"""Streaming CSV/NDJSON expense import with batched inserts.
+
+Each record describes one expense paid by a group member:
+
+    added_by, amount, description, split_type, percentages, created_at
+
+CSV needs a header row and puts one record per line, with percentages
+separated by ';' in membership order (the same order as
+/api/group-users/{group_id}). NDJSON takes one JSON object per line, with
+percentages as a list. created_at (ISO 8601) is optional in both formats;
+one with a UTC offset is converted to UTC, and one without is taken as UTC.
+
+Records are validated and written in chunks. Every chunk is inserted with
+one executemany per table and committed on its own, so a bad row only
+costs that row and memory stays flat however large the upload is.
+"""
+import codecs
+import csv
+import json
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from . import crud, money, writes
+
+BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+
+
+async def iter_lines(chunks):
+    """Yield decoded lines from an async stream of byte chunks."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def iter_records(chunks, fmt):
+    """Yield (line_number, record dict or parse error) pairs."""
+    header = None
+    line_number = 0
+    async for line in iter_lines(chunks):
+        line_number += 1
+        line = line.rstrip("\r")
+        if not line.strip():
+            continue
+
+        if fmt == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                missing = {"added_by", "amount", "split_type"} - set(header)
+                if missing:
+                    yield line_number, ValueError(f"CSV header is missing {', '.join(sorted(missing))}")
+                    return
+                continue
+            yield line_number, dict(zip(header, values))
+        else:
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f"Invalid JSON: {e}")
+                continue
+            if not isinstance(record, dict):
+                yield line_number, ValueError("Each line must be a JSON object")
+                continue
+            yield line_number, record
+
+
+def parse_record(record, member_ids, now):
+    """Validate a raw record and return the expense fields."""
+    try:
+        added_by = int(record.get("added_by"))
+        amount = money.to_cents(record.get("amount"))
+    except (TypeError, ValueError):
+        raise ValueError("added_by and amount must be numbers")
+    if added_by not in member_ids:
+        raise ValueError(f"User {added_by} is not a member of this group")
+    money.check_amount(amount)
+
+    split_type = (record.get("split_type") or "").strip()
+    if split_type not in ("equal", "percent"):
+        raise ValueError("split_type must be 'equal' or 'percent'")
+
+    percentages = record.get("percentages") or None
+    if isinstance(percentages, str):
+        percentages = [p.strip() or 0 for p in percentages.split(";")]
+    if percentages is not None and not isinstance(percentages, list):
+        raise ValueError("percentages must be a list")
+    # The values themselves are parsed exactly (and rejected if malformed) by split_entries
+
+    created_at = record.get("created_at") or None
+    if created_at:
+        try:
+            created_at = crud.naive_utc(datetime.fromisoformat(created_at))
+        except (TypeError, ValueError):
+            raise ValueError("created_at must be an ISO 8601 timestamp")
+    else:
+        created_at = now
+
+    return {
+        "added_by": added_by,
+        "amount": amount,
+        "description": (record.get("description") or "Expense"),
+        "split_type": split_type,
+        "percentages": percentages,
+        "created_at": created_at,
+    }
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line_number, error):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": line_number, "error": str(error)})
+
+    def as_dict(self):
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def write_batch(db: Session, group_id: int, batch, report: ImportReport):
+    """Validate a chunk of (line_number, record) pairs and insert the valid ones.
+
+    Runs as one write transaction on the group (see app.writes), so the
+    membership the rows are checked and split against cannot change before
+    they are committed.
+    """
+    try:
+        imported, errors = writes.write_group_sync(db, group_id, _write_batch, group_id, batch)
+    except writes.GroupNotFound:
+        imported, errors = 0, [(line_number, ValueError("Group not found")) for line_number, _ in batch]
+    # Reported only once committed: a retried transaction validates the chunk again
+    report.imported += imported
+    for line_number, error in errors:
+        report.add_error(line_number, error)
+
+
+def _write_batch(db: Session, group_id: int, batch):
+    """(imported count, [(line_number, error)]) for a chunk, inserted in the caller's transaction."""
+    member_ids = [user.id for user in crud.get_group_members(db, group_id)]
+    members = set(member_ids)
+    now = datetime.utcnow()
+    expenses = []
+    errors = []
+
+    for line_number, record in batch:
+        if isinstance(record, Exception):
+            errors.append((line_number, record))
+            continue
+        try:
+            fields = parse_record(record, members, now)
+            fields["shares"] = crud.split_shares(
+                member_ids, fields["amount"], fields["split_type"], fields.pop("percentages")
+            )
+        except ValueError as e:
+            errors.append((line_number, e))
+            continue
+        expenses.append(fields)
+
+    crud.record_expenses(db, group_id, expenses)
+    return len(expenses), errors
@@ -0,0 +1,279 @@
+"""Read-through cache for group membership lists and balance summaries.
+
+Two backends are available:
+
+* MemoryBackend - in-process TTL + LRU dictionary (the default)
+* RedisBackend  - any Redis-protocol server, shared by every worker process
+
+Set CACHE_URL to ``memory://`` or ``redis://host:port/db``. The Redis backend
+takes any client object with mget/set(ex=)/delete/incr, so it can be driven
+by a local fake in tests (tests/test_cache.py). Values are stored as plain JSON-compatible data.
+
+Entries are keyed by group and are invalidated explicitly by the write
+routes. CACHE_TTL only bounds how long another process's writes can go
+unseen when every worker has its own memory backend. Multi-worker
+deployments should use Redis.
+
+Invalidation also bumps a per-group generation counter, and every entry is
+stored with the generation that was current before it was loaded. A read
+that started before a write committed may finish and store its result after
+the write invalidated the group; that entry carries the old generation and
+is never served.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from . import crud, replicas
+
+DEFAULT_TTL = int(os.getenv("CACHE_TTL", "300"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Generation counters live outside the LRU: losing one would let
+        # entries tagged with an old generation match again
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._counters:
+                    found[key] = self._counters[key]
+                    continue
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                expires_at, value = entry
+                if expires_at <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, items, ttl):
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    name = "redis"
+
+    def __init__(self, client, prefix="splitwise:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_URL points at Redis but the redis package is not installed")
+        return cls(redis.Redis.from_url(url))
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        values = self.client.mget([self.prefix + key for key in keys])
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, items, ttl):
+        for key, value in items.items():
+            self.client.set(self.prefix + key, json.dumps(value), ex=ttl)
+
+    def delete(self, keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def incr(self, key):
+        # INCR leaves the key without an expiry, and its value reads back as JSON
+        self.client.incr(self.prefix + key)
+
+    def size(self):
+        return None
+
+
+class Cache:
+    def __init__(self, backend, ttl=DEFAULT_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        # Off: every read misses and nothing is stored (benchmarks, plan checks)
+        self.enabled = True
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    def get_many(self, kind, keys):
+        found = self.backend.get_many(keys) if self.enabled else {}
+        self.hits[kind] += len(found)
+        self.misses[kind] += len(keys) - len(found)
+        return found
+
+    def set_many(self, items, ttl=None):
+        if items and self.enabled:
+            self.backend.set_many(items, self.ttl if ttl is None else min(ttl, self.ttl))
+
+    def get_current(self, kind, keys):
+        """Entries of the groups' current generations, and those generations.
+
+        `keys` is {group_id: key}; returns ({group_id: value}, {group_id: generation})
+        from one backend read. Pass the generations to set_current.
+        """
+        generation_keys = {group_id: generation_key(group_id) for group_id in keys}
+        if not self.enabled:
+            self.misses[kind] += len(keys)
+            return {}, {group_id: 0 for group_id in keys}
+        found = self.backend.get_many(list(keys.values()) + list(generation_keys.values()))
+        generations = {group_id: found.get(generation_keys[group_id], 0) for group_id in keys}
+        values = {}
+        for group_id, key in keys.items():
+            entry = found.get(key)
+            # Anything not in [generation, value] form predates generations
+            if isinstance(entry, list) and len(entry) == 2 and entry[0] == generations[group_id]:
+                values[group_id] = entry[1]
+        self.hits[kind] += len(values)
+        self.misses[kind] += len(keys) - len(values)
+        return values, generations
+
+    def set_current(self, items, generations, ttl=None):
+        """Store {group_id: (key, value)} tagged with the generations get_current returned."""
+        self.set_many({key: [generations[group_id], value] for group_id, (key, value) in items.items()}, ttl)
+
+    def invalidate_group(self, group_id):
+        # The new generation disowns anything a read in flight stores later;
+        # rendered fragments are keyed by version, so they simply stop being used
+        self.backend.incr(generation_key(group_id))
+        self.backend.delete([members_key(group_id), balances_key(group_id), version_key(group_id)])
+
+    def get(self, kind, key):
+        return self.get_many(kind, [key]).get(key)
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def stats(self):
+        kinds = sorted(set(self.hits) | set(self.misses))
+        total_hits = sum(self.hits.values())
+        total = total_hits + sum(self.misses.values())
+        return {
+            "backend": self.backend.name,
+            "entries": self.backend.size(),
+            "hits": total_hits,
+            "misses": total - total_hits,
+            "hit_ratio": total_hits / total if total else None,
+            "by_kind": {kind: {"hits": self.hits[kind], "misses": self.misses[kind]} for kind in kinds},
+        }
+
+
+def build_cache(url=None):
+    url = url or os.getenv("CACHE_URL", "memory://")
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return Cache(RedisBackend.from_url(url))
+    return Cache(MemoryBackend())
+
+
+def members_key(group_id):
+    return f"group:{group_id}:members"
+
+
+def balances_key(group_id):
+    return f"group:{group_id}:balances"
+
+
+def version_key(group_id):
+    return f"group:{group_id}:version"
+
+
+def generation_key(group_id):
+    return f"group:{group_id}:generation"
+
+
+cache = build_cache()
+
+
+def load_members(db, group_ids):
+    members = crud.get_memberships_for_groups(db, group_ids)
+    return {
+        group_id: [{"id": user.id, "name": user.name} for user in users]
+        for group_id, users in members.items()
+    }
+
+
+def load_balances(db, group_ids):
+    # JSON has no int keys or tuples, so store plain lists
+    return {
+        group_id: {
+            "net": [[user_id, net] for user_id, net in summary["net"].items()],
+            "pairs": [list(pair) for pair in summary["pairs"]],
+        }
+        for group_id, summary in crud.group_balance_summaries(db, group_ids).items()
+    }
+
+
+async def _read_through(db, kind, key_for, loader, group_ids):
+    keys = {group_id: key_for(group_id) for group_id in group_ids}
+    # Generations are read before loading, so a write that commits while
+    # this loads leaves what it stores unused
+    result, generations = cache.get_current(kind, keys)
+
+    missing = [group_id for group_id in group_ids if group_id not in result]
+    if missing:
+        loaded = await db.run_sync(loader, missing)
+        # What a replica returned may be as old as its allowed lag; keep it no longer than that
+        ttl = replicas.MAX_LAG_SECONDS if replicas.REPLICA in db.sync_session.info else None
+        cache.set_current({group_id: (keys[group_id], value) for group_id, value in loaded.items()}, generations, ttl)
+        result.update(loaded)
+    return result
+
+
+def load_versions(db, group_ids):
+    return crud.get_group_versions(db, group_ids)
+
+
+async def group_versions(db, group_ids):
+    """{group_id: version}; groups that do not exist are left out."""
+    return await _read_through(db, "versions", version_key, load_versions, group_ids)
+
+
+async def group_members(db, group_ids):
+    """{group_id: [{"id", "name"}, ...]} in membership order."""
+    return await _read_through(db, "members", members_key, load_members, group_ids)
+
+
+async def group_balances(db, group_ids):
+    """{group_id: {"net": {user_id: net}, "pairs": [(debtor, creditor, amount), ...]}}."""
+    summaries = await _read_through(db, "balances", balances_key, load_balances, group_ids)
+    return {
+        group_id: {
+            "net": {user_id: net for user_id, net in summary["net"]},
+            "pairs": [tuple(pair) for pair in summary["pairs"]],
+        }
+        for group_id, summary in summaries.items()
+    }
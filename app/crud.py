@@ -0,0 +1,652 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, cast, func, select, tuple_, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from . import models, money, pagination
+
+
+# Journal event kinds (see models.LedgerEvent)
+EXPENSE_EVENT = "expense"
+MEMBER_REMOVED_EVENT = "member_removed"
+OPENING_EVENT = "opening"
+
+SETTLEMENT = "settlement"
+
+# Session.info key for the per-transaction change notes (see lock_group)
+GROUP_CHANGES = "group_changes"
+
+
+def naive_utc(moment):
+    """`moment` as naive UTC, the form every stored timestamp takes; naive values pass through."""
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _dialect_insert(db: Session):
+    # Both backends we run on support INSERT ... ON CONFLICT
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert
+    return postgresql.insert
+
+
+def lock_group(db: Session, group_id: int):
+    """Bump the group's version, holding its row lock until the transaction ends.
+
+    Every write to a group starts here, so writers to one group run one at
+    a time and each reads what the previous one committed. Returns the new
+    version, or None if the group does not exist or is being deleted.
+    From here until commit the transaction's changes to the group are
+    noted for app.broadcast.
+    """
+    statement = (
+        update(models.Group)
+        .where(models.Group.id == group_id, models.Group.deleted_at.is_(None))
+        .values(version=models.Group.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        version = db.execute(statement.returning(models.Group.version)).scalar()
+    elif db.execute(statement).rowcount == 1:
+        version = db.query(models.Group.version).filter(models.Group.id == group_id).scalar()
+    else:
+        version = None
+    if version is not None:
+        db.info.setdefault(GROUP_CHANGES, {})[group_id] = {
+            "version": version, "deltas": defaultdict(int), "members": False, "deleted": False,
+        }
+    return version
+
+
+def note_change(db: Session, group_id: int, deltas=None, members=False, deleted=False):
+    """Record what this transaction changed in a group it holds the lock on."""
+    change = db.info.get(GROUP_CHANGES, {}).get(group_id)
+    if change is None:
+        return
+    for user_id, delta in (deltas or {}).items():
+        change["deltas"][user_id] += delta
+    change["members"] = change["members"] or members
+    change["deleted"] = change["deleted"] or deleted
+
+
+def take_changes(db: Session):
+    """{group_id: change} noted since the last call, clearing them."""
+    return db.info.pop(GROUP_CHANGES, {})
+
+
+def get_group_versions(db: Session, group_ids):
+    """{group_id: version} for the groups that exist."""
+    if not group_ids:
+        return {}
+    rows = db.query(models.Group.id, models.Group.version).filter(models.Group.id.in_(group_ids)).all()
+    return dict(rows)
+
+
+def net_deltas(entries):
+    """Turn (debtor, creditor, cents) entries into per-user net changes."""
+    deltas = defaultdict(int)
+    for debtor, creditor, amount in entries:
+        deltas[creditor] += amount
+        deltas[debtor] -= amount
+    return deltas
+
+
+def apply_net_deltas(db: Session, group_id: int, deltas):
+    # Upsert so concurrent writers never lose an increment
+    rows = [
+        {"group_id": group_id, "user_id": user_id, "net": delta}
+        for user_id, delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+    insert = _dialect_insert(db)
+    stmt = insert(models.NetBalance.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["group_id", "user_id"],
+        set_={"net": models.NetBalance.__table__.c.net + stmt.excluded.net},
+    )
+    db.execute(stmt, rows)
+    apply_user_deltas(db, nets=deltas)
+    note_change(db, group_id, deltas=deltas)
+
+
+def apply_user_deltas(db: Session, nets=None, groups=None):
+    """Fold {user_id: cents} net and {user_id: count} membership changes into user_summaries."""
+    nets = nets or {}
+    groups = groups or {}
+    # Sorted so writers to different groups lock shared members' rows in one order
+    rows = [
+        {"user_id": user_id, "net": nets.get(user_id, 0), "group_count": groups.get(user_id, 0)}
+        for user_id in sorted(set(nets) | set(groups))
+        if nets.get(user_id) or groups.get(user_id)
+    ]
+    if not rows:
+        return
+    summaries = models.UserSummary.__table__
+    insert = _dialect_insert(db)
+    stmt = insert(summaries)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={
+            "net": summaries.c.net + stmt.excluded.net,
+            "group_count": summaries.c.group_count + stmt.excluded.group_count,
+        },
+    )
+    db.execute(stmt, rows)
+
+
+def add_balances(db: Session, group_id: int, entries):
+    """Fold (debtor, creditor, cents) entries into the pairwise ledger and net_balances."""
+    pairs = defaultdict(int)
+    for debtor, creditor, amount in entries:
+        # A self-debt nets to zero and never needs a row
+        if debtor != creditor and amount:
+            pairs[(debtor, creditor)] += amount
+
+    if pairs:
+        balances = models.Balance.__table__
+        insert = _dialect_insert(db)
+        stmt = insert(balances)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["group_id", "user_id", "owe_to"],
+            set_={"amount": balances.c.amount + stmt.excluded.amount},
+        )
+        db.execute(stmt, [
+            {"group_id": group_id, "user_id": debtor, "owe_to": creditor, "amount": amount}
+            for (debtor, creditor), amount in pairs.items()
+        ])
+
+    apply_net_deltas(db, group_id, net_deltas(
+        (debtor, creditor, amount) for (debtor, creditor), amount in pairs.items()
+    ))
+
+
+def get_group_members(db: Session, group_id: int):
+    # Membership order, so clients can send per-member values (e.g. percentages) positionally
+    return db.query(models.User).join(models.GroupMembership).filter(
+        models.GroupMembership.group_id == group_id
+    ).order_by(models.GroupMembership.id).all()
+
+
+def upsert_users(db: Session, users):
+    """{email: user_id} for (name, email) pairs, creating whichever users do not exist yet.
+
+    One SELECT for the emails already registered and one multi-row INSERT
+    ... ON CONFLICT (email) DO NOTHING for the rest; the caller commits. The
+    first name given for an email wins, and existing users keep theirs.
+    """
+    names = {}
+    for name, email in users:
+        names.setdefault(email, name)
+    if not names:
+        return {}
+
+    users_table = models.User.__table__
+    ids = dict(db.execute(
+        select(users_table.c.email, users_table.c.id).where(users_table.c.email.in_(list(names)))
+    ).all())
+    missing = [{"name": name, "email": email} for email, name in names.items() if email not in ids]
+    if not missing:
+        return ids
+
+    insert = _dialect_insert(db)
+    stmt = insert(users_table).values(missing).on_conflict_do_nothing(index_elements=["email"])
+    if db.get_bind().dialect.name == "postgresql":
+        ids.update(db.execute(stmt.returning(users_table.c.email, users_table.c.id)).all())
+    else:
+        db.execute(stmt)
+
+    # SQLite cannot return the new ids, and on either backend a concurrent
+    # request may have registered some of the emails first
+    unresolved = [row["email"] for row in missing if row["email"] not in ids]
+    if unresolved:
+        ids.update(db.execute(
+            select(users_table.c.email, users_table.c.id).where(users_table.c.email.in_(unresolved))
+        ).all())
+    return ids
+
+
+def add_members(db: Session, group_id: int, user_ids):
+    """Add users to a group in one INSERT, skipping existing members; returns how many joined."""
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return 0
+    memberships = models.GroupMembership.__table__
+    insert = _dialect_insert(db)
+    stmt = insert(memberships).values([
+        {"group_id": group_id, "user_id": user_id} for user_id in user_ids
+    ]).on_conflict_do_nothing(index_elements=["group_id", "user_id"])
+    if db.get_bind().dialect.name == "postgresql":
+        joined = [user_id for user_id, in db.execute(stmt.returning(memberships.c.user_id))]
+    else:
+        # SQLite cannot return the inserted rows; the group's write lock keeps
+        # its membership from changing between the two statements
+        existing = {user_id for user_id, in db.execute(
+            select(memberships.c.user_id).where(
+                memberships.c.group_id == group_id, memberships.c.user_id.in_(user_ids)
+            )
+        )}
+        db.execute(stmt)
+        joined = [user_id for user_id in user_ids if user_id not in existing]
+    apply_user_deltas(db, groups={user_id: 1 for user_id in joined})
+    note_change(db, group_id, members=bool(joined))
+    return len(joined)
+
+
+def add_member(db: Session, group_id: int, name: str, email: str):
+    """Register the user if the email is new and add them to the group; returns whether they joined."""
+    user_ids = upsert_users(db, [(name, email)])
+    return add_members(db, group_id, [user_ids[email]]) == 1
+
+
+def create_group(db: Session, name: str, users):
+    """Create a group with the (name, email) users as members, in membership order; the caller commits."""
+    group = models.Group(name=name)
+    db.add(group)
+    db.flush()
+    ids = upsert_users(db, users)
+    add_members(db, group.id, [ids[email] for _, email in users])
+    return group.id
+
+
+def split_shares(member_ids, amount, split_type, percentages=None):
+    """(user_id, cents) share of every member for an expense of `amount` cents.
+
+    Shares are allocated by largest remainder, so they always add up to the
+    expense exactly. Members whose share is zero are left out.
+    """
+    if split_type == "equal":
+        if not member_ids:
+            raise ValueError("Group has no members")
+        shares = money.allocate(amount, [1] * len(member_ids))
+    
+    elif split_type == "percent":
+        if not percentages:
+            raise ValueError("Percentages required for percent split")
+        if len(percentages) > len(member_ids):
+            raise ValueError("More percentages than group members")
+        
+        units = money.percent_units(percentages)
+        
+        # Validate total is 100% (to within 0.01%, as the form sends two decimals)
+        total_units = sum(units)
+        if abs(total_units - 100 * money.PERCENT_SCALE) > money.PERCENT_SCALE // 100:
+            raise ValueError(f"Percentages must sum to 100% (got {total_units / money.PERCENT_SCALE}%)")
+        
+        shares = money.allocate(amount, units)
+    
+    else:
+        raise ValueError("split_type must be 'equal' or 'percent'")
+
+    return [(user_id, share) for user_id, share in zip(member_ids, shares) if share]
+
+
+def split_entries(shares, added_by):
+    """(debtor, creditor, cents) entries for shares of an expense paid by `added_by`."""
+    # The payer's own share is money they spent on themselves: no debt
+    return [(user_id, added_by, share) for user_id, share in shares if user_id != added_by]
+
+
+def _insert_with_ids(db: Session, table, rows):
+    """Insert `rows` with one executemany and return their new ids in order."""
+    if db.get_bind().dialect.name == "postgresql":
+        ids = [row[0] for row in db.execute(
+            select(func.nextval(func.pg_get_serial_sequence(table.name, "id")))
+            .select_from(func.generate_series(1, len(rows)))
+        )]
+        db.execute(table.insert(), [dict(row, id=row_id) for row, row_id in zip(rows, ids)])
+        return ids
+
+    # SQLite has no sequences, but the first insert takes the database write
+    # lock, so the ids right after it stay free until this transaction ends
+    first = db.execute(table.insert(), rows[0]).inserted_primary_key[0]
+    ids = list(range(first, first + len(rows)))
+    if len(rows) > 1:
+        db.execute(table.insert(), [dict(row, id=row_id) for row, row_id in zip(rows[1:], ids[1:])])
+    return ids
+
+
+def record_expenses(db: Session, group_id: int, expenses):
+    """Append expenses to the journal and apply them to the balance projection.
+
+    Each item is a dict of the Expense columns plus `shares`, the (user_id,
+    cents) list from split_shares. Writes the expense rows, their split lines
+    and one `expense` event each in three executemany statements; the caller
+    commits. Returns the new expense ids.
+    """
+    if not expenses:
+        return []
+    now = datetime.utcnow()
+    dates = [naive_utc(expense.get("created_at")) or now for expense in expenses]
+    expense_ids = _insert_with_ids(db, models.Expense.__table__, [
+        {
+            "group_id": group_id,
+            "added_by": expense["added_by"],
+            "amount": expense["amount"],
+            "description": expense["description"],
+            "split_type": expense["split_type"],
+            "created_at": created_at,
+        }
+        for expense, created_at in zip(expenses, dates)
+    ])
+
+    splits = []
+    events = []
+    entries = []
+    for expense_id, expense in zip(expense_ids, expenses):
+        splits.extend(
+            {"expense_id": expense_id, "user_id": user_id, "amount": share}
+            for user_id, share in expense["shares"]
+        )
+        events.append({"group_id": group_id, "kind": EXPENSE_EVENT, "expense_id": expense_id, "created_at": now})
+        entries.extend(split_entries(expense["shares"], expense["added_by"]))
+
+    if splits:
+        db.execute(models.ExpenseSplit.__table__.insert(), splits)
+    db.execute(models.LedgerEvent.__table__.insert(), events)
+    add_balances(db, group_id, entries)
+    invalidate_snapshots(db, group_id, min(dates))
+    return expense_ids
+
+
+def invalidate_snapshots(db: Session, group_id: int, since: datetime):
+    """Drop the group's balance snapshots that an item dated `since` would change."""
+    since = naive_utc(since)
+    # Snapshots are only taken at month starts that have passed, so anything
+    # dated this month or later cannot touch one
+    if since >= datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0):
+        return
+    stale = select(models.BalanceSnapshot.id).where(
+        models.BalanceSnapshot.group_id == group_id,
+        models.BalanceSnapshot.taken_at > since
+    )
+    db.query(models.BalanceSnapshotLine).filter(
+        models.BalanceSnapshotLine.snapshot_id.in_(stale)
+    ).delete(synchronize_session=False)
+    db.query(models.BalanceSnapshot).filter(
+        models.BalanceSnapshot.group_id == group_id,
+        models.BalanceSnapshot.taken_at > since
+    ).delete(synchronize_session=False)
+
+
+def create_expense(db: Session, group_id: int, added_by: int, amount, description, split_type,
+                   percentages=None, created_at=None, member_ids=None):
+    """Split an expense of `amount` cents across the group's members and record it.
+
+    The caller commits. `member_ids` may be passed in membership order to skip
+    the member query. Returns the new expense id.
+    """
+    money.check_amount(amount)
+    if member_ids is None:
+        member_ids = [user.id for user in get_group_members(db, group_id)]
+    if added_by not in member_ids:
+        raise ValueError("The payer must be a member of the group")
+    shares = split_shares(member_ids, amount, split_type, percentages)
+    
+    return record_expenses(db, group_id, [{
+        "added_by": added_by,
+        "amount": amount,
+        "description": description,
+        "split_type": split_type,
+        "created_at": created_at,
+        "shares": shares,
+    }])[0]
+
+
+def create_settlement(db: Session, group_id: int, from_user: int, to_user: int, amount, created_at=None):
+    """Record `from_user` paying `to_user` back `amount` cents; the caller commits.
+
+    A settlement is an expense paid by from_user whose whole share belongs to
+    to_user, which cancels that much of from_user's debt.
+    """
+    if from_user == to_user:
+        raise ValueError("A settlement needs two different members")
+    money.check_amount(amount)
+    members = db.query(models.GroupMembership.user_id).filter(
+        models.GroupMembership.group_id == group_id,
+        models.GroupMembership.user_id.in_([from_user, to_user])
+    ).count()
+    if members != 2:
+        raise ValueError("Both users must be members of the group")
+    return record_expenses(db, group_id, [{
+        "added_by": from_user,
+        "amount": amount,
+        "description": "Settlement",
+        "split_type": SETTLEMENT,
+        "created_at": created_at,
+        "shares": [(to_user, amount)],
+    }])[0]
+
+
+def remove_member(db: Session, group_id: int, user_id: int):
+    """Journal a member leaving and drop their balances; the caller commits."""
+    db.execute(models.LedgerEvent.__table__.insert(), {
+        "group_id": group_id, "kind": MEMBER_REMOVED_EVENT, "user_id": user_id, "created_at": datetime.utcnow(),
+    })
+    remove_member_balances(db, group_id, user_id)
+    left = db.query(models.GroupMembership).filter(
+        models.GroupMembership.group_id == group_id,
+        models.GroupMembership.user_id == user_id
+    ).delete(synchronize_session=False)
+    if left:
+        apply_user_deltas(db, groups={user_id: -1})
+    note_change(db, group_id, members=left > 0)
+
+
+def remove_member_balances(db: Session, group_id: int, user_id: int):
+    # Reverse the effect of every balance row involving the user before deleting them
+    involved = db.query(
+        models.Balance.user_id, models.Balance.owe_to, models.Balance.amount
+    ).filter(
+        models.Balance.group_id == group_id,
+        (models.Balance.user_id == user_id) | (models.Balance.owe_to == user_id)
+    ).all()
+
+    deltas = net_deltas(involved)
+    apply_net_deltas(db, group_id, {uid: -delta for uid, delta in deltas.items()})
+
+    db.query(models.Balance).filter(
+        models.Balance.group_id == group_id,
+        (models.Balance.user_id == user_id) | (models.Balance.owe_to == user_id)
+    ).delete(synchronize_session=False)
+    db.query(models.NetBalance).filter(
+        models.NetBalance.group_id == group_id,
+        models.NetBalance.user_id == user_id
+    ).delete(synchronize_session=False)
+
+
+def group_snapshot(db: Session, group_id: int):
+    """{"version", "net": {user_id: cents}} read consistently, or None for a missing or deleted group."""
+    group = models.Group.__table__
+    while True:
+        version = db.execute(
+            select(group.c.version).where(group.c.id == group_id, group.c.deleted_at.is_(None))
+        ).scalar()
+        if version is None:
+            return None
+        net = get_group_net_balances(db, group_id)
+        # A write committed between the two reads would make them disagree
+        if db.execute(select(group.c.version).where(group.c.id == group_id)).scalar() == version:
+            return {"version": version, "net": net}
+
+
+def get_group_net_balances(db: Session, group_id: int):
+    rows = db.query(models.NetBalance.user_id, models.NetBalance.net).filter(
+        models.NetBalance.group_id == group_id
+    ).all()
+    return {user_id: net for user_id, net in rows}
+
+
+def list_groups(db: Session, after=None, limit=None):
+    """One page of groups in id order, plus the `after` value for the next page."""
+    limit = pagination.page_size(limit)
+    query = db.query(models.Group).filter(models.Group.deleted_at.is_(None))
+    if after is not None:
+        query = query.filter(models.Group.id > after)
+    groups = query.order_by(models.Group.id).limit(limit + 1).all()
+
+    next_after = groups[limit - 1].id if len(groups) > limit else None
+    return groups[:limit], next_after
+
+
+def list_group_expenses(db: Session, group_id: int, cursor=None, limit=None):
+    """One page of a group's expenses, newest first, plus the next-page cursor."""
+    limit = pagination.page_size(limit)
+    query = db.query(models.Expense)\
+        .filter(models.Expense.group_id == group_id)\
+        .options(
+            joinedload(models.Expense.user),
+            selectinload(models.Expense.splits).joinedload(models.ExpenseSplit.user)
+        )
+    if cursor:
+        created_at, expense_id = pagination.decode_cursor(cursor)
+        query = query.filter(
+            tuple_(models.Expense.created_at, models.Expense.id) < tuple_(created_at, expense_id),
+            # Implied by the row comparison, but PostgreSQL only prunes
+            # expense partitions on a plain bound
+            models.Expense.created_at <= created_at
+        )
+    expenses = query\
+        .order_by(models.Expense.created_at.desc(), models.Expense.id.desc())\
+        .limit(limit + 1)\
+        .all()
+
+    next_cursor = None
+    if len(expenses) > limit:
+        last = expenses[limit - 1]
+        next_cursor = pagination.encode_cursor(last.created_at, last.id)
+    return expenses[:limit], next_cursor
+
+
+def get_pair_balances_for_groups(db: Session, group_ids):
+    """(group_id, debtor, creditor, amount) totals for many groups in one query."""
+    if not group_ids:
+        return []
+    return db.query(
+        models.Balance.group_id,
+        models.Balance.user_id,
+        models.Balance.owe_to,
+        # PostgreSQL widens SUM(bigint) to numeric; keep it an integer
+        cast(func.sum(models.Balance.amount), BigInteger)
+    ).filter(
+        models.Balance.group_id.in_(group_ids)
+    ).group_by(
+        models.Balance.group_id, models.Balance.user_id, models.Balance.owe_to
+    ).all()
+
+
+def get_memberships_for_groups(db: Session, group_ids):
+    """{group_id: [User, ...]} for many groups, users loaded in the same query."""
+    result = {group_id: [] for group_id in group_ids}
+    if not group_ids:
+        return result
+    memberships = db.query(models.GroupMembership).options(
+        joinedload(models.GroupMembership.user)
+    ).filter(
+        models.GroupMembership.group_id.in_(group_ids)
+    ).order_by(models.GroupMembership.id).all()
+    for membership in memberships:
+        result[membership.group_id].append(membership.user)
+    return result
+
+
+def aggregate_net_balances(db: Session, group_ids=None):
+    """(group_id, user_id, net) tuples summed from the `balances` rows in one statement.
+
+    Each pair row is one leg in favour of the creditor and one against the
+    debtor; UNION ALL + GROUP BY folds them in SQL, so no ORM objects are built.
+    `group_ids=None` covers every group.
+    """
+    balances = models.Balance.__table__
+    creditor_legs = select(balances.c.group_id, balances.c.owe_to.label("user_id"), balances.c.amount)
+    debtor_legs = select(balances.c.group_id, balances.c.user_id, (-balances.c.amount).label("amount"))
+    if group_ids is not None:
+        if not group_ids:
+            return []
+        creditor_legs = creditor_legs.where(balances.c.group_id.in_(group_ids))
+        debtor_legs = debtor_legs.where(balances.c.group_id.in_(group_ids))
+
+    legs = union_all(creditor_legs, debtor_legs).subquery()
+    return db.execute(
+        select(legs.c.group_id, legs.c.user_id, cast(func.sum(legs.c.amount), BigInteger))
+        .group_by(legs.c.group_id, legs.c.user_id)
+    ).all()
+
+
+def group_balance_summaries(db: Session, group_ids):
+    """{group_id: {"net": {user_id: cents}, "pairs": [(debtor, creditor, cents), ...]}}.
+
+    The service behind every balance view: two tuple queries however many
+    groups are asked for.
+    """
+    summaries = {group_id: {"net": {}, "pairs": []} for group_id in group_ids}
+    for group_id, user_id, net in aggregate_net_balances(db, group_ids):
+        if net:
+            summaries[group_id]["net"][user_id] = net
+    for group_id, debtor, creditor, amount in get_pair_balances_for_groups(db, group_ids):
+        summaries[group_id]["pairs"].append((debtor, creditor, amount))
+    return summaries
+
+
+def computed_net_balances(db: Session):
+    """Net balance per (group, user) derived from the raw `balances` rows."""
+    return {(group_id, user_id): net for group_id, user_id, net in aggregate_net_balances(db)}
+
+
+def leave_user_summaries(db: Session, group_id: int):
+    """Take a group out of its members' user_summaries, before its memberships go."""
+    rows = db.query(models.GroupMembership.user_id, models.NetBalance.net).outerjoin(
+        models.NetBalance,
+        (models.NetBalance.group_id == models.GroupMembership.group_id)
+        & (models.NetBalance.user_id == models.GroupMembership.user_id)
+    ).filter(models.GroupMembership.group_id == group_id).all()
+    apply_user_deltas(
+        db,
+        nets={user_id: -(net or 0) for user_id, net in rows},
+        groups={user_id: -1 for user_id, _ in rows},
+    )
+
+
+def get_user_summary(db: Session, user_id: int):
+    """(name, group_count, net, [(group_id, group name, net), ...]) for a user, or None if there is no such user.
+
+    Two index lookups: the user with their summary row, then their groups
+    through ix_group_memberships_user_group with each net balance by key.
+    """
+    user = db.query(models.User.name, models.UserSummary.group_count, models.UserSummary.net).outerjoin(
+        models.UserSummary, models.UserSummary.user_id == models.User.id
+    ).filter(models.User.id == user_id).first()
+    if user is None:
+        return None
+    groups = db.query(models.Group.id, models.Group.name, models.NetBalance.net).select_from(
+        models.GroupMembership
+    ).join(
+        models.Group, models.Group.id == models.GroupMembership.group_id
+    ).outerjoin(
+        models.NetBalance,
+        (models.NetBalance.group_id == models.GroupMembership.group_id)
+        & (models.NetBalance.user_id == models.GroupMembership.user_id)
+    ).filter(
+        models.GroupMembership.user_id == user_id, models.Group.deleted_at.is_(None)
+    ).order_by(models.GroupMembership.group_id).all()
+    name, group_count, net = user
+    return name, group_count or 0, net or 0, [(group_id, group_name, net or 0) for group_id, group_name, net in groups]
+
+
+def computed_user_summaries(db: Session):
+    """{user_id: (group_count, net)} derived from group_memberships and net_balances."""
+    memberships = models.GroupMembership.__table__
+    nets = models.NetBalance.__table__
+    rows = db.execute(
+        select(
+            memberships.c.user_id, func.count(), cast(func.coalesce(func.sum(nets.c.net), 0), BigInteger)
+        ).select_from(
+            memberships.outerjoin(
+                nets, (nets.c.group_id == memberships.c.group_id) & (nets.c.user_id == memberships.c.user_id)
+            )
+        ).group_by(memberships.c.user_id)
+    ).all()
+    return {user_id: (group_count, net) for user_id, group_count, net in rows}
@@ -1,7 +1,10 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
+import asyncio
 import os
 
 # Load the .env file
@@ -16,11 +19,123 @@ if DATABASE_URL is None:
 if DATABASE_URL.startswith('postgres://'):
     DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
 
-# Create the SQLAlchemy engine
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+IS_SQLITE = DATABASE_URL.startswith('sqlite')
+
+# Connection pool tuning, shared by the sync and async engines
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# asyncpg prepared statement cache per connection; set to 0 behind pgbouncer in transaction mode
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# How long GET /readyz waits for the database
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT_SECONDS", "2"))
+
+
+def pool_options():
+    # SQLite uses a non-queue pool that takes no sizing arguments
+    if IS_SQLITE:
+        return {"pool_pre_ping": True}
+    return {
+        "pool_pre_ping": True,
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+    }
+
+
+def async_database_url(url):
+    """Map the sync DATABASE_URL onto the matching asyncio driver."""
+    url = make_url(url)
+    if url.drivername.startswith('sqlite'):
+        return url.set(drivername='sqlite+aiosqlite')
+
+    query = dict(url.query)
+    # libpq's sslmode is spelled ssl for asyncpg
+    if 'sslmode' in query:
+        query['ssl'] = query.pop('sslmode')
+    query['prepared_statement_cache_size'] = str(STATEMENT_CACHE_SIZE)
+    return url.set(drivername='postgresql+asyncpg', query=query)
+
+
+# SQLite (used for local runs and query-plan checks) needs cross-thread access
+# because FastAPI runs sync routes and dependency cleanup on worker threads
+connect_args = {"check_same_thread": False} if IS_SQLITE else {}
+
+# Engines are created on first use rather than at import, so a parent process
+# that imports the app before forking workers (python -m app.serve) holds no
+# pools or sockets for the workers to inherit
+_engines = {}
+# Engines a forked child inherited; kept referenced so that garbage collection
+# never closes connections that still belong to the parent
+_inherited = []
+_engine_hooks = []
+
+
+def on_engine_created(hook):
+    """Call hook(sync engine) for every engine, now or when it is created."""
+    _engine_hooks.append(hook)
+    for created in _engines.values():
+        hook(getattr(created, "sync_engine", created))
+
+
+def get_engine():
+    if "sync" not in _engines:
+        _engines["sync"] = create_engine(DATABASE_URL, connect_args=connect_args, **pool_options())
+        for hook in _engine_hooks:
+            hook(_engines["sync"])
+    return _engines["sync"]
+
+
+def get_async_engine(url=None):
+    """Async engine used by the request handlers; `url` picks a read replica instead of DATABASE_URL."""
+    key = "async" if url is None else f"async:{url}"
+    if key not in _engines:
+        _engines[key] = create_async_engine(async_database_url(url or DATABASE_URL), **pool_options())
+        for hook in _engine_hooks:
+            hook(_engines[key].sync_engine)
+    return _engines[key]
+
+
+def _forget_engines():
+    _inherited.extend(_engines.values())
+    _engines.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_engines)
+
+
+def __getattr__(name):
+    # `from .database import engine` still works; it creates the engine then
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class LazySessionmaker(sessionmaker):
+    """A sessionmaker bound to whatever engine the factory returns when a session is made."""
+
+    def __init__(self, engine_factory, **kw):
+        super().__init__(**kw)
+        self.engine_factory = engine_factory
+
+    def __call__(self, **local_kw):
+        if "bind" not in local_kw:
+            local_kw["bind"] = self.engine_factory()
+        return super().__call__(**local_kw)
+
 
 # Create a SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = LazySessionmaker(get_engine, autocommit=False, autoflush=False)
+
+# Objects stay usable after commit; reloading them would need implicit IO
+AsyncSessionLocal = LazySessionmaker(
+    get_async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 # Create a Base class
 Base = declarative_base()
@@ -33,35 +148,14 @@ def get_db():
     finally:
         db.close()
 
-def add_expense_columns():
-    engine = create_engine(DATABASE_URL)
-    with engine.connect() as conn:
-        # Add description column if it doesn't exist
-        conn.execute("""
-        DO $$ 
-        BEGIN 
-            IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                          WHERE table_name='expenses' AND column_name='description') THEN
-                ALTER TABLE expenses ADD COLUMN description VARCHAR;
-                UPDATE expenses SET description = 'Expense' WHERE description IS NULL;
-            END IF;
-        END $$;
-        """)
-        
-        # Add created_at column if it doesn't exist
-        conn.execute("""
-        DO $$ 
-        BEGIN 
-            IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                          WHERE table_name='expenses' AND column_name='created_at') THEN
-                ALTER TABLE expenses ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
-                UPDATE expenses SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
-            END IF;
-        END $$;
-        """)
-        conn.commit()
-
-# Add this to your create_tables function
-def create_tables():
-    Base.metadata.create_all(bind=engine)
-    add_expense_columns()  # Add this line
\ No newline at end of file
+# Async dependency
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def ping(timeout=READY_TIMEOUT):
+    """Run SELECT 1 on the async engine; raises if the database does not answer within `timeout`."""
+    async def select_one():
+        async with get_async_engine().connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    await asyncio.wait_for(select_one(), timeout)
@@ -0,0 +1,32 @@
+"""Strong ETags and If-None-Match handling for pages driven by group versions."""
+import hashlib
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+
+# Clients may keep the page but must revalidate it on every view
+CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison is fine for GET revalidation
+    candidates = {tag.strip().replace("W/", "", 1) for tag in header.split(",")}
+    return etag in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def html(content: str, etag: str) -> HTMLResponse:
+    return HTMLResponse(content, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
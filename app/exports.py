@@ -0,0 +1,120 @@
+"""Streaming ledger exports.
+
+Rows come off a server-side cursor in fixed-size partitions and are encoded
+one partition at a time, so memory stays flat and the first bytes go out as
+soon as the first partition arrives. write_ledger does the same from a
+sync session for export jobs (see app.jobs), a query per partition so the
+job can commit its progress in between.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models, money
+
+PARTITION_SIZE = 1000
+
+COLUMNS = ("id", "created_at", "description", "amount", "split_type", "added_by", "added_by_name")
+
+
+def ledger_statement(group_id: int, start=None, end=None):
+    """Plain-column select of a group's expenses, oldest first."""
+    query = select(
+        models.Expense.id,
+        models.Expense.created_at,
+        models.Expense.description,
+        models.Expense.amount,
+        models.Expense.split_type,
+        models.Expense.added_by,
+        models.User.name
+    ).outerjoin(
+        models.User, models.User.id == models.Expense.added_by
+    ).where(models.Expense.group_id == group_id)
+
+    if start is not None:
+        query = query.where(models.Expense.created_at >= start)
+    if end is not None:
+        query = query.where(models.Expense.created_at < end)
+
+    return query.order_by(models.Expense.created_at, models.Expense.id)
+
+
+async def iter_ledger_partitions(db: AsyncSession, group_id: int, start=None, end=None):
+    """Yield lists of row tuples from a server-side cursor."""
+    result = await db.stream(ledger_statement(group_id, start, end))
+    async for partition in result.partitions(PARTITION_SIZE):
+        yield partition
+
+
+def csv_row(row):
+    return [row[0], row[1].isoformat() if row[1] else "", row[2], money.format_cents(row[3]), row[4], row[5], row[6]]
+
+
+def ndjson_lines(partition):
+    lines = []
+    for row in partition:
+        record = dict(zip(COLUMNS, row))
+        record["created_at"] = row[1].isoformat() if row[1] else None
+        # Integer cents / 100 is the closest double, which JSON prints as written
+        record["amount"] = row[3] / 100
+        lines.append(json.dumps(record))
+    return "\n".join(lines) + "\n"
+
+
+async def iter_csv(partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    async for partition in partitions:
+        writer.writerows(csv_row(row) for row in partition)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # No rows at all: still send the header
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def iter_ndjson(partitions):
+    async for partition in partitions:
+        yield ndjson_lines(partition)
+
+
+def write_ledger(db: Session, group_id: int, out, format="csv", start=None, end=None, on_partition=None):
+    """Write a group's ledger to the text file `out` from a sync session; returns the row count.
+
+    Partitions are keyset-paged on (created_at, id) and capped at the newest
+    expense id when the export starts, so `on_partition(rows so far)` may
+    commit between them and the file still holds just the expenses that
+    existed then.
+    """
+    newest = db.query(func.max(models.Expense.id)).filter(models.Expense.group_id == group_id).scalar() or 0
+    statement = ledger_statement(group_id, start, end).where(models.Expense.id <= newest).limit(PARTITION_SIZE)
+    writer = csv.writer(out)
+    if format == "csv":
+        writer.writerow(COLUMNS)
+    rows = 0
+    last = None
+    while True:
+        page = statement
+        if last is not None:
+            page = page.where(
+                tuple_(models.Expense.created_at, models.Expense.id) > tuple_(*last),
+                # Implied by the row comparison; lets PostgreSQL prune partitions
+                models.Expense.created_at >= last[0]
+            )
+        partition = db.execute(page).all()
+        if format == "csv":
+            writer.writerows(csv_row(row) for row in partition)
+        elif partition:
+            out.write(ndjson_lines(partition))
+        rows += len(partition)
+        if on_partition is not None:
+            on_partition(rows)
+        if len(partition) < PARTITION_SIZE:
+            return rows
+        last = (partition[-1].created_at, partition[-1].id)
@@ -0,0 +1,248 @@
+"""Per-request performance instrumentation.
+
+Every HTTP request gets a RequestStats that the SQLAlchemy cursor events and
+the Jinja template class add to. Once the request finishes, the middleware
+records:
+
+* total latency, DB time and template render time as histograms per route
+  template (``/group/{group_id}/ledger``, not the concrete URL)
+* statement counts per route
+* a ``Server-Timing`` header, so browser dev tools show the breakdown
+
+``GET /metrics`` serves everything in the Prometheus text format. Metrics
+live in process memory, so each worker reports its own series.
+
+Statements slower than SLOW_QUERY_MS (default 200, negative disables) are
+logged to the ``app.slow_queries`` logger whether or not they run inside a
+request.
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from jinja2 import Template
+from sqlalchemy import event
+from starlette.routing import Match
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+slow_query_log = logging.getLogger("app.slow_queries")
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_time", "render_time")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+
+_current = ContextVar("request_stats", default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += 1
+        series[2] += value
+
+    def exposition(self, label_names):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, count, total) in sorted(self._series.items()):
+            base = _labels(label_names, labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._series = defaultdict(float)
+
+    def inc(self, labels, value=1):
+        self._series[labels] += value
+
+    def exposition(self, label_names):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._series.items()):
+            suffix = f"{{{_labels(label_names, labels)}}}" if labels else ""
+            lines.append(f"{self.name}{suffix} {value}")
+        return lines
+
+
+def _labels(names, values):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+class Registry:
+    ROUTE_LABELS = ("method", "route")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter("http_requests_total", "HTTP requests by route and status code.")
+        self.latency = Histogram(
+            "http_request_duration_seconds", "Total request latency per route.", LATENCY_BUCKETS
+        )
+        self.db_time = Histogram(
+            "http_request_db_seconds", "Time spent executing SQL per request.", LATENCY_BUCKETS
+        )
+        self.render_time = Histogram(
+            "http_request_render_seconds", "Time spent rendering Jinja templates per request.", LATENCY_BUCKETS
+        )
+        self.statements = Histogram(
+            "http_request_db_statements", "SQL statements issued per request.", STATEMENT_BUCKETS
+        )
+        self.slow_queries = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS.")
+        self.write_retries = Counter("db_write_retries_total", "Group write transactions retried after a conflict.")
+        self.reads = Counter("db_read_sessions_total", "Sessions of read-only routes by the database they read from.")
+
+    def record(self, method, route, status, elapsed, stats):
+        labels = (method, route)
+        with self._lock:
+            self.requests.inc((method, route, str(status)))
+            self.latency.observe(labels, elapsed)
+            self.db_time.observe(labels, stats.db_time)
+            self.render_time.observe(labels, stats.render_time)
+            self.statements.observe(labels, stats.statements)
+
+    def record_slow_query(self):
+        with self._lock:
+            self.slow_queries.inc(())
+
+    def record_write_retry(self):
+        with self._lock:
+            self.write_retries.inc(())
+
+    def record_read(self, target):
+        with self._lock:
+            self.reads.inc((target,))
+
+    def exposition(self):
+        with self._lock:
+            lines = self.requests.exposition(("method", "route", "status"))
+            for histogram in (self.latency, self.db_time, self.render_time, self.statements):
+                lines += histogram.exposition(self.ROUTE_LABELS)
+            lines += self.slow_queries.exposition(())
+            lines += self.write_retries.exposition(())
+            lines += self.reads.exposition(("target",))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_time += elapsed
+    if 0 <= SLOW_QUERY_MS <= elapsed * 1000:
+        registry.record_slow_query()
+        slow_query_log.warning("slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split()))
+
+
+def instrument_engine(engine):
+    """Count and time every statement run on a sync Engine (use async_engine.sync_engine for async)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class TimedTemplate(Template):
+    """Jinja template class that adds its render time to the current request."""
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.render_time += time.perf_counter() - start
+
+
+def route_template(app, scope):
+    # Label by the route's path template so the number of series stays bounded
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
+
+
+def server_timing(stats, elapsed):
+    return (
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} queries", '
+        f"render;dur={stats.render_time * 1000:.1f}, "
+        f"total;dur={elapsed * 1000:.1f}"
+    )
+
+
+class InstrumentationMiddleware:
+    """ASGI middleware that times each request and adds a Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # Streaming bodies are still being produced here, so their
+                # header only covers the work done before the first byte
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(stats, time.perf_counter() - start).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            registry.record(scope["method"], route_template(scope["app"], scope), status, elapsed, stats)
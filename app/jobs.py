@@ -0,0 +1,408 @@
+"""Background jobs: a `jobs` table polled by an in-process thread pool.
+
+Usage:
+    python -m app.jobs work [--workers 2]
+    python -m app.jobs enqueue KIND [--params '{"group_id": 1}']
+
+Requests that would hold locks or run for minutes (deleting a group with
+years of history, rebuilding the balance projection, exporting a large
+ledger) insert a `jobs` row and return its id; GET /api/jobs/{id} reports
+status, progress and result.
+
+Workers claim the oldest queued job with SELECT ... FOR UPDATE SKIP LOCKED,
+so any number of threads and processes can poll the same table without
+handing a job out twice (SQLite ignores the lock clause; the conditional
+UPDATE that marks the job running settles races there). A claim takes a
+lease of JOB_LEASE_SECONDS that the job extends whenever it reports
+progress; a running job whose lease has passed belonged to a worker that
+died and is claimed again, up to MAX_ATTEMPTS times. Handlers are written
+to be safe to rerun.
+
+JOB_WORKERS threads run in every web process (0 turns them off, e.g. when
+`python -m app.jobs work` runs separately). JOB_CONCURRENCY caps how many
+jobs of a kind one process runs at once, as `kind=limit` pairs.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+
+from . import models, archive, crud, exports, journal, writes
+from .database import SessionLocal
+
+WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+CONCURRENCY = os.getenv("JOB_CONCURRENCY", "delete_group=1,rebuild_balances=1,export_ledger=2")
+POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "expense-exports"))
+
+MAX_ATTEMPTS = 3
+# Rows deleted per transaction when removing a group
+DELETE_CHUNK_SIZE = 5000
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+
+def parse_limits(value):
+    """{kind: limit} from "kind=limit,kind=limit"."""
+    limits = {}
+    for item in value.split(","):
+        if item.strip():
+            kind, _, limit = item.partition("=")
+            limits[kind.strip()] = int(limit)
+    return limits
+
+
+def enqueue(db, kind, params=None):
+    """Add a job; the caller commits. Returns the new job."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = models.Job(kind=kind, status=QUEUED, params=params or {}, attempts=0)
+    db.add(job)
+    db.flush()
+    return job
+
+
+def queue_group_deletion(db, group_id):
+    """Hide a group at once and queue the job that removes its rows; the caller commits.
+
+    Takes the group's write lock (see app.writes), so writes already in
+    flight finish first and later ones find the group gone. Returns the
+    deletion job, or None if the group does not exist. Asking twice returns
+    the job already queued.
+    """
+    if not crud.lock_group(db, group_id):
+        queued = db.query(models.Job).filter(
+            models.Job.kind == "delete_group", models.Job.status.in_([QUEUED, RUNNING])
+        ).order_by(models.Job.id).all()
+        return next((job for job in queued if job.params.get("group_id") == group_id), None)
+
+    db.query(models.Group).filter(models.Group.id == group_id).update(
+        {"deleted_at": datetime.utcnow()}, synchronize_session=False
+    )
+    # Memberships are few, so they go now and the group leaves every member's view
+    crud.leave_user_summaries(db, group_id)
+    db.query(models.GroupMembership).filter(
+        models.GroupMembership.group_id == group_id
+    ).delete(synchronize_session=False)
+    crud.note_change(db, group_id, deleted=True)
+    return enqueue(db, "delete_group", {"group_id": group_id})
+
+
+def pending(db, kind):
+    """The oldest queued or running job of a kind, if any."""
+    return db.query(models.Job).filter(
+        models.Job.kind == kind, models.Job.status.in_([QUEUED, RUNNING])
+    ).order_by(models.Job.id).first()
+
+
+def describe(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "params": job.params,
+        "progress": job.progress,
+        "result": job.result,
+        "error": job.error,
+        "attempts": job.attempts,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def report(db, job_id, **progress):
+    """Record progress and extend the lease; lands with the handler's next commit."""
+    db.execute(
+        update(models.Job)
+        .where(models.Job.id == job_id)
+        .values(progress=progress, lease_expires_at=datetime.utcnow() + timedelta(seconds=LEASE_SECONDS))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def claim(db, kinds):
+    """Mark the oldest claimable job of one of `kinds` running and return it, or None."""
+    if not kinds:
+        return None
+    jobs = models.Job.__table__
+    now = datetime.utcnow()
+    claimable = and_(
+        jobs.c.kind.in_(kinds),
+        or_(
+            jobs.c.status == QUEUED,
+            and_(jobs.c.status == RUNNING, jobs.c.lease_expires_at < now, jobs.c.attempts < MAX_ATTEMPTS)
+        )
+    )
+    row = db.execute(
+        select(jobs.c.id).where(claimable).order_by(jobs.c.id).limit(1).with_for_update(skip_locked=True)
+    ).first()
+    if row is None:
+        db.rollback()
+        return None
+
+    claimed = db.execute(
+        update(jobs).where(jobs.c.id == row.id, claimable).values(
+            status=RUNNING,
+            attempts=jobs.c.attempts + 1,
+            started_at=now,
+            lease_expires_at=now + timedelta(seconds=LEASE_SECONDS)
+        )
+    )
+    db.commit()
+    if claimed.rowcount == 0:
+        # Another worker got there first (SQLite has no row locks to skip)
+        return None
+    return db.get(models.Job, row.id)
+
+
+def fail_abandoned(db):
+    """Give up on jobs whose workers died MAX_ATTEMPTS times."""
+    db.execute(
+        update(models.Job)
+        .where(
+            models.Job.status == RUNNING,
+            models.Job.lease_expires_at < datetime.utcnow(),
+            models.Job.attempts >= MAX_ATTEMPTS
+        )
+        .values(status=FAILED, error="Lease expired too many times", finished_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def run(db, job):
+    """Run a claimed job to completion and record the outcome."""
+    job_id = job.id
+    try:
+        result = HANDLERS[job.kind](db, job_id, job.params)
+    except Exception as exc:
+        logger.exception("job %s (%s) failed", job_id, job.kind)
+        db.rollback()
+        db.execute(
+            update(models.Job).where(models.Job.id == job_id)
+            .values(status=FAILED, error=repr(exc), finished_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        db.execute(
+            update(models.Job).where(models.Job.id == job_id)
+            .values(status=DONE, result=result, finished_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+
+
+def _delete_chunks(db, job_id, step, table, condition):
+    """Delete rows matching `condition` DELETE_CHUNK_SIZE ids per transaction."""
+    deleted = 0
+    while True:
+        ids = [row[0] for row in db.execute(
+            select(table.c.id).where(condition).order_by(table.c.id).limit(DELETE_CHUNK_SIZE)
+        )]
+        if not ids:
+            return deleted
+        if table is models.Expense.__table__:
+            db.execute(models.ExpenseSplit.__table__.delete().where(models.ExpenseSplit.expense_id.in_(ids)))
+        db.execute(table.delete().where(table.c.id.in_(ids)))
+        deleted += len(ids)
+        report(db, job_id, step=step, deleted=deleted)
+        db.commit()
+
+
+def delete_group(db, job_id, params):
+    """Remove a group and everything that belongs to it, a chunk at a time."""
+    group_id = params["group_id"]
+    events = models.LedgerEvent.__table__
+    expenses = models.Expense.__table__
+    deleted = {
+        "ledger_events": _delete_chunks(db, job_id, "ledger_events", events, events.c.group_id == group_id),
+        "expenses": _delete_chunks(db, job_id, "expenses", expenses, expenses.c.group_id == group_id),
+    }
+
+    # The rest is bounded by the group's size rather than its history, and
+    # goes in one transaction with the group row
+    snapshot_ids = select(models.BalanceSnapshot.id).where(models.BalanceSnapshot.group_id == group_id)
+    db.query(models.BalanceSnapshotLine).filter(
+        models.BalanceSnapshotLine.snapshot_id.in_(snapshot_ids)
+    ).delete(synchronize_session=False)
+    expense_ids = select(models.Expense.id).where(models.Expense.group_id == group_id)
+    db.query(models.ExpenseSplit).filter(models.ExpenseSplit.expense_id.in_(expense_ids)).delete(synchronize_session=False)
+    # Archived history goes with the group (safe to repeat if the job reruns)
+    for path, in db.query(models.GroupArchive.path).filter(models.GroupArchive.group_id == group_id):
+        archive.remove_file(path)
+    for model in (models.LedgerEvent, models.Expense, models.BalanceSnapshot, models.Balance,
+                  models.NetBalance, models.GroupMembership, models.GroupArchive):
+        db.query(model).filter(model.group_id == group_id).delete(synchronize_session=False)
+    db.query(models.Group).filter(models.Group.id == group_id).delete(synchronize_session=False)
+    return deleted
+
+
+def rebuild_balances(db, job_id, params):
+    """Rebuild the balance projection one group at a time (see app.journal.rebuild_group).
+
+    Each group is refolded in its own write transaction under its lock, so
+    the site stays up: readers see the group's old balances until the new
+    ones commit, writes to it wait rather than interleave, and the commit
+    bumps its version and drops its cache entries. A rerun carries on after
+    the last group the previous attempt finished.
+    """
+    progress = db.get(models.Job, job_id).progress or {}
+    group_ids = [group_id for group_id, in db.query(models.Group.id).filter(
+        models.Group.id > progress.get("last_group_id", 0), models.Group.deleted_at.is_(None)
+    ).order_by(models.Group.id)]
+    # Release the read transaction before taking group locks
+    db.rollback()
+
+    rebuilt = progress.get("rebuilt", 0)
+    for position, group_id in enumerate(group_ids, 1):
+        try:
+            writes.write_group_sync(db, group_id, journal.rebuild_group, group_id)
+            rebuilt += 1
+        except writes.GroupNotFound:
+            pass
+        # Lands with the next group's commit, the last with the job's result
+        report(db, job_id, last_group_id=group_id, rebuilt=rebuilt, remaining=len(group_ids) - position)
+    return {"groups": rebuilt}
+
+
+def export_ledger(db, job_id, params):
+    """Write a group's ledger to EXPORT_DIR for GET /api/jobs/{id}/download."""
+    group_id = params["group_id"]
+    format = params.get("format", "csv")
+    if format not in ("csv", "ndjson"):
+        raise ValueError("format must be csv or ndjson")
+    start = datetime.fromisoformat(params["start"]) if params.get("start") else None
+    end = datetime.fromisoformat(params["end"]) if params.get("end") else None
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f"job-{job_id}-group-{group_id}-ledger.{format}")
+    def renew(rows):
+        # Keeps the lease while the file is written, so no other worker takes the job over
+        report(db, job_id, rows=rows)
+        db.commit()
+
+    # Written under a temporary name so a download never sees half a file
+    with open(path + ".part", "w", newline="") as out:
+        rows = exports.write_ledger(db, group_id, out, format, start, end, on_partition=renew)
+    os.replace(path + ".part", path)
+    return {"path": path, "rows": rows, "format": format}
+
+
+HANDLERS = {
+    "delete_group": delete_group,
+    "rebuild_balances": rebuild_balances,
+    "export_ledger": export_ledger,
+}
+
+
+class WorkerPool:
+    """Threads that claim and run jobs, at most limits[kind] of a kind at once."""
+
+    def __init__(self, workers=WORKERS, limits=None, poll_seconds=POLL_SECONDS):
+        self.workers = workers
+        self.limits = parse_limits(CONCURRENCY) if limits is None else limits
+        self.poll_seconds = poll_seconds
+        self.running = {kind: 0 for kind in HANDLERS}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        """Poll now rather than at the next interval, e.g. right after enqueueing."""
+        self._wake.set()
+
+    def _claim(self, db):
+        # Claims are serialized within the process so the limits hold exactly
+        with self._lock:
+            kinds = [kind for kind in HANDLERS if self.running[kind] < self.limits.get(kind, self.workers)]
+            job = claim(db, kinds)
+            if job is not None:
+                self.running[job.kind] += 1
+            return job
+
+    def _work(self):
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                job = self._claim(db)
+                if job is None:
+                    fail_abandoned(db)
+                else:
+                    try:
+                        run(db, job)
+                    finally:
+                        with self._lock:
+                            self.running[job.kind] -= 1
+            except Exception:
+                logger.exception("job worker error")
+                job = None
+            finally:
+                db.close()
+            if job is None:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+
+pool = WorkerPool()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    work_parser = commands.add_parser("work", help="run workers in the foreground until interrupted")
+    work_parser.add_argument("--workers", type=int, default=max(WORKERS, 1))
+    enqueue_parser = commands.add_parser("enqueue", help="queue a job")
+    enqueue_parser.add_argument("kind", choices=sorted(HANDLERS))
+    enqueue_parser.add_argument("--params", default="{}", help="JSON object")
+    args = parser.parse_args(argv)
+
+    if args.command == "enqueue":
+        db = SessionLocal()
+        try:
+            job = enqueue(db, args.kind, json.loads(args.params))
+            db.commit()
+            print(f"queued job {job.id}")
+        finally:
+            db.close()
+        return 0
+
+    logging.basicConfig(level=logging.INFO)
+    workers = WorkerPool(workers=args.workers)
+    workers.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        workers.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Replay the ledger journal into the balance projection.
+
+Usage:
+    python -m app.journal replay [--batch 100000] [--restart]
+    python -m app.journal status
+
+`balances` and `net_balances` are a projection of `ledger_events`: the write
+routes update them incrementally as they append events, and this command
+rebuilds them from scratch. Events are folded in id ranges of --batch, each
+range with one GROUP BY over the journal and committed together with the
+checkpoint, so an interrupted replay picks up where it stopped. Member
+removals depend on the balances at that point, so ranges are cut before each
+one and it is applied on its own.
+
+`user_summaries` is recomputed once the replay finishes, and every group's
+version is bumped and its cache entries dropped, so no ETag or cached page
+from before the replay is served again.
+
+Run it with writes paused: events committed while the projection is being
+cleared could be applied twice. On a live server, queue a rebuild_balances
+job instead (app.jobs): it refolds one group at a time with rebuild_group,
+each in a write transaction under the group's lock.
+"""
+import argparse
+import sys
+import time
+from collections import defaultdict
+
+from sqlalchemy import BigInteger, and_, cast, func, select
+
+from . import models, crud, reconcile
+from .cache import cache
+from .database import SessionLocal
+
+BATCH_SIZE = 100000
+
+CHECKPOINT = "balances"
+
+
+def get_checkpoint(db):
+    checkpoint = db.get(models.ProjectionCheckpoint, CHECKPOINT)
+    if checkpoint is None:
+        checkpoint = models.ProjectionCheckpoint(name=CHECKPOINT, last_event_id=0, target_event_id=0)
+        db.add(checkpoint)
+    return checkpoint
+
+
+def fold_range(db, low, high, group_id=None):
+    """{group_id: [(debtor, creditor, cents), ...]} summed over expense and opening events in (low, high]."""
+    events = models.LedgerEvent.__table__
+    expenses = models.Expense.__table__
+    splits = models.ExpenseSplit.__table__
+    in_range = and_(events.c.id > low, events.c.id <= high)
+    if group_id is not None:
+        in_range = and_(in_range, events.c.group_id == group_id)
+
+    expense_pairs = select(
+        events.c.group_id, splits.c.user_id, expenses.c.added_by, cast(func.sum(splits.c.amount), BigInteger)
+    ).select_from(
+        events.join(expenses, expenses.c.id == events.c.expense_id)
+        .join(splits, splits.c.expense_id == expenses.c.id)
+    ).where(
+        in_range, events.c.kind == crud.EXPENSE_EVENT, splits.c.user_id != expenses.c.added_by
+    ).group_by(events.c.group_id, splits.c.user_id, expenses.c.added_by)
+
+    opening_pairs = select(
+        events.c.group_id, events.c.user_id, events.c.counterparty_id, cast(func.sum(events.c.amount), BigInteger)
+    ).where(
+        in_range, events.c.kind == crud.OPENING_EVENT
+    ).group_by(events.c.group_id, events.c.user_id, events.c.counterparty_id)
+
+    entries = defaultdict(list)
+    for statement in (expense_pairs, opening_pairs):
+        for group_id, debtor, creditor, amount in db.execute(statement):
+            entries[group_id].append((debtor, creditor, amount))
+    return entries
+
+
+def next_removal(db, low, high):
+    events = models.LedgerEvent.__table__
+    return db.execute(
+        select(events.c.id, events.c.group_id, events.c.user_id)
+        .where(events.c.id > low, events.c.id <= high, events.c.kind == crud.MEMBER_REMOVED_EVENT)
+        .order_by(events.c.id)
+        .limit(1)
+    ).first()
+
+
+def apply_range(db, low, high, group_id=None):
+    for group_id, entries in fold_range(db, low, high, group_id).items():
+        crud.add_balances(db, group_id, entries)
+
+
+def rebuild_group(db, group_id):
+    """Refold one group's journal into its balances, in the caller's transaction.
+
+    Meant to run under the group's lock (app.writes), which makes it a
+    swap: readers keep seeing the old rows until the commit, and writes to
+    the group wait for it. The old nets are taken out of user_summaries and
+    the new ones folded in.
+    """
+    events = models.LedgerEvent.__table__
+    old = crud.get_group_net_balances(db, group_id)
+    crud.apply_user_deltas(db, nets={user_id: -net for user_id, net in old.items()})
+    crud.note_change(db, group_id, deltas={user_id: -net for user_id, net in old.items()})
+    for model in (models.Balance, models.NetBalance):
+        db.query(model).filter(model.group_id == group_id).delete(synchronize_session=False)
+
+    head = db.execute(select(func.max(events.c.id)).where(events.c.group_id == group_id)).scalar() or 0
+    removals = db.execute(
+        select(events.c.id, events.c.user_id)
+        .where(events.c.group_id == group_id, events.c.kind == crud.MEMBER_REMOVED_EVENT)
+        .order_by(events.c.id)
+    ).all()
+    low = 0
+    for removal_id, user_id in removals:
+        apply_range(db, low, removal_id - 1, group_id)
+        crud.remove_member_balances(db, group_id, user_id)
+        low = removal_id
+    apply_range(db, low, head, group_id)
+
+
+def replay(db, batch_size=BATCH_SIZE, restart=False, log=print):
+    """Rebuild the projection, resuming an unfinished replay unless `restart`."""
+    checkpoint = get_checkpoint(db)
+    if restart or checkpoint.last_event_id >= checkpoint.target_event_id:
+        db.query(models.Balance).delete(synchronize_session=False)
+        db.query(models.NetBalance).delete(synchronize_session=False)
+        checkpoint.last_event_id = 0
+        checkpoint.target_event_id = db.query(func.max(models.LedgerEvent.id)).scalar() or 0
+        db.commit()
+        log(f"replaying {checkpoint.target_event_id} event id(s) from the start")
+    else:
+        log(f"resuming at event {checkpoint.last_event_id} of {checkpoint.target_event_id}")
+
+    started = time.perf_counter()
+    low = checkpoint.last_event_id
+    target = checkpoint.target_event_id
+    while low < target:
+        high = min(low + batch_size, target)
+        removal = next_removal(db, low, high)
+        if removal is not None:
+            # Everything before the removal, then the removal by itself
+            apply_range(db, low, removal.id - 1)
+            crud.remove_member_balances(db, removal.group_id, removal.user_id)
+            high = removal.id
+        else:
+            apply_range(db, low, high)
+
+        checkpoint.last_event_id = high
+        db.commit()
+        low = high
+        elapsed = time.perf_counter() - started
+        log(f"applied through event {high} ({elapsed:.1f}s)")
+
+    # Groups awaiting deletion still have events but no members, so the
+    # summaries are recomputed from memberships rather than accumulated
+    reconcile.rebuild_summaries(db, crud.computed_user_summaries(db))
+    db.query(models.Group).update({models.Group.version: models.Group.version + 1}, synchronize_session=False)
+    db.commit()
+    for group_id, in db.query(models.Group.id):
+        cache.invalidate_group(group_id)
+    return checkpoint
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay_parser = commands.add_parser("replay", help="rebuild balances and net_balances from the journal")
+    replay_parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="event ids per transaction")
+    replay_parser.add_argument("--restart", action="store_true", help="start over even if a replay was interrupted")
+    commands.add_parser("status", help="show replay progress")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.command == "status":
+            checkpoint = get_checkpoint(db)
+            latest = db.query(func.max(models.LedgerEvent.id)).scalar() or 0
+            print(f"applied {checkpoint.last_event_id} of {checkpoint.target_event_id}; journal head {latest}")
+            return 0
+        replay(db, args.batch, args.restart)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
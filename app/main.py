@@ -1,18 +1,32 @@
 from fastapi import FastAPI, Depends, Request, Form, Body
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import FileResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import datetime
+from decimal import Decimal
 import json
-from . import models, database
-from .database import get_db
+import os
+from . import models, database, crud, settlement, bulk_import, exports, etags, money, pagination, instrumentation, snapshots, jobs, writes, broadcast, replicas
+from .cache import cache
+from . import cache as group_cache
+from .database import get_db, get_async_db
+from .replicas import get_read_db
 from pydantic import BaseModel
 from fastapi import HTTPException
 from sqlalchemy.orm import joinedload
 
 app = FastAPI()
+app.add_middleware(replicas.ReadYourWritesMiddleware)
+app.add_middleware(instrumentation.InstrumentationMiddleware)
 templates = Jinja2Templates(directory="app/templates")
+templates.env.filters["money"] = money.format_cents
+templates.env.template_class = instrumentation.TimedTemplate
+database.on_engine_created(instrumentation.instrument_engine)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 # Pydantic model for User input
@@ -25,66 +39,116 @@ class GroupCreate(BaseModel):
     name: str
     users: List[UserCreate]
 
+class SettlementCreate(BaseModel):
+    from_user: int
+    to_user: int
+    amount: Decimal
+
+class JobCreate(BaseModel):
+    kind: str
+    params: dict = {}
+
 # Add new Pydantic model for percentage splits (add this near other BaseModel classes)
 class PercentSplit(BaseModel):
     user_id: int
     percentage: float
 
+@app.on_event("startup")
+def start_job_workers():
+    if jobs.WORKERS:
+        jobs.pool.start()
+
+@app.on_event("startup")
+async def start_broadcast():
+    await broadcast.hub.start()
+
+@app.on_event("startup")
+async def start_replica_checks():
+    await replicas.router.start()
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    jobs.pool.stop()
+
+@app.on_event("shutdown")
+async def stop_broadcast():
+    await broadcast.hub.stop()
+
+@app.on_event("shutdown")
+async def stop_replica_checks():
+    await replicas.router.stop()
+
 @app.get("/")
-def home(request: Request, db: Session = Depends(get_db)):
-    # Get groups with their members and balances
-    groups = db.query(models.Group).all()
+async def home(
+    request: Request,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Get one page of groups with their members and balances
+    groups, next_after = await db.run_sync(crud.list_groups, after, limit)
+    group_ids = [group.id for group in groups]
+    
+    # The page only changes when one of its groups does
+    etag = etags.make_etag("home", after, limit, [(group.id, group.version) for group in groups], next_after)
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+    page_key = f"page:home:{etag}"
+    page = cache.get("pages", page_key)
+    if page is not None:
+        return etags.html(page, etag)
+    
+    # Cached per group; misses are loaded with a fixed number of set-based queries
+    members_by_group = await group_cache.group_members(db, group_ids)
+    balances_by_group = await group_cache.group_balances(db, group_ids)
+    
+    users_by_id = {user["id"]: user for members in members_by_group.values() for user in members}
+    missing_ids = {
+        user_id
+        for summary in balances_by_group.values()
+        for debtor, creditor, _ in summary["pairs"]
+        for user_id in (debtor, creditor)
+    } - set(users_by_id)
+    if missing_ids:
+        result = await db.execute(select(models.User.id, models.User.name).where(models.User.id.in_(missing_ids)))
+        for user_id, name in result.all():
+            users_by_id[user_id] = {"id": user_id, "name": name}
     
     # Create a dictionary to store balances for each group
     group_balances = {}
     
     for group in groups:
-        balances = db.query(models.Balance).filter(
-            models.Balance.group_id == group.id
-        ).all()
-        
-        # Get all users in the group
-        group_users = db.query(models.User).join(models.GroupMembership).filter(
-            models.GroupMembership.group_id == group.id
-        ).all()
+        net_balances = balances_by_group[group.id]["net"]
         
         # Create a balance summary for each user
         user_balances = {}
-        for user in group_users:
-            # Money user owes to others
-            owes = db.query(models.Balance).filter(
-                models.Balance.group_id == group.id,
-                models.Balance.user_id == user.id
-            ).all()
-            
-            # Money others owe to user
-            owed = db.query(models.Balance).filter(
-                models.Balance.group_id == group.id,
-                models.Balance.owe_to == user.id
-            ).all()
-            
-            total_owes = sum(balance.amount for balance in owes)
-            total_owed = sum(balance.amount for balance in owed)
-            net_balance = total_owed - total_owes
-            
-            # Add details for owes and owed_by
-            owes_details = [(db.query(models.User).filter(models.User.id == balance.owe_to).first(), balance.amount) for balance in owes]
-            owed_by_details = [(db.query(models.User).filter(models.User.id == balance.user_id).first(), balance.amount) for balance in owed]
-            
-            user_balances[user.id] = {
+        for user in members_by_group[group.id]:
+            user_balances[user["id"]] = {
                 "user": user,
-                "net_balance": net_balance,
-                "owes_details": owes_details,
-                "owed_by_details": owed_by_details
+                "net_balance": net_balances.get(user["id"], 0),
+                "owes_details": [],
+                "owed_by_details": []
             }
-            
+        
         group_balances[group.id] = user_balances
+    
+    # Add details for owes and owed_by
+    for group_id, summary in balances_by_group.items():
+        user_balances = group_balances[group_id]
+        for debtor, creditor, amount in summary["pairs"]:
+            if debtor in user_balances:
+                user_balances[debtor]["owes_details"].append((users_by_id[creditor], amount))
+            if creditor in user_balances:
+                user_balances[creditor]["owed_by_details"].append((users_by_id[debtor], amount))
 
-    return templates.TemplateResponse("index.html", {
+    page = templates.get_template("index.html").render({
         "request": request,
         "groups": groups,
-        "group_balances": group_balances
+        "group_balances": group_balances,
+        "next_after": next_after
     })
+    cache.set(page_key, page)
+    return etags.html(page, etag)
 
 @app.get("/create-group")
 def create_group_form(request: Request):
@@ -96,34 +160,16 @@ async def create_group_submit(
     group_name: str = Form(...),
     user_names: list = Form(...),
     user_emails: list = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Create group
-    new_group = models.Group(name=group_name)
-    db.add(new_group)
-    db.commit()
-    db.refresh(new_group)
-    
-    # Create users and add to group
-    for name, email in zip(user_names, user_emails):
-        existing_user = db.query(models.User).filter(models.User.email == email).first()
-        if not existing_user:
-            user = models.User(name=name, email=email)
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        else:
-            user = existing_user
-            
-        membership = models.GroupMembership(group_id=new_group.id, user_id=user.id)
-        db.add(membership)
-    
-    db.commit()
+    # Group, users and memberships in one transaction and a handful of statements
+    await db.run_sync(crud.create_group, group_name, list(zip(user_names, user_emails)))
+    await db.commit()
     return RedirectResponse(url="/", status_code=303)
 
 @app.get("/add-expense")
-def add_expense_form(request: Request, db: Session = Depends(get_db)):
-    groups = db.query(models.Group).all()
+async def add_expense_form(request: Request, db: AsyncSession = Depends(get_read_db)):
+    groups = (await db.execute(select(models.Group).where(models.Group.deleted_at.is_(None)))).scalars().all()
     return templates.TemplateResponse("add_expense.html", {
         "request": request,
         "groups": groups,
@@ -134,93 +180,83 @@ async def add_expense_submit(
     request: Request,
     group_id: int = Form(...),
     added_by: int = Form(...),
-    amount: float = Form(...),
+    amount: Decimal = Form(...),
     description: str = Form(...),
     split_type: str = Form(...),
     percentages: List[float] = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    users = db.query(models.User).join(models.GroupMembership).filter(
-        models.GroupMembership.group_id == group_id
-    ).all()
-
-    if split_type == "equal":
-        split_amount = amount / len(users)  # Correctly divide among all users
-        
-        for user in users:
-            if user.id != added_by:
-                balance = models.Balance(
-                    group_id=group_id,
-                    user_id=user.id,
-                    owe_to=added_by,
-                    amount=split_amount
-                )
-                db.add(balance)
-            else:
-                # Add a balance entry for the payer to reflect the amount they are owed
-                balance = models.Balance(
-                    group_id=group_id,
-                    user_id=added_by,
-                    owe_to=user.id,
-                    amount=-split_amount * (len(users) - 1)
-                )
-                db.add(balance)
-    
-    elif split_type == "percent":
-        if not percentages:
-            raise HTTPException(status_code=400, detail="Percentages required for percent split")
-            
-        # Convert percentages to float if they're not None
-        percentages = [float(p) if p else 0 for p in percentages]
-        
-        # Validate total is approximately 100%
-        total_percentage = sum(percentages)
-        if abs(total_percentage - 100.0) > 0.01:  # Allow small floating-point difference
-            raise HTTPException(status_code=400, detail=f"Percentages must sum to 100% (got {total_percentage}%)")
-        
-        for user, percentage in zip(users, percentages):
-            if user.id != added_by and percentage > 0:
-                split_amount = (percentage / 100.0) * amount
-                balance = models.Balance(
-                    group_id=group_id,
-                    user_id=user.id,
-                    owe_to=added_by,
-                    amount=split_amount
-                )
-                db.add(balance)
-    
-    # Create expense record
-    new_expense = models.Expense(
-        group_id=group_id,
-        added_by=added_by,
-        amount=amount,
-        description=description,
-        split_type=split_type
-    )
-    db.add(new_expense)
-    db.commit()
+    # Members are read under the group's write lock, so a concurrent removal
+    # cannot leave this expense split across someone who already left
+    try:
+        await writes.write_group(
+            db, group_id, crud.create_expense, group_id, added_by, money.to_cents(amount), description, split_type,
+            percentages
+        )
+    except writes.GroupNotFound:
+        raise HTTPException(status_code=404, detail="Group not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return RedirectResponse(url=f"/group/{group_id}/ledger", status_code=303)
 
+@app.post("/group/{group_id}/expenses/bulk")
+async def bulk_import_expenses(
+    request: Request,
+    group_id: int,
+    format: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    # Validation is CPU-bound, so this route keeps the sync session and runs
+    # each chunk on the threadpool rather than on the event loop
+    group = await run_in_threadpool(db.query(models.Group).filter(models.Group.id == group_id).first)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    # Format comes from ?format=csv|ndjson, falling back to the content type
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    
+    report = bulk_import.ImportReport()
+    
+    # Stream the body and write it in chunked transactions
+    batch = []
+    async for line_number, record in bulk_import.iter_records(request.stream(), fmt):
+        batch.append((line_number, record))
+        if len(batch) >= bulk_import.BATCH_SIZE:
+            await run_in_threadpool(bulk_import.write_batch, db, group_id, batch, report)
+            batch = []
+    if batch:
+        await run_in_threadpool(bulk_import.write_batch, db, group_id, batch, report)
+    return report.as_dict()
+
 @app.post("/delete-group/{group_id}")
-def delete_group_submit(group_id: int, db: Session = Depends(get_db)):
-    # Use your existing delete_group logic
-    db.query(models.GroupMembership).filter(models.GroupMembership.group_id == group_id).delete()
-    db.query(models.Balance).filter(models.Balance.group_id == group_id).delete()
-    db.query(models.Expense).filter(models.Expense.group_id == group_id).delete()
-    db.query(models.Group).filter(models.Group.id == group_id).delete()
-    db.commit()
+async def delete_group_submit(group_id: int, db: AsyncSession = Depends(get_async_db)):
+    # The group disappears now; a background job removes its history in chunks
+    job = await db.run_sync(jobs.queue_group_deletion, group_id)
+    await db.run_sync(broadcast.hub.prepare)
+    await db.commit()
+    if job is not None:
+        cache.invalidate_group(group_id)
+        broadcast.hub.deliver(db.sync_session)
+        jobs.pool.wake()
     return RedirectResponse(url="/", status_code=303)
 
 @app.get("/manage-group-users/{group_id}")
-def manage_group_users(request: Request, group_id: int, db: Session = Depends(get_db)):
-    group = db.query(models.Group).filter(models.Group.id == group_id).first()
+async def manage_group_users(request: Request, group_id: int, db: AsyncSession = Depends(get_read_db)):
+    group = await db.get(models.Group, group_id)
     if not group:
         return RedirectResponse(url="/", status_code=303)
     
-    group_members = db.query(models.GroupMembership).filter(
-        models.GroupMembership.group_id == group_id
-    ).join(models.User).all()
+    # Users are loaded up front: lazy loads cannot run under AsyncSession
+    result = await db.execute(
+        select(models.GroupMembership)
+        .options(joinedload(models.GroupMembership.user))
+        .where(models.GroupMembership.group_id == group_id)
+        .order_by(models.GroupMembership.id)
+    )
+    group_members = result.scalars().all()
     
     return templates.TemplateResponse("manage_group_users.html", {
         "request": request,
@@ -233,28 +269,13 @@ async def add_user_to_group(
     group_id: int,
     user_name: str = Form(...),
     user_email: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Check if user already exists
-    user = db.query(models.User).filter(models.User.email == user_email).first()
-    if not user:
-        # Create new user if they don't exist
-        user = models.User(name=user_name, email=user_email)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    
-    # Check if user is already in the group
-    existing_membership = db.query(models.GroupMembership).filter(
-        models.GroupMembership.group_id == group_id,
-        models.GroupMembership.user_id == user.id
-    ).first()
-    
-    if not existing_membership:
-        # Add user to group
-        membership = models.GroupMembership(group_id=group_id, user_id=user.id)
-        db.add(membership)
-        db.commit()
+    # Register the user if the email is new and add them unless already a member
+    try:
+        await writes.write_group(db, group_id, crud.add_member, group_id, user_name, user_email)
+    except writes.GroupNotFound:
+        raise HTTPException(status_code=404, detail="Group not found")
     
     return RedirectResponse(url=f"/manage-group-users/{group_id}", status_code=303)
 
@@ -262,81 +283,386 @@ async def add_user_to_group(
 async def remove_user_from_group(
     group_id: int,
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Delete any balances involving this user in this group
-    db.query(models.Balance).filter(
-        models.Balance.group_id == group_id,
-        (models.Balance.user_id == user_id) | (models.Balance.owe_to == user_id)
-    ).delete()
-    
-    # Remove user from group
-    db.query(models.GroupMembership).filter(
-        models.GroupMembership.group_id == group_id,
-        models.GroupMembership.user_id == user_id
-    ).delete()
-    
-    db.commit()
+    # Journal the removal, drop the user's balances and membership
+    try:
+        await writes.write_group(db, group_id, crud.remove_member, group_id, user_id)
+    except writes.GroupNotFound:
+        raise HTTPException(status_code=404, detail="Group not found")
     return RedirectResponse(url=f"/manage-group-users/{group_id}", status_code=303)
 
 @app.get("/api/group-users/{group_id}")
-async def get_group_users(group_id: int, db: Session = Depends(get_db)):
-    users = db.query(models.User).join(models.GroupMembership).filter(
-        models.GroupMembership.group_id == group_id
-    ).all()
+async def get_group_users(group_id: int, db: AsyncSession = Depends(get_read_db)):
+    members = await group_cache.group_members(db, [group_id])
     
-    return [{"id": user.id, "name": user.name} for user in users]
+    return members[group_id]
 
 @app.get("/group/{group_id}/ledger")
-def group_ledger(request: Request, group_id: int, db: Session = Depends(get_db)):
-    group = db.query(models.Group).filter(models.Group.id == group_id).first()
+async def group_ledger(
+    request: Request,
+    group_id: int,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    versions = await group_cache.group_versions(db, [group_id])
+    if group_id not in versions:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    # Every write to the group bumps its version, so an unchanged version
+    # means the page the client (or the fragment cache) holds is current
+    etag = etags.make_etag("ledger", group_id, versions[group_id], cursor, limit)
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+    page_key = f"page:group:{group_id}:{etag}"
+    page = cache.get("pages", page_key)
+    if page is not None:
+        return etags.html(page, etag)
+    
+    group = await db.get(models.Group, group_id)
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     
-    # Get all expenses for this group, including the user who added the expense
-    expenses = db.query(models.Expense)\
-        .filter(models.Expense.group_id == group_id)\
-        .options(joinedload(models.Expense.user))\
-        .order_by(models.Expense.created_at.desc())\
-        .all()
+    # Get one page of expenses for this group, including the user who added the expense
+    expenses, next_cursor = await db.run_sync(crud.list_group_expenses, group_id, cursor, limit)
     
-    # Get all balances
-    balances = db.query(models.Balance).filter(
-        models.Balance.group_id == group_id
-    ).all()
+    # Get the materialized net balances
+    net_balances = (await group_cache.group_balances(db, [group_id]))[group_id]["net"]
     
     # Get all users in the group
-    group_users = db.query(models.User).join(models.GroupMembership).filter(
-        models.GroupMembership.group_id == group_id
-    ).all()
+    group_users = (await group_cache.group_members(db, [group_id]))[group_id]
     
     # Calculate user balances
     user_balances = {}
     for user in group_users:
-        # Money user owes to others
-        owes = db.query(models.Balance).filter(
-            models.Balance.group_id == group_id,
-            models.Balance.user_id == user.id
-        ).all()
-        
-        # Money others owe to user
-        owed = db.query(models.Balance).filter(
-            models.Balance.group_id == group_id,
-            models.Balance.owe_to == user.id
-        ).all()
-        
-        total_owes = sum(balance.amount for balance in owes)
-        total_owed = sum(balance.amount for balance in owed)
-        net_balance = total_owed - total_owes
-        
-        user_balances[user.id] = {
+        user_balances[user["id"]] = {
             "user": user,
-            "net_balance": net_balance
+            "net_balance": net_balances.get(user["id"], 0)
         }
     
-    return templates.TemplateResponse("group_ledger.html", {
+    # Suggested transfers that would settle the whole group; a net balance can
+    # name someone who is no longer a member (legacy data, or a removal that
+    # committed between the two reads), so those are looked up in one query
+    transfers = settlement.settle(net_balances)
+    users_by_id = {user["id"]: user for user in group_users}
+    missing_ids = {user_id for debtor, creditor, _ in transfers for user_id in (debtor, creditor)} - set(users_by_id)
+    if missing_ids:
+        result = await db.execute(select(models.User.id, models.User.name).where(models.User.id.in_(missing_ids)))
+        for user_id, name in result.all():
+            users_by_id[user_id] = {"id": user_id, "name": name}
+    settle_up = [
+        (users_by_id[debtor], users_by_id[creditor], amount)
+        for debtor, creditor, amount in transfers
+    ]
+    
+    page = templates.get_template("group_ledger.html").render({
         "request": request,
         "group": group,
         "expenses": expenses,
-        "balances": user_balances
-    })
\ No newline at end of file
+        "balances": user_balances,
+        "settle_up": settle_up,
+        "next_cursor": next_cursor
+    })
+    cache.set(page_key, page)
+    return etags.html(page, etag)
+
+@app.get("/group/{group_id}/stream")
+async def group_stream(group_id: int, events: Optional[int] = None):
+    """Server-sent events: the group's balances, then every change to them as it commits."""
+    # Subscribe before reading the snapshot so no write can fall in between;
+    # messages the snapshot already covers carry a version at or below it
+    subscription = broadcast.hub.subscribe(group_id)
+    try:
+        # A session of its own, closed before streaming: idle viewers hold no connection
+        async with database.AsyncSessionLocal() as db:
+            snapshot = await db.run_sync(crud.group_snapshot, group_id)
+    except BaseException:
+        broadcast.hub.unsubscribe(subscription)
+        raise
+    if snapshot is None:
+        broadcast.hub.unsubscribe(subscription)
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    return StreamingResponse(
+        broadcast.event_stream(subscription, snapshot, events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/group/{group_id}/ledger.csv")
+async def export_ledger_csv(
+    group_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    group = await db.get(models.Group, group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    partitions = exports.iter_ledger_partitions(db, group_id, start, end)
+    return StreamingResponse(
+        exports.iter_csv(partitions),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="group-{group_id}-ledger.csv"'}
+    )
+
+@app.get("/group/{group_id}/ledger.ndjson")
+async def export_ledger_ndjson(
+    group_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    group = await db.get(models.Group, group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    partitions = exports.iter_ledger_partitions(db, group_id, start, end)
+    return StreamingResponse(exports.iter_ndjson(partitions), media_type="application/x-ndjson")
+
+@app.get("/group/{group_id}/settle-up")
+async def group_settle_up(group_id: int, db: AsyncSession = Depends(get_read_db)):
+    group = await db.get(models.Group, group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    net_balances = (await group_cache.group_balances(db, [group_id]))[group_id]["net"]
+    transfers = settlement.settle(net_balances)
+    
+    members = (await group_cache.group_members(db, [group_id]))[group_id]
+    names = {user["id"]: user["name"] for user in members}
+    
+    return {
+        "group_id": group_id,
+        "transfers": [
+            {
+                "from": {"id": debtor, "name": names.get(debtor)},
+                "to": {"id": creditor, "name": names.get(creditor)},
+                "amount": money.from_cents(amount)
+            }
+            for debtor, creditor, amount in transfers
+        ]
+    }
+
+@app.get("/group/{group_id}/balances")
+async def group_balances_as_of(
+    group_id: int,
+    as_of: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    group = await db.get(models.Group, group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    # Nearest month-start snapshot plus whatever is dated after it
+    as_of = crud.naive_utc(as_of) or datetime.utcnow()
+    if group.archived_at is not None and as_of < group.archived_at:
+        # The history before that went to app.archive's files
+        raise HTTPException(status_code=410, detail="Balances before the group was archived are no longer kept")
+    taken_at, pairs = await db.run_sync(snapshots.balances_as_of, group_id, as_of)
+    net_balances = crud.net_deltas(
+        (debtor, creditor, amount) for (debtor, creditor), amount in pairs.items()
+    )
+    
+    return {
+        "group_id": group_id,
+        "as_of": as_of.isoformat(),
+        "snapshot": taken_at.isoformat() if taken_at else None,
+        "balances": [
+            {"user_id": user_id, "net": money.from_cents(net)}
+            for user_id, net in sorted(net_balances.items()) if net
+        ],
+        "debts": [
+            {"from": debtor, "to": creditor, "amount": money.from_cents(amount)}
+            for (debtor, creditor), amount in sorted(pairs.items())
+        ]
+    }
+
+@app.post("/api/groups", status_code=201)
+async def create_group_api(group: GroupCreate, db: AsyncSession = Depends(get_async_db)):
+    users = [(user.name, user.email) for user in group.users]
+    group_id = await db.run_sync(crud.create_group, group.name, users)
+    await db.commit()
+    
+    members = await db.run_sync(crud.get_group_members, group_id)
+    return {
+        "id": group_id,
+        "name": group.name,
+        "members": [{"id": user.id, "name": user.name, "email": user.email} for user in members]
+    }
+
+@app.delete("/api/groups/{group_id}", status_code=202)
+async def delete_group_api(group_id: int, db: AsyncSession = Depends(get_async_db)):
+    job = await db.run_sync(jobs.queue_group_deletion, group_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    await db.run_sync(broadcast.hub.prepare)
+    await db.commit()
+    cache.invalidate_group(group_id)
+    broadcast.hub.deliver(db.sync_session)
+    jobs.pool.wake()
+    return jobs.describe(job)
+
+@app.get("/api/users/{user_id}/summary")
+async def user_summary_api(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    # Overall totals come from user_summaries, kept up to date by the writes
+    summary = await db.run_sync(crud.get_user_summary, user_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    name, group_count, net, groups = summary
+    
+    return {
+        "user_id": user_id,
+        "name": name,
+        "group_count": group_count,
+        "net": money.from_cents(net),
+        "groups": [
+            {"group_id": group_id, "name": group_name, "net": money.from_cents(group_net)}
+            for group_id, group_name, group_net in groups
+        ]
+    }
+
+@app.get("/api/groups")
+async def list_groups_api(
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    groups, next_after = await db.run_sync(crud.list_groups, after, limit)
+    
+    return {
+        "groups": [{"id": group.id, "name": group.name} for group in groups],
+        "next_after": next_after
+    }
+
+@app.get("/api/groups/balances")
+async def group_balances_api(ids: str, db: AsyncSession = Depends(get_read_db)):
+    # ids=1,2,3 - one aggregate query for every uncached group
+    try:
+        group_ids = list(dict.fromkeys(int(value) for value in ids.split(",") if value.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if len(group_ids) > pagination.MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {pagination.MAX_PAGE_SIZE} ids per request")
+    
+    # Unknown ids are left out rather than failing the whole batch
+    versions = await group_cache.group_versions(db, group_ids)
+    group_ids = [group_id for group_id in group_ids if group_id in versions]
+    summaries = await group_cache.group_balances(db, group_ids)
+    
+    return {
+        "groups": [
+            {
+                "group_id": group_id,
+                "balances": [
+                    {"user_id": user_id, "net": money.from_cents(net)}
+                    for user_id, net in summaries[group_id]["net"].items()
+                ],
+                "debts": [
+                    {"from": debtor, "to": creditor, "amount": money.from_cents(amount)}
+                    for debtor, creditor, amount in summaries[group_id]["pairs"]
+                ]
+            }
+            for group_id in group_ids
+        ]
+    }
+
+@app.get("/api/groups/{group_id}/expenses")
+async def list_group_expenses_api(
+    group_id: int,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    expenses, next_cursor = await db.run_sync(crud.list_group_expenses, group_id, cursor, limit)
+    
+    return {
+        "expenses": [
+            {
+                "id": expense.id,
+                "description": expense.description,
+                "amount": money.from_cents(expense.amount),
+                "split_type": expense.split_type,
+                "added_by": {"id": expense.added_by, "name": expense.user.name if expense.user else None},
+                "created_at": expense.created_at.isoformat(),
+                "splits": [
+                    {"user_id": split.user_id, "amount": money.from_cents(split.amount)}
+                    for split in expense.splits
+                ]
+            }
+            for expense in expenses
+        ],
+        "next_cursor": next_cursor
+    }
+
+@app.post("/api/groups/{group_id}/settlements")
+async def create_settlement(group_id: int, settlement_in: SettlementCreate, db: AsyncSession = Depends(get_async_db)):
+    try:
+        expense_id = await writes.write_group(
+            db, group_id, crud.create_settlement, group_id, settlement_in.from_user, settlement_in.to_user,
+            money.to_cents(settlement_in.amount)
+        )
+    except writes.GroupNotFound:
+        raise HTTPException(status_code=404, detail="Group not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"id": expense_id, "group_id": group_id}
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return cache.stats()
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(instrumentation.registry.exposition(), media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz")
+def healthz():
+    # Liveness only: answers as long as the worker's event loop does
+    return {"status": "ok", "pid": os.getpid()}
+
+@app.get("/readyz")
+async def readyz():
+    try:
+        await database.ping()
+    except Exception:
+        return PlainTextResponse("database unavailable", status_code=503)
+    return PlainTextResponse("ready")
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(job: JobCreate, db: AsyncSession = Depends(get_async_db)):
+    # Group deletion has its own routes, which also hide the group
+    if job.kind == "rebuild_balances":
+        if await db.run_sync(jobs.pending, job.kind):
+            raise HTTPException(status_code=409, detail="A balance rebuild is already queued or running")
+    elif job.kind == "export_ledger":
+        group_id = job.params.get("group_id")
+        if not isinstance(group_id, int) or not await db.get(models.Group, group_id):
+            raise HTTPException(status_code=404, detail="Group not found")
+        if job.params.get("format", "csv") not in ("csv", "ndjson"):
+            raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    else:
+        raise HTTPException(status_code=400, detail="kind must be rebuild_balances or export_ledger")
+    
+    queued = await db.run_sync(jobs.enqueue, job.kind, job.params)
+    await db.commit()
+    jobs.pool.wake()
+    return jobs.describe(queued)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    job = await db.get(models.Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.describe(job)
+
+@app.get("/api/jobs/{job_id}/download")
+async def download_job_result(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    job = await db.get(models.Job, job_id)
+    if not job or job.kind != "export_ledger" or job.status != jobs.DONE:
+        raise HTTPException(status_code=404, detail="No finished export for this job")
+    media_type = "text/csv" if job.result["format"] == "csv" else "application/x-ndjson"
+    return FileResponse(job.result["path"], media_type=media_type, filename=f"group-{job.params['group_id']}-ledger.{job.result['format']}")
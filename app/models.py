@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Float, ForeignKey, Date, DateTime, UniqueConstraint, Index, JSON, Text
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -9,10 +9,17 @@ class Group(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
+    # Bumped by every write that changes what the group's pages show
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+    # Set when deletion is queued; the group is hidden while a job removes its rows
+    deleted_at = Column(DateTime, nullable=True)
+    # Set when app.archive moved the group's history out (see GroupArchive)
+    archived_at = Column(DateTime, nullable=True)
 
     memberships = relationship("GroupMembership", back_populates="group")
     expenses = relationship("Expense", back_populates="group")
     balances = relationship("Balance", back_populates="group")
+    net_balances = relationship("NetBalance", back_populates="group")
 
 
 class User(Base):
@@ -30,6 +37,11 @@ class User(Base):
 
 class GroupMembership(Base):
     __tablename__ = 'group_memberships'
+    __table_args__ = (
+        UniqueConstraint('group_id', 'user_id', name='uq_group_memberships_group_user'),
+        # A user's groups (the user summary)
+        Index('ix_group_memberships_user_group', 'user_id', 'group_id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     group_id = Column(Integer, ForeignKey('groups.id'))
@@ -42,28 +54,186 @@ class GroupMembership(Base):
 class Expense(Base):
     __tablename__ = 'expenses'
 
+    # On PostgreSQL the table is range-partitioned by month of created_at and
+    # its primary key is (id, created_at); see migration 8e4b27c6f3d1
     id = Column(Integer, primary_key=True, index=True)
     group_id = Column(Integer, ForeignKey('groups.id'))
     added_by = Column(Integer, ForeignKey('users.id'))
-    amount = Column(Float)
+    # All money columns hold integer cents
+    amount = Column(BigInteger)
     description = Column(String)
     split_type = Column(String)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
     group = relationship("Group", back_populates="expenses")
     added_by_user = relationship("User", back_populates="expenses_added")
     user = relationship("User", foreign_keys=[added_by], back_populates="expenses_added", overlaps="added_by_user")
+    splits = relationship("ExpenseSplit", back_populates="expense", order_by="ExpenseSplit.id")
+
+
+# Serves the ledger's keyset pagination: newest first within a group
+Index('ix_expenses_group_created_id', Expense.group_id, Expense.created_at.desc(), Expense.id.desc())
+
+
+class ExpenseSplit(Base):
+    __tablename__ = 'expense_splits'
+
+    # Each member's share of an expense, the payer's own share included.
+    # Written once with the expense and never changed. PostgreSQL cannot
+    # enforce expense_id's foreign key against the partitioned expenses table.
+    id = Column(Integer, primary_key=True)
+    expense_id = Column(Integer, ForeignKey('expenses.id'), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    amount = Column(BigInteger, nullable=False)
+
+    expense = relationship("Expense", back_populates="splits")
+    user = relationship("User")
+
+
+class LedgerEvent(Base):
+    __tablename__ = 'ledger_events'
+    __table_args__ = (
+        Index('ix_ledger_events_group_id', 'group_id', 'id'),
+        # Time-ordered lookups of removals and opening balances per group
+        Index('ix_ledger_events_group_kind_created', 'group_id', 'kind', 'created_at'),
+    )
+
+    # Append-only journal; the id is the replay order. Kinds:
+    #   expense        - expense_id (settlements are expenses of split_type 'settlement')
+    #   member_removed - user_id left the group and their balances were dropped
+    #   opening        - user_id owed counterparty_id `amount` before the journal existed
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    group_id = Column(Integer, ForeignKey('groups.id'), nullable=False)
+    kind = Column(String, nullable=False)
+    # Not enforced on PostgreSQL, where expenses is partitioned
+    expense_id = Column(Integer, ForeignKey('expenses.id'))
+    user_id = Column(Integer, ForeignKey('users.id'))
+    counterparty_id = Column(Integer, ForeignKey('users.id'))
+    amount = Column(BigInteger)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class BalanceSnapshot(Base):
+    __tablename__ = 'balance_snapshots'
+    __table_args__ = (
+        UniqueConstraint('group_id', 'taken_at', name='uq_balance_snapshots_group_taken_at'),
+    )
+
+    # A group's pair balances from everything dated before taken_at (the
+    # start of a month), with expenses placed by created_at
+    id = Column(Integer, primary_key=True)
+    group_id = Column(Integer, ForeignKey('groups.id'), nullable=False)
+    taken_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    lines = relationship("BalanceSnapshotLine", back_populates="snapshot")
+
+
+class BalanceSnapshotLine(Base):
+    __tablename__ = 'balance_snapshot_lines'
+
+    snapshot_id = Column(Integer, ForeignKey('balance_snapshots.id'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    owe_to = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    amount = Column(BigInteger, nullable=False)
+
+    snapshot = relationship("BalanceSnapshot", back_populates="lines")
+
+
+class ProjectionCheckpoint(Base):
+    __tablename__ = 'projection_checkpoints'
+
+    # Progress of a projection rebuild: events up to last_event_id are applied,
+    # and the rebuild is finished once that reaches target_event_id
+    name = Column(String, primary_key=True)
+    last_event_id = Column(BigInteger, nullable=False, default=0)
+    target_event_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Job(Base):
+    __tablename__ = 'jobs'
+    # Workers poll for the oldest claimable job of each kind
+    __table_args__ = (
+        Index('ix_jobs_status_kind_id', 'status', 'kind', 'id'),
+    )
+
+    # Background work run by app.jobs; params, progress and result are JSON
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default='queued')
+    params = Column(JSON, nullable=False, default=dict)
+    progress = Column(JSON)
+    result = Column(JSON)
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    # A running job whose lease has passed belonged to a worker that died
+    lease_expires_at = Column(DateTime)
 
 
 class Balance(Base):
     __tablename__ = 'balances'
+    # One running total per ordered (group, debtor, creditor) pair. On
+    # PostgreSQL the table is hash-partitioned by group_id, with primary key
+    # (id, group_id), so a group's rows live in one partition
+    __table_args__ = (
+        UniqueConstraint('group_id', 'user_id', 'owe_to', name='uq_balances_group_pair'),
+        # Lookups by creditor (e.g. removing a member)
+        Index('ix_balances_group_owe_to', 'group_id', 'owe_to'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     owe_to = Column(Integer, ForeignKey("users.id"), nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column(BigInteger, nullable=False)
 
     user = relationship("User", foreign_keys=[user_id], back_populates="balances_owed")
     owed_to = relationship("User", foreign_keys=[owe_to], back_populates="balances_to_receive")
-    group = relationship("Group", back_populates="balances")
\ No newline at end of file
+    group = relationship("Group", back_populates="balances")
+
+
+class GroupArchive(Base):
+    __tablename__ = 'group_archives'
+
+    # What app.archive folded a settled, idle group's history into: the
+    # expenses, splits and journal went to a compressed file at `path`
+    id = Column(Integer, primary_key=True)
+    group_id = Column(Integer, ForeignKey('groups.id'), nullable=False, index=True)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    path = Column(String, nullable=False)
+    sha256 = Column(String, nullable=False)
+    expense_count = Column(Integer, nullable=False)
+    settlement_count = Column(Integer, nullable=False)
+    # Cents spent on expenses, settlements excluded
+    total_amount = Column(BigInteger, nullable=False)
+    first_expense_at = Column(DateTime)
+    last_activity_at = Column(DateTime)
+    # {user_id: {"paid": cents, "share": cents}} over the archived expenses
+    member_totals = Column(JSON, nullable=False, default=dict)
+
+
+class NetBalance(Base):
+    __tablename__ = 'net_balances'
+
+    # Materialized per-member net position, kept in step with `balances` by
+    # the write routes so pages can read a group's totals with one lookup.
+    group_id = Column(Integer, ForeignKey('groups.id'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    net = Column(BigInteger, nullable=False, default=0)
+
+    group = relationship("Group", back_populates="net_balances")
+    user = relationship("User")
+
+
+class UserSummary(Base):
+    __tablename__ = 'user_summaries'
+
+    # Totals over the groups a user belongs to, kept in step with
+    # group_memberships and net_balances by the write routes (app.crud)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    group_count = Column(Integer, nullable=False, default=0)
+    net = Column(BigInteger, nullable=False, default=0)
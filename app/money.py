@@ -0,0 +1,87 @@
+"""Money as integer cents.
+
+Every amount is stored and summed as an integer number of cents (BIGINT
+columns), so totals are exact and net balances always sum to zero. Decimal
+is only used at the edges, to parse user input and to format output.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CENT = Decimal("0.01")
+
+# Percentages are accepted with up to four decimal places
+PERCENT_SCALE = 10000
+
+# Largest single amount (a billion in currency units); keeps any realistic
+# sum of amounts far inside a BIGINT
+MAX_CENTS = 10 ** 11
+
+
+def to_cents(value) -> int:
+    """Parse a decimal amount ("12.34", 12.34, Decimal) into whole cents."""
+    try:
+        # str() first so floats parse as written rather than as their binary value
+        amount = Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Invalid amount: {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"Invalid amount: {value!r}")
+    try:
+        return int(amount.quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+    except InvalidOperation:
+        # More digits than the decimal context holds; no real amount gets here
+        raise ValueError(f"Invalid amount: {value!r}")
+
+
+def check_amount(cents: int) -> int:
+    """Reject an expense or settlement amount that is not positive or is over MAX_CENTS."""
+    if cents <= 0:
+        raise ValueError("Amount must be positive")
+    if cents > MAX_CENTS:
+        raise ValueError(f"Amount must be at most {format_cents(MAX_CENTS)}")
+    return cents
+
+
+def from_cents(cents) -> Decimal:
+    return (Decimal(int(cents)) / 100).quantize(CENT)
+
+
+def format_cents(cents) -> str:
+    return str(from_cents(cents))
+
+
+def percent_units(percentages):
+    """Percentages as integers of 1/PERCENT_SCALE percent, so 100% is 100 * PERCENT_SCALE."""
+    units = []
+    for percentage in percentages:
+        try:
+            value = Decimal(str(percentage or 0))
+        except (InvalidOperation, ValueError):
+            raise ValueError("percentages must be numbers")
+        if not value.is_finite() or value < 0:
+            raise ValueError("percentages must be non-negative numbers")
+        units.append(int((value * PERCENT_SCALE).to_integral_value(rounding=ROUND_HALF_UP)))
+    return units
+
+
+def allocate(total: int, weights):
+    """Split `total` cents in proportion to integer `weights` (largest remainder).
+
+    Each share gets its floor, then the leftover cents go one each to the
+    largest fractional remainders, ties broken by position. The shares always
+    sum to exactly `total` and the result depends only on the inputs.
+    """
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        raise ValueError("Cannot allocate against zero weights")
+
+    shares = []
+    remainders = []
+    for index, weight in enumerate(weights):
+        share, remainder = divmod(total * weight, weight_sum)
+        shares.append(share)
+        remainders.append((-remainder, index))
+
+    leftover = total - sum(shares)
+    for _, index in sorted(remainders)[:leftover]:
+        shares[index] += 1
+    return shares
@@ -0,0 +1,119 @@
+"""Keep the monthly expense partitions ahead of the clock.
+
+Usage:
+    python -m app.partitions ensure [--months-ahead 3]
+    python -m app.partitions status
+
+On PostgreSQL, migration 8e4b27c6f3d1 range-partitions `expenses` by month
+of created_at (expenses_YYYY_MM, plus expenses_default for anything outside
+them) and hash-partitions `balances` by group_id. Queries that bound
+created_at (a ledger page, an as-of range) only scan the months they name,
+and months a maintenance job has emptied (app.archive) cost nothing.
+
+`ensure` creates the partitions for the current month and the next
+--months-ahead, so new expenses never land in the default partition; run
+it from cron at least monthly. Rows already sitting in the default
+partition for a month being created are moved into it. `status` lists each
+partition with its bounds and estimated row count. Other databases have no
+partitions and both commands just say so.
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from sqlalchemy import text
+
+from .database import SessionLocal
+from .snapshots import month_start, next_month
+
+MONTHS_AHEAD = 3
+
+PARTITIONS = text("""
+    SELECT child.relname, pg_get_expr(child.relpartbound, child.oid), child.reltuples
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = :table
+    ORDER BY child.relname
+""")
+
+
+def is_partitioned(db, table):
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    kind = db.execute(text("SELECT relkind FROM pg_class WHERE relname = :table"), {"table": table}).scalar()
+    return kind == "p"
+
+
+def partition_name(month):
+    return f"expenses_{month:%Y_%m}"
+
+
+def create_month(db, month):
+    """Create the month's partition, moving its rows out of expenses_default first."""
+    end = next_month(month)
+    bounds = {"start": month, "end": end}
+    in_range = "created_at >= :start AND created_at < :end"
+    # PostgreSQL refuses to attach a partition whose rows the default
+    # partition already holds, so those are lifted out and put back
+    db.execute(text(
+        f"CREATE TEMPORARY TABLE moving_expenses ON COMMIT DROP AS "
+        f"SELECT * FROM expenses_default WHERE {in_range}"
+    ), bounds)
+    moved = db.execute(text(f"DELETE FROM expenses_default WHERE {in_range}"), bounds).rowcount
+    db.execute(text(
+        f"CREATE TABLE {partition_name(month)} PARTITION OF expenses "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    ))
+    db.execute(text("INSERT INTO expenses SELECT * FROM moving_expenses"))
+    return moved
+
+
+def ensure(db, months_ahead=MONTHS_AHEAD, now=None):
+    """Create missing partitions from this month to `months_ahead` months on; returns [(name, rows moved)]."""
+    existing = {name for name, _, _ in db.execute(PARTITIONS, {"table": "expenses"})}
+    created = []
+    month = month_start(now or datetime.utcnow())
+    for _ in range(months_ahead + 1):
+        if partition_name(month) not in existing:
+            # One transaction per month; the DDL locks the parent table briefly
+            moved = create_month(db, month)
+            db.commit()
+            created.append((partition_name(month), moved))
+        month = next_month(month)
+    return created
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure_parser = commands.add_parser("ensure", help="create upcoming monthly expense partitions")
+    ensure_parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    commands.add_parser("status", help="list partitions with estimated row counts")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if not is_partitioned(db, "expenses"):
+            print("expenses is not partitioned on this database (PostgreSQL only); nothing to do")
+            return 0
+
+        if args.command == "ensure":
+            created = ensure(db, args.months_ahead)
+            for name, moved in created:
+                print(f"created {name}" + (f", moved {moved} row(s) from expenses_default" if moved else ""))
+            print(f"{len(created)} partition(s) created")
+            return 0
+
+        for table in ("expenses", "balances"):
+            for name, bounds, rows in db.execute(PARTITIONS, {"table": table}):
+                # reltuples is -1 until the partition is first analyzed
+                estimate = "?" if rows < 0 else f"~{int(rows)}"
+                print(f"{name:<20} {estimate:>10} rows  {bounds}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""Fail if any route's queries fall back to sequential scans.
+
+Usage:
+    python -m app.query_plans [--seed] [--create-tables]
+
+Drives every route registered on the app through FastAPI's TestClient
+(needs `requests`, see requirements-dev.txt), captures every statement it
+issues and runs EXPLAIN on it; a route missing from route_calls fails the
+check, so new endpoints cannot go unchecked. tests/test_query_plans.py runs
+it against a seeded SQLite database. On PostgreSQL sequential scans are disabled for the EXPLAIN session, so a
+remaining `Seq Scan` means no index can serve the query at all; on SQLite a
+bare `SCAN <table>` is reported. The read-through cache (app.cache) is off
+for the run, so every route reaches the database. Exits non-zero when any
+scan is found.
+
+The write routes run too, and the check seeds two small scratch groups for
+the deletion routes to remove and queues one export job; --seed also writes
+synthetic data (see app.seed). Only run it on a scratch database.
+"""
+import argparse
+import sys
+
+from sqlalchemy import event
+
+from . import models, crud, jobs, seed as seeder
+from .cache import cache
+from .database import Base, SessionLocal, engine, async_engine
+
+# Scans that are the intended plan: group listings page through groups in
+# primary-key order, which SQLite reports as a rowid SCAN, and the expense
+# form offers every live group.
+ALLOWED_SCANS = {
+    ("GET", "/"): {"groups"},
+    ("GET", "/api/groups"): {"groups"},
+    ("GET", "/add-expense"): {"groups"},
+}
+
+# Routes that are not part of the application itself
+IGNORED_PATHS = {"/static", "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json"}
+
+TABLES = set(Base.metadata.tables)
+
+
+class StatementRecorder:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+            self.statements.append((statement, parameters))
+
+
+def scanned_tables(conn, statement, parameters):
+    if conn.dialect.name == "postgresql":
+        rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters).fetchall()
+        lines = [row[0] for row in rows]
+        found = {line.split("Seq Scan on ", 1)[1].split()[0] for line in lines if "Seq Scan on " in line}
+    else:
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        details = [row[-1] for row in rows]
+        found = {
+            detail.split()[1] for detail in details
+            if detail.startswith("SCAN ") and "INDEX" not in detail
+        }
+    return found & TABLES
+
+
+def route_calls(group_id, user_id, member_id, scratch_ids, export_job):
+    """(method, route template, path, request arguments) for every route, writes last.
+
+    `scratch_ids` are two groups the deletion routes may remove, and
+    `export_job` a finished export for the job status and download routes.
+    """
+    ndjson = f'{{"added_by": {user_id}, "amount": "3.10", "split_type": "equal"}}\n'.encode()
+    return [
+        ("GET", "/", "/", {}),
+        ("GET", "/create-group", "/create-group", {}),
+        ("GET", "/add-expense", "/add-expense", {}),
+        ("GET", "/group/{group_id}/ledger", f"/group/{group_id}/ledger", {}),
+        # Only the snapshot event, so the stream ends
+        ("GET", "/group/{group_id}/stream", f"/group/{group_id}/stream?events=1", {}),
+        ("GET", "/group/{group_id}/ledger.csv", f"/group/{group_id}/ledger.csv", {}),
+        ("GET", "/group/{group_id}/ledger.ndjson", f"/group/{group_id}/ledger.ndjson", {}),
+        ("GET", "/group/{group_id}/settle-up", f"/group/{group_id}/settle-up", {}),
+        ("GET", "/group/{group_id}/balances", f"/group/{group_id}/balances?as_of=2030-01-01T00:00:00", {}),
+        ("GET", "/manage-group-users/{group_id}", f"/manage-group-users/{group_id}", {}),
+        ("GET", "/api/group-users/{group_id}", f"/api/group-users/{group_id}", {}),
+        ("GET", "/api/groups", "/api/groups", {}),
+        ("GET", "/api/groups/balances", f"/api/groups/balances?ids={group_id}", {}),
+        ("GET", "/api/groups/{group_id}/expenses", f"/api/groups/{group_id}/expenses", {}),
+        ("GET", "/api/users/{user_id}/summary", f"/api/users/{user_id}/summary", {}),
+        ("GET", "/api/jobs/{job_id}", f"/api/jobs/{export_job}", {}),
+        ("GET", "/api/jobs/{job_id}/download", f"/api/jobs/{export_job}/download", {}),
+        ("GET", "/api/cache/stats", "/api/cache/stats", {}),
+        ("GET", "/metrics", "/metrics", {}),
+        ("GET", "/healthz", "/healthz", {}),
+        ("GET", "/readyz", "/readyz", {}),
+        ("POST", "/add-expense", "/add-expense", {"data": {
+            "group_id": group_id, "added_by": user_id, "amount": 12.5,
+            "description": "Plan check", "split_type": "equal",
+        }}),
+        ("POST", "/group/{group_id}/expenses/bulk", f"/group/{group_id}/expenses/bulk", {
+            "data": ndjson * 10, "headers": {"Content-Type": "application/x-ndjson"},
+        }),
+        ("POST", "/api/groups/{group_id}/settlements", f"/api/groups/{group_id}/settlements", {"json": {
+            "from_user": member_id, "to_user": user_id, "amount": "1.00",
+        }}),
+        ("POST", "/api/jobs", "/api/jobs", {"json": {"kind": "export_ledger", "params": {"group_id": group_id}}}),
+        ("POST", "/create-group", "/create-group", {"data": {
+            "group_name": "Plan Check", "user_names": ["Plan Check A", "Plan Check B"],
+            "user_emails": ["plan-check-a@example.com", f"plan-check-{group_id}@example.com"],
+        }}),
+        ("POST", "/api/groups", "/api/groups", {"json": {
+            "name": "Plan Check API",
+            "users": [{"name": "Plan Check A", "email": "plan-check-a@example.com"}],
+        }}),
+        ("POST", "/add-user-to-group/{group_id}", f"/add-user-to-group/{group_id}", {"data": {
+            "user_name": "Plan Check", "user_email": f"plan-check-{group_id}@example.com",
+        }}),
+        ("POST", "/remove-user-from-group/{group_id}/{user_id}", f"/remove-user-from-group/{group_id}/{member_id}", {}),
+        ("POST", "/delete-group/{group_id}", f"/delete-group/{scratch_ids[0]}", {}),
+        ("DELETE", "/api/groups/{group_id}", f"/api/groups/{scratch_ids[1]}", {}),
+    ]
+
+
+def uncovered(app, covered):
+    """"METHOD path" of every app route not in `covered`, a set of (method, route template)."""
+    missing = []
+    for route in app.routes:
+        path = getattr(route, "path", None)
+        if path in IGNORED_PATHS or path is None:
+            continue
+        for method in sorted(getattr(route, "methods", None) or ()):
+            if method != "HEAD" and (method, path) not in covered:
+                missing.append(f"{method} {path}")
+    return missing
+
+
+def check(client, calls):
+    recorder = StatementRecorder()
+    failures = []
+    # Routes run on the async engine; bulk import and CLI paths use the sync one
+    engines = (engine, async_engine.sync_engine)
+    for target in engines:
+        event.listen(target, "before_cursor_execute", recorder)
+    # A route answered from the cache issues no statements to check
+    cache.enabled = False
+    try:
+        for method, template, path, kwargs in calls:
+            recorder.statements.clear()
+            response = client.request(method, path, allow_redirects=False, **kwargs)
+            if response.status_code >= 400:
+                failures.append(f"{method} {path}: HTTP {response.status_code}")
+                continue
+            statements = list(recorder.statements)
+
+            allowed = ALLOWED_SCANS.get((method, template), set())
+            with engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    conn.exec_driver_sql("SET enable_seqscan = off")
+                for statement, parameters in statements:
+                    tables = scanned_tables(conn, statement, parameters) - allowed
+                    if tables:
+                        failures.append(f"{method} {path}: sequential scan on {', '.join(sorted(tables))}\n    {' '.join(statement.split())}")
+            print(f"{method} {path}: {len(statements)} statement(s) checked")
+    finally:
+        cache.enabled = True
+        for target in engines:
+            event.remove(target, "before_cursor_execute", recorder)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", action="store_true", help="insert synthetic data first")
+    parser.add_argument("--create-tables", action="store_true", help="create missing tables (scratch SQLite)")
+    args = parser.parse_args(argv)
+
+    # Imported late: the app module needs the templates directory and TestClient needs requests
+    from fastapi.testclient import TestClient
+    from .main import app
+
+    if args.create_tables:
+        Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        if args.seed:
+            seeder.seed(db, groups=20, users_per_group=8, expenses_per_group=100)
+        group_id = db.query(models.Group.id).filter(
+            models.Group.deleted_at.is_(None)
+        ).order_by(models.Group.id.desc()).limit(1).scalar()
+        if group_id is None:
+            print("no groups to check against; rerun with --seed")
+            return 1
+        members = [user.id for user in crud.get_group_members(db, group_id)]
+        if len(members) < 2:
+            print(f"group {group_id} needs at least two members")
+            return 1
+        scratch_ids = seeder.seed(db, groups=2, users_per_group=2, expenses_per_group=3)
+        # Run directly, as claim() could hand out an older queued export
+        job = jobs.enqueue(db, "export_ledger", {"group_id": group_id})
+        db.commit()
+        export_job = job.id
+        jobs.run(db, job)
+    finally:
+        db.close()
+
+    calls = route_calls(group_id, members[0], members[-1], scratch_ids, export_job)
+    missing = uncovered(app, {(method, template) for method, template, _, _ in calls})
+    failures = [f"{route}: not in route_calls" for route in missing]
+    failures += check(TestClient(app), calls)
+    for failure in failures:
+        print("FAIL", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
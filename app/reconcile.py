@@ -0,0 +1,100 @@
+"""Rebuild the materialized net_balances table from balances and report drift.
+
+Usage:
+    python -m app.reconcile            # report drift and rewrite net_balances
+    python -m app.reconcile --dry-run  # only report drift
+
+user_summaries is then checked the same way against group_memberships and
+the rebuilt net_balances.
+"""
+import argparse
+import sys
+
+from . import models, crud, money
+from .database import SessionLocal
+
+
+def find_drift(db):
+    expected = crud.computed_net_balances(db)
+    stored = {
+        (row.group_id, row.user_id): row.net
+        for row in db.query(models.NetBalance).all()
+    }
+
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        # Integer cents, so any difference at all is real drift
+        want = expected.get(key, 0)
+        have = stored.get(key, 0)
+        if want != have:
+            drift.append((key[0], key[1], have, want))
+    return expected, drift
+
+
+def find_summary_drift(db):
+    expected = crud.computed_user_summaries(db)
+    stored = {
+        row.user_id: (row.group_count, row.net)
+        for row in db.query(models.UserSummary).all()
+    }
+    drift = [
+        (user_id, stored.get(user_id, (0, 0)), expected.get(user_id, (0, 0)))
+        for user_id in sorted(set(expected) | set(stored))
+        if expected.get(user_id, (0, 0)) != stored.get(user_id, (0, 0))
+    ]
+    return expected, drift
+
+
+def rebuild_summaries(db, expected):
+    db.query(models.UserSummary).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.UserSummary, [
+        {"user_id": user_id, "group_count": group_count, "net": net}
+        for user_id, (group_count, net) in expected.items()
+    ])
+
+
+def rebuild(db, expected):
+    db.query(models.NetBalance).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.NetBalance, [
+        {"group_id": group_id, "user_id": user_id, "net": net}
+        for (group_id, user_id), net in expected.items()
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="report drift without rewriting the table")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        expected, drift = find_drift(db)
+        for group_id, user_id, have, want in drift:
+            print(f"group {group_id} user {user_id}: stored {money.format_cents(have)}, expected {money.format_cents(want)}")
+        print(f"{len(drift)} drifted row(s)")
+
+        if not args.dry_run:
+            rebuild(db, expected)
+            db.flush()
+            print(f"rebuilt net_balances ({len(expected)} rows)")
+
+        summaries, summary_drift = find_summary_drift(db)
+        for user_id, (have_groups, have), (want_groups, want) in summary_drift:
+            print(
+                f"user {user_id}: stored {have_groups} group(s) {money.format_cents(have)}, "
+                f"expected {want_groups} group(s) {money.format_cents(want)}"
+            )
+        print(f"{len(summary_drift)} drifted user summary row(s)")
+
+        if not args.dry_run:
+            rebuild_summaries(db, summaries)
+            db.commit()
+            print(f"rebuilt user_summaries ({len(summaries)} rows)")
+    finally:
+        db.close()
+
+    return 1 if drift or summary_drift else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Route read-only requests to read replicas.
+
+DATABASE_REPLICA_URLS is a comma-separated list of replica URLs, written
+like DATABASE_URL. Read-only GET routes take their session from
+get_read_db, which hands out the healthy replicas round-robin. Writes,
+job status and the live stream's snapshot always use the primary, and so
+does everything when no replicas are configured.
+
+Every DB_REPLICA_CHECK_SECONDS a background task checks each replica. A
+replica drops out of the rotation if it cannot be reached, if its replay
+lags the primary by more than DB_REPLICA_MAX_LAG_SECONDS, or if its
+connection drops during a request. It rejoins once a check passes. Reads
+fall back to the primary while no replica is healthy.
+
+A replica can trail the primary, so a client may not see its own write on
+the page it is redirected to. READ_YOUR_WRITES_SECONDS > 0 opts into
+stickiness. Every successful POST, PUT, PATCH or DELETE then sets a
+`db_primary` cookie for that many seconds, and requests that carry it
+read from the primary. Cache entries loaded from a replica are kept for
+at most DB_REPLICA_MAX_LAG_SECONDS (app.cache), so a lagging read does
+not outlive the lag.
+"""
+import asyncio
+import itertools
+import logging
+import os
+
+from fastapi import Request
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+from . import database, instrumentation
+
+REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+CHECK_SECONDS = float(os.getenv("DB_REPLICA_CHECK_SECONDS", "5"))
+MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "10"))
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "0"))
+COOKIE = "db_primary"
+# Session.info key holding the name of the replica a session reads from
+REPLICA = "replica"
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Seconds of replay lag; a replica that has replayed everything it received
+# counts as current even when the primary has been idle for a while
+LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    def __init__(self, name, url):
+        self.name = name
+        if url.startswith("postgres://"):
+            url = url.replace("postgres://", "postgresql://", 1)
+        self.url = url
+        self.healthy = True
+        self.lag = None
+        self._watched = None
+
+    @property
+    def engine(self):
+        engine = database.get_async_engine(self.url)
+        # A fresh engine after a fork needs the listener again
+        if self._watched is not engine:
+            event.listen(engine.sync_engine, "handle_error", self._on_error)
+            self._watched = engine
+        return engine
+
+    def mark(self, healthy, reason=None):
+        if healthy != self.healthy:
+            url = make_url(self.url).render_as_string(hide_password=True)
+            if healthy:
+                logger.info("replica %s (%s) is back in rotation", self.name, url)
+            else:
+                logger.warning("replica %s (%s) left rotation: %s", self.name, url, reason)
+        self.healthy = healthy
+
+    def _on_error(self, context):
+        # Connection refused or dropped; the next passing check restores it
+        if context.is_disconnect or context.connection is None:
+            self.mark(False, "connection lost")
+
+    async def _lag(self):
+        async with self.engine.connect() as conn:
+            if conn.dialect.name != "postgresql":
+                await conn.execute(text("SELECT 1"))
+                return 0.0
+            return float((await conn.execute(LAG_QUERY)).scalar())
+
+    async def check(self):
+        try:
+            self.lag = await asyncio.wait_for(self._lag(), database.READY_TIMEOUT)
+        except Exception as exc:
+            self.lag = None
+            self.mark(False, f"check failed: {exc!r}")
+            return
+        if self.lag > MAX_LAG_SECONDS:
+            self.mark(False, f"{self.lag:.1f}s behind")
+        else:
+            self.mark(True)
+
+
+class ReplicaRouter:
+    def __init__(self, urls):
+        self.replicas = [Replica(str(number), url) for number, url in enumerate(urls, 1)]
+        self._turn = itertools.count()
+        self._task = None
+
+    def choose(self, request=None):
+        """The replica to read from, or None for the primary."""
+        if request is not None and READ_YOUR_WRITES_SECONDS and request.cookies.get(COOKIE):
+            return None
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._turn) % len(healthy)]
+
+    def status(self):
+        return [{"name": replica.name, "healthy": replica.healthy, "lag": replica.lag} for replica in self.replicas]
+
+    async def check(self):
+        await asyncio.gather(*(replica.check() for replica in self.replicas))
+
+    async def _check_forever(self):
+        while True:
+            await asyncio.sleep(CHECK_SECONDS)
+            await self.check()
+
+    async def start(self):
+        if not self.replicas or self._task is not None:
+            return
+        # Checked once up front so a dead replica never gets the first requests
+        await self.check()
+        self._task = asyncio.get_running_loop().create_task(self._check_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+router = ReplicaRouter(REPLICA_URLS)
+
+
+async def get_read_db(request: Request):
+    """Session for read-only routes: a healthy replica when there is one, otherwise the primary."""
+    replica = router.choose(request)
+    instrumentation.registry.record_read("primary" if replica is None else f"replica{replica.name}")
+    if replica is None:
+        async with database.AsyncSessionLocal() as db:
+            yield db
+        return
+    async with database.AsyncSessionLocal(bind=replica.engine) as db:
+        db.sync_session.info[REPLICA] = replica.name
+        yield db
+
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware that sets the db_primary cookie on successful writes."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http" or scope["method"] in SAFE_METHODS
+            or not READ_YOUR_WRITES_SECONDS or not router.replicas
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        cookie = f"{COOKIE}=1; Max-Age={READ_YOUR_WRITES_SECONDS}; Path=/; HttpOnly; SameSite=Lax".encode()
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"set-cookie", cookie)])
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
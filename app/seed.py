@@ -0,0 +1,87 @@
+"""Seed synthetic groups, members and expenses through the normal write path.
+
+Usage:
+    python -m app.seed [--groups 10] [--users 8] [--expenses 50] [--days 365] [--create-tables]
+
+Writes to the database named by DATABASE_URL (SQLite or PostgreSQL), so point
+it at a scratch database. The same seed always produces the same amounts,
+splits and timestamps relative to now.
+"""
+import argparse
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from . import models, crud
+from .database import Base, SessionLocal, engine
+
+
+def random_percentages(rng, count):
+    # Whole percentages that always add up to exactly 100
+    cuts = sorted(rng.sample(range(1, 100), count - 1)) if count > 1 else []
+    bounds = [0] + cuts + [100]
+    return [float(high - low) for low, high in zip(bounds, bounds[1:])]
+
+
+def seed(db, groups=10, users_per_group=8, expenses_per_group=50, seed=0, days=365):
+    """Create the requested data and return the new group ids."""
+    rng = random.Random(seed)
+    run = uuid.uuid4().hex[:8]
+    now = datetime.utcnow()
+    group_ids = []
+
+    for g in range(groups):
+        group = models.Group(name=f"Group {run}-{g}")
+        db.add(group)
+        users = [
+            models.User(name=f"User {g}-{u}", email=f"user-{run}-{g}-{u}@example.com")
+            for u in range(users_per_group)
+        ]
+        db.add_all(users)
+        db.flush()
+
+        crud.add_members(db, group.id, [user.id for user in users])
+
+        for e in range(expenses_per_group):
+            split_type = rng.choice(["equal", "percent"])
+            percentages = random_percentages(rng, len(users)) if split_type == "percent" else None
+            crud.create_expense(
+                db,
+                group.id,
+                rng.choice(users).id,
+                rng.randint(100, 50000),
+                f"Expense {e}",
+                split_type,
+                percentages,
+                created_at=now - timedelta(seconds=rng.randint(0, days * 86400))
+            )
+
+        db.commit()
+        group_ids.append(group.id)
+
+    return group_ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--users", type=int, default=8, help="members per group")
+    parser.add_argument("--expenses", type=int, default=50, help="expenses per group")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--days", type=int, default=365, help="spread created_at over this many days")
+    parser.add_argument("--create-tables", action="store_true", help="create missing tables (scratch SQLite)")
+    args = parser.parse_args(argv)
+
+    if args.create_tables:
+        Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        group_ids = seed(db, args.groups, args.users, args.expenses, args.seed, args.days)
+    finally:
+        db.close()
+    print(f"seeded {len(group_ids)} groups ({group_ids[0]}..{group_ids[-1]})" if group_ids else "nothing to seed")
+
+
+if __name__ == "__main__":
+    main()
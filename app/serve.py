@@ -0,0 +1,161 @@
+"""Production entry point: one listening socket served by several worker processes.
+
+Usage:
+    python -m app.serve [--host 0.0.0.0] [--port 8000] [--workers N] [--no-preload]
+
+The parent binds the socket, imports app.main and compiles the templates
+once (--preload, the default), then forks --workers processes that all
+accept on the inherited socket. Forked workers share the parent's imported
+code and templates copy-on-write, so each starts in milliseconds and adds
+little memory. --no-preload makes every worker import the app itself after
+the fork.
+
+Nothing opens a database connection at import: each worker creates its
+own engines on first use, and any engine that did exist in the parent is
+dropped in the child (app.database). The startup hooks (job worker threads,
+the broadcast listener) run in every worker, after the fork.
+
+WEB_CONCURRENCY sets the default worker count; without it there is one
+worker per CPU this process may run on. Workers that exit are replaced.
+SIGTERM or SIGINT lets the workers finish in-flight requests and exit; a
+second signal kills them.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+BACKLOG = 2048
+# A worker that dies sooner than this after starting is restarted with a
+# delay, so a broken deployment does not fork in a tight loop
+MIN_UPTIME_SECONDS = 1.0
+
+logger = logging.getLogger("app.serve")
+
+
+def default_workers():
+    configured = os.getenv("WEB_CONCURRENCY")
+    if configured:
+        return int(configured)
+    # Honours CPU affinity (taskset, cpusets), unlike os.cpu_count()
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def bind(host, port):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload():
+    """Import the app and compile every template before forking."""
+    from . import broadcast, main
+    from .cache import MemoryBackend, cache
+
+    for name in main.templates.env.list_templates():
+        main.templates.get_template(name)
+    return {
+        "memory cache": isinstance(cache.backend, MemoryBackend),
+        "memory broadcast": broadcast.hub.name == "memory",
+    }
+
+
+def run_worker(sock, args):
+    # uvicorn installs its own handlers on the worker's event loop
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(
+        "app.main:app", log_level=args.log_level, access_log=args.access_log, proxy_headers=True,
+        # Log through the root handler set up in main() rather than uvicorn's own
+        log_config=None,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(sock, args):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(sock, args)
+        except BaseException:
+            logger.exception("worker %d failed", os.getpid())
+            code = 1
+        finally:
+            logging.shutdown()
+            os._exit(code)
+    return pid
+
+
+def serve(args):
+    sock = bind(args.host, args.port)
+    if args.preload:
+        in_process = preload()
+        if args.workers > 1:
+            for name, per_worker in in_process.items():
+                if per_worker:
+                    logger.warning("%s is per process; %d workers will not share it", name, args.workers)
+
+    workers = {}
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        forward = signal.SIGTERM if len(stopping) == 1 else signal.SIGKILL
+        for pid in workers:
+            try:
+                os.kill(pid, forward)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(args.workers):
+        workers[spawn(sock, args)] = time.monotonic()
+    logger.info("serving on %s:%d with %d workers (pid %d)", args.host, args.port, args.workers, os.getpid())
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = workers.pop(pid, None)
+        if started is None or stopping:
+            continue
+        logger.warning("worker %d exited with status %d; starting another", pid, os.waitstatus_to_exitcode(status))
+        if time.monotonic() - started < MIN_UPTIME_SECONDS:
+            time.sleep(MIN_UPTIME_SECONDS)
+        workers[spawn(sock, args)] = time.monotonic()
+    sock.close()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--no-preload", dest="preload", action="store_false",
+                        help="import the app in each worker instead of once before forking")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", dest="access_log", action="store_false")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s:     %(message)s")
+    return serve(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
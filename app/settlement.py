@@ -0,0 +1,111 @@
+"""Debt simplification: turn a group's net balances into a short list of transfers.
+
+Net balances map user_id -> integer cents, positive when the user is owed
+money and negative when they owe. The sum over a group is zero. Each transfer
+returned is a (debtor_id, creditor_id, cents) tuple, so matching is exact.
+"""
+import heapq
+
+# Up to this many non-zero members the exact solver is cheap (O(2^n * n))
+EXACT_LIMIT = 12
+
+
+def _balanced(net_balances):
+    cents = {user_id: int(amount) for user_id, amount in net_balances.items()}
+
+    # Integer balances always sum to zero; if a drifted row ever says
+    # otherwise, book the residue against the largest position so it balances.
+    residue = sum(cents.values())
+    if residue:
+        largest = max(cents, key=lambda user_id: abs(cents[user_id]))
+        cents[largest] -= residue
+
+    return {user_id: value for user_id, value in cents.items() if value}
+
+
+def _greedy(cents):
+    # Max-heaps (negated) of what each creditor is owed and each debtor owes.
+    # Matching the two largest positions each round settles at least one of
+    # them, so a group of n non-zero members needs at most n - 1 transfers.
+    creditors = [(-amount, user_id) for user_id, amount in cents.items() if amount > 0]
+    debtors = [(amount, user_id) for user_id, amount in cents.items() if amount < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        owed, creditor = heapq.heappop(creditors)
+        owes, debtor = heapq.heappop(debtors)
+        amount = min(-owed, -owes)
+        transfers.append((debtor, creditor, amount))
+
+        if -owed > amount:
+            heapq.heappush(creditors, (owed + amount, creditor))
+        if -owes > amount:
+            heapq.heappush(debtors, (owes + amount, debtor))
+    return transfers
+
+
+def _zero_sum_groups(cents):
+    # Minimum transfers = members - (max number of disjoint zero-sum subgroups),
+    # since a zero-sum subgroup of k members settles internally in k - 1 moves.
+    users = list(cents)
+    amounts = [cents[user_id] for user_id in users]
+    n = len(users)
+    full = (1 << n) - 1
+
+    subset_sum = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        low = (mask & -mask).bit_length() - 1
+        subset_sum[mask] = subset_sum[mask & (mask - 1)] + amounts[low]
+
+    best = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        bits = mask
+        value = 0
+        while bits:
+            bit = bits & -bits
+            value = max(value, best[mask ^ bit])
+            bits ^= bit
+        best[mask] = value + (1 if subset_sum[mask] == 0 else 0)
+
+    # Walk back down the optimal chain; every zero-sum mask on it closes a group
+    groups = []
+    mask = full
+    boundary = full
+    while mask:
+        if subset_sum[mask] == 0 and mask != boundary:
+            groups.append(boundary ^ mask)
+            boundary = mask
+        target = best[mask] - (1 if subset_sum[mask] == 0 else 0)
+        bits = mask
+        while bits:
+            bit = bits & -bits
+            if best[mask ^ bit] == target:
+                mask ^= bit
+                break
+            bits ^= bit
+    groups.append(boundary)
+
+    return [{users[i]: amounts[i] for i in range(n) if group >> i & 1} for group in groups]
+
+
+def greedy_transfers(net_balances):
+    """Near-minimal transfers via largest-debtor/largest-creditor matching."""
+    return _greedy(_balanced(net_balances))
+
+
+def exact_transfers(net_balances):
+    """Provably minimal transfers; exponential, so only for small groups."""
+    transfers = []
+    for group in _zero_sum_groups(_balanced(net_balances)):
+        transfers.extend(_greedy(group))
+    return transfers
+
+
+def settle(net_balances, exact_limit=EXACT_LIMIT):
+    """Pick the exact solver for small groups and the greedy matcher otherwise."""
+    nonzero = sum(1 for amount in net_balances.values() if amount)
+    if nonzero <= exact_limit:
+        return exact_transfers(net_balances)
+    return greedy_transfers(net_balances)
@@ -0,0 +1,177 @@
+"""Month-start balance snapshots for "balances as of" queries.
+
+Usage:
+    python -m app.snapshots build [--group ID]
+
+Historical balances put every expense at its created_at (so backdated
+imports land where they belong), opening balances and member removals at the
+time they were journalled. A snapshot holds a group's pair balances from
+everything dated before the start of a month; an as-of query loads the
+latest snapshot at or before the requested time and folds in only what is
+dated between the two, so it never reads more than about a month of
+history.
+
+`build` rolls each group forward from its latest snapshot to the current
+month. Writes dated before an existing snapshot drop it and every later one
+(crud.invalidate_snapshots), and the next build recreates them.
+"""
+import argparse
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import BigInteger, cast, func, select
+
+from . import models, crud
+from .database import SessionLocal
+
+
+def month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(moment: datetime) -> datetime:
+    if moment.month == 12:
+        return moment.replace(year=moment.year + 1, month=1)
+    return moment.replace(month=moment.month + 1)
+
+
+def _pair_deltas(db, group_id, start, end):
+    """Summed (debtor, creditor, cents) from expenses and opening events dated in [start, end)."""
+    expenses = models.Expense.__table__
+    splits = models.ExpenseSplit.__table__
+    events = models.LedgerEvent.__table__
+
+    expense_pairs = select(
+        splits.c.user_id, expenses.c.added_by, cast(func.sum(splits.c.amount), BigInteger)
+    ).select_from(
+        expenses.join(splits, splits.c.expense_id == expenses.c.id)
+    ).where(
+        expenses.c.group_id == group_id, splits.c.user_id != expenses.c.added_by
+    ).group_by(splits.c.user_id, expenses.c.added_by)
+
+    opening_pairs = select(
+        events.c.user_id, events.c.counterparty_id, cast(func.sum(events.c.amount), BigInteger)
+    ).where(
+        events.c.group_id == group_id, events.c.kind == crud.OPENING_EVENT
+    ).group_by(events.c.user_id, events.c.counterparty_id)
+
+    entries = []
+    for statement, time_column in ((expense_pairs, expenses.c.created_at), (opening_pairs, events.c.created_at)):
+        if start is not None:
+            statement = statement.where(time_column >= start)
+        entries.extend(db.execute(statement.where(time_column < end)).all())
+    return entries
+
+
+def roll_forward(db, group_id, pairs, start, end):
+    """Pair balances at `end`, given `pairs` at `start` (None for the beginning of time)."""
+    pairs = defaultdict(int, pairs)
+    events = models.LedgerEvent.__table__
+    removals = select(events.c.created_at, events.c.user_id).where(
+        events.c.group_id == group_id,
+        events.c.kind == crud.MEMBER_REMOVED_EVENT,
+        events.c.created_at < end
+    ).order_by(events.c.created_at, events.c.id)
+    if start is not None:
+        removals = removals.where(events.c.created_at >= start)
+
+    # A removal drops whatever the member's pairs hold at that moment, so
+    # fold up to each one before applying it
+    cursor = start
+    for removed_at, user_id in db.execute(removals).all():
+        for debtor, creditor, amount in _pair_deltas(db, group_id, cursor, removed_at):
+            pairs[(debtor, creditor)] += amount
+        for pair in [pair for pair in pairs if user_id in pair]:
+            del pairs[pair]
+        cursor = removed_at
+
+    for debtor, creditor, amount in _pair_deltas(db, group_id, cursor, end):
+        pairs[(debtor, creditor)] += amount
+    return {pair: amount for pair, amount in pairs.items() if amount}
+
+
+def latest_snapshot(db, group_id, at=None):
+    """(taken_at, {(debtor, creditor): cents}) of the newest snapshot at or before `at`, or (None, {})."""
+    query = db.query(models.BalanceSnapshot).filter(models.BalanceSnapshot.group_id == group_id)
+    if at is not None:
+        query = query.filter(models.BalanceSnapshot.taken_at <= at)
+    snapshot = query.order_by(models.BalanceSnapshot.taken_at.desc()).first()
+    if snapshot is None:
+        return None, {}
+    lines = db.query(
+        models.BalanceSnapshotLine.user_id, models.BalanceSnapshotLine.owe_to, models.BalanceSnapshotLine.amount
+    ).filter(models.BalanceSnapshotLine.snapshot_id == snapshot.id).all()
+    return snapshot.taken_at, {(debtor, creditor): amount for debtor, creditor, amount in lines}
+
+
+def balances_as_of(db, group_id, as_of):
+    """(snapshot taken_at or None, {(debtor, creditor): cents}) for everything dated before `as_of`."""
+    taken_at, pairs = latest_snapshot(db, group_id, as_of)
+    return taken_at, roll_forward(db, group_id, pairs, taken_at, as_of)
+
+
+def first_activity(db, group_id):
+    expense_at = db.query(func.min(models.Expense.created_at)).filter(models.Expense.group_id == group_id).scalar()
+    event_at = db.query(func.min(models.LedgerEvent.created_at)).filter(
+        models.LedgerEvent.group_id == group_id, models.LedgerEvent.kind == crud.OPENING_EVENT
+    ).scalar()
+    dates = [moment for moment in (expense_at, event_at) if moment is not None]
+    return min(dates) if dates else None
+
+
+def build(db, group_id, now=None):
+    """Take every missing month-start snapshot for the group; returns how many were written."""
+    current = month_start(now or datetime.utcnow())
+    taken_at, pairs = latest_snapshot(db, group_id)
+    if taken_at is None:
+        first = first_activity(db, group_id)
+        if first is None:
+            return 0
+        boundary = next_month(month_start(first))
+    else:
+        boundary = next_month(taken_at)
+
+    written = 0
+    while boundary <= current:
+        pairs = roll_forward(db, group_id, pairs, taken_at, boundary)
+        snapshot = models.BalanceSnapshot(group_id=group_id, taken_at=boundary)
+        db.add(snapshot)
+        db.flush()
+        if pairs:
+            db.execute(models.BalanceSnapshotLine.__table__.insert(), [
+                {"snapshot_id": snapshot.id, "user_id": debtor, "owe_to": creditor, "amount": amount}
+                for (debtor, creditor), amount in pairs.items()
+            ])
+        taken_at = boundary
+        boundary = next_month(boundary)
+        written += 1
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="take missing month-start snapshots")
+    build_parser.add_argument("--group", type=int, help="only this group (default: all)")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.group is not None:
+            group_ids = [args.group]
+        else:
+            group_ids = [group_id for group_id, in db.query(models.Group.id).order_by(models.Group.id)]
+        total = 0
+        for group_id in group_ids:
+            total += build(db, group_id)
+            # One transaction per group keeps locks short
+            db.commit()
+        print(f"wrote {total} snapshot(s) for {len(group_ids)} group(s)")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Serialized, retried write transactions on a group.
+
+Each write runs as one transaction that starts with crud.lock_group. That
+UPDATE of the group's version row holds the row lock until commit, so
+writers to the same group queue up behind it, and the membership list and
+balances a write reads cannot change under it. A member removal can no
+longer interleave with an expense split across that member. Writers to
+different groups never wait on each other.
+
+Conflicts that go away on a second try are retried with jittered backoff,
+up to WRITE_ATTEMPTS times: PostgreSQL serialization failures, deadlocks
+and lock timeouts, and SQLite's "database is locked". Every retry is
+counted in db_write_retries_total on /metrics. Each committed write is
+published to the group's live viewers (app.broadcast).
+"""
+import asyncio
+import os
+import random
+import time
+
+from sqlalchemy.exc import DBAPIError
+
+from . import broadcast, crud, instrumentation
+from .cache import cache
+
+ATTEMPTS = int(os.getenv("WRITE_ATTEMPTS", "5"))
+
+# serialization_failure, deadlock_detected, lock_not_available
+RETRYABLE_SQLSTATES = {"40001", "40P01", "55P03"}
+
+
+class GroupNotFound(Exception):
+    pass
+
+
+def is_retryable(exc):
+    if not isinstance(exc, DBAPIError):
+        return False
+    if getattr(exc.orig, "pgcode", None) in RETRYABLE_SQLSTATES:
+        return True
+    return "database is locked" in str(exc.orig)
+
+
+def backoff(attempt):
+    # Full jitter keeps retrying writers from colliding again in lockstep
+    return random.uniform(0, 0.01 * 2 ** attempt)
+
+
+async def write_group(db, group_id, write, *args, **kwargs):
+    """Run write(sync_session, *args, **kwargs) under the group's lock and commit it.
+
+    Returns what `write` returns and invalidates the group's cache entries.
+    Raises GroupNotFound for a missing or deleted group; any exception from
+    `write` rolls the transaction back and propagates.
+    """
+    for attempt in range(1, ATTEMPTS + 1):
+        try:
+            if not await db.run_sync(crud.lock_group, group_id):
+                raise GroupNotFound(group_id)
+            result = await db.run_sync(write, *args, **kwargs)
+            await db.run_sync(broadcast.hub.prepare)
+            await db.commit()
+        except Exception as exc:
+            await db.rollback()
+            broadcast.hub.discard(db.sync_session)
+            if attempt == ATTEMPTS or not is_retryable(exc):
+                raise
+            instrumentation.registry.record_write_retry()
+            await asyncio.sleep(backoff(attempt))
+            continue
+        cache.invalidate_group(group_id)
+        broadcast.hub.deliver(db.sync_session)
+        return result
+
+
+def write_group_sync(db, group_id, write, *args, **kwargs):
+    """write_group for sync sessions (bulk import, jobs)."""
+    for attempt in range(1, ATTEMPTS + 1):
+        try:
+            if not crud.lock_group(db, group_id):
+                raise GroupNotFound(group_id)
+            result = write(db, *args, **kwargs)
+            broadcast.hub.prepare(db)
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            broadcast.hub.discard(db)
+            if attempt == ATTEMPTS or not is_retryable(exc):
+                raise
+            instrumentation.registry.record_write_retry()
+            time.sleep(backoff(attempt))
+            continue
+        cache.invalidate_group(group_id)
+        broadcast.hub.deliver(db)
+        return result
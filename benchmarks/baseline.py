@@ -0,0 +1,36 @@
+"""JSON baselines for benchmark results.
+
+A baseline is a flat {metric: value} mapping saved from a known-good run.
+compare() flags every metric that got worse by more than the tolerance, with
+a small absolute slack so sub-millisecond noise never fails a run.
+"""
+import json
+
+DEFAULT_TOLERANCE = 0.25
+
+
+def save(path, metrics):
+    with open(path, "w") as f:
+        json.dump(metrics, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, metrics, tolerance=DEFAULT_TOLERANCE, slack=1.0, higher_is_better=()):
+    """Return one message per regressed metric; metrics missing from either side are skipped."""
+    regressions = []
+    for name, old in sorted(baseline.items()):
+        new = metrics.get(name)
+        if new is None:
+            continue
+        if name in higher_is_better:
+            worse = new < old * (1 - tolerance)
+        else:
+            worse = new > old * (1 + tolerance) + slack
+        if worse:
+            regressions.append(f"{name}: {old:.2f} -> {new:.2f}")
+    return regressions
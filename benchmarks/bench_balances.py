@@ -0,0 +1,113 @@
+"""Benchmark ORM hydration against the tuple aggregate for balance summaries.
+
+Usage:
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.bench_balances [--rows 1000000]
+
+Fills a scratch database with about --rows pairwise balance rows, then sums
+every group's net balances twice, --batch groups at a time: once by loading
+Balance objects and adding them up in Python, and once with
+crud.aggregate_net_balances. Both must agree. Writes to DATABASE_URL, so
+point it at a scratch database.
+"""
+import argparse
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+from app import crud, models
+from app.database import Base, SessionLocal, engine
+
+INSERT_CHUNK = 50000
+
+
+def fill(db, rows, members, rng):
+    """Insert groups of `members` users with a balance row for every ordered pair."""
+    pairs_per_group = members * (members - 1)
+    groups = max(1, rows // pairs_per_group)
+    run = uuid.uuid4().hex[:8]
+
+    db.execute(models.Group.__table__.insert(), [{"name": f"Bench {run}-{g}"} for g in range(groups)])
+    db.execute(models.User.__table__.insert(), [
+        {"name": f"Bench {g}-{u}", "email": f"bench-{run}-{g}-{u}@example.com"}
+        for g in range(groups) for u in range(members)
+    ])
+    group_ids = [row[0] for row in db.query(models.Group.id)
+                 .filter(models.Group.name.like(f"Bench {run}-%")).order_by(models.Group.id)]
+    user_ids = [row[0] for row in db.query(models.User.id)
+                .filter(models.User.email.like(f"bench-{run}-%")).order_by(models.User.id)]
+
+    batch = []
+    for g, group_id in enumerate(group_ids):
+        users = user_ids[g * members:(g + 1) * members]
+        for debtor in users:
+            for creditor in users:
+                if debtor != creditor:
+                    batch.append({
+                        "group_id": group_id, "user_id": debtor, "owe_to": creditor,
+                        "amount": rng.randint(1, 100000),
+                    })
+        if len(batch) >= INSERT_CHUNK:
+            db.execute(models.Balance.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.execute(models.Balance.__table__.insert(), batch)
+    db.commit()
+    return group_ids
+
+
+def orm_nets(db, group_ids):
+    nets = defaultdict(int)
+    for balance in db.query(models.Balance).filter(models.Balance.group_id.in_(group_ids)).all():
+        nets[(balance.group_id, balance.owe_to)] += balance.amount
+        nets[(balance.group_id, balance.user_id)] -= balance.amount
+    return nets
+
+
+def tuple_nets(db, group_ids):
+    return {(group_id, user_id): net for group_id, user_id, net in crud.aggregate_net_balances(db, group_ids)}
+
+
+def sweep(db, fn, group_ids, batch):
+    result = {}
+    start = time.perf_counter()
+    for i in range(0, len(group_ids), batch):
+        result.update(fn(db, group_ids[i:i + batch]))
+        # Drop hydrated objects so each batch starts from an empty identity map
+        db.expunge_all()
+    return time.perf_counter() - start, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--members", type=int, default=32, help="members per group")
+    parser.add_argument("--batch", type=int, default=100, help="groups per query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        group_ids = fill(db, args.rows, args.members, random.Random(args.seed))
+        rows = len(group_ids) * args.members * (args.members - 1)
+        print(f"filled {rows} balance rows in {len(group_ids)} groups in {time.perf_counter() - start:.1f}s")
+
+        orm_time, orm_result = sweep(db, orm_nets, group_ids, args.batch)
+        tuple_time, tuple_result = sweep(db, tuple_nets, group_ids, args.batch)
+    finally:
+        db.close()
+
+    print(f"ORM hydration:   {orm_time:.2f}s ({rows / orm_time:,.0f} rows/s)")
+    print(f"tuple aggregate: {tuple_time:.2f}s ({rows / tuple_time:,.0f} rows/s), {orm_time / tuple_time:.1f}x faster")
+
+    if orm_result != tuple_result:
+        print("FAIL: the two paths disagree")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Benchmark the bulk expense import endpoint.
+
+Usage:
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.bench_bulk_import [--rows 50000]
+
+Seeds one group, posts an NDJSON file of --rows expenses to
+POST /group/{group_id}/expenses/bulk and reports rows per second.
+Writes to DATABASE_URL, so point it at a scratch database.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+from app import crud, seed as seeder
+from app.database import Base, SessionLocal, engine
+from app.main import app
+
+
+def ndjson_body(rows, member_ids, rng):
+    lines = []
+    for i in range(rows):
+        record = {
+            "added_by": rng.choice(member_ids),
+            "amount": round(rng.uniform(1, 500), 2),
+            "description": f"Imported {i}",
+            "split_type": "equal",
+        }
+        if i % 2:
+            record["split_type"] = "percent"
+            record["percentages"] = seeder.random_percentages(rng, len(member_ids))
+        lines.append(json.dumps(record))
+    return "\n".join(lines).encode()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        group_id = seeder.seed(db, groups=1, users_per_group=args.members, expenses_per_group=0)[0]
+        member_ids = [user.id for user in crud.get_group_members(db, group_id)]
+    finally:
+        db.close()
+
+    body = ndjson_body(args.rows, member_ids, random.Random(args.seed))
+    client = TestClient(app)
+
+    start = time.perf_counter()
+    response = client.post(
+        f"/group/{group_id}/expenses/bulk",
+        data=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    elapsed = time.perf_counter() - start
+
+    report = response.json()
+    print(f"imported {report['imported']} rows ({report['failed']} failed) in {elapsed:.2f}s: {report['imported'] / elapsed:,.0f} rows/s")
+    return 0 if response.status_code == 200 and not report["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
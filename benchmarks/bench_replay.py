@@ -0,0 +1,85 @@
+"""Benchmark rebuilding the balance projection from the ledger journal.
+
+Usage:
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.bench_replay [--events 1000000]
+
+Appends --events expense events across --groups groups through
+crud.record_expenses, snapshots the incrementally maintained balances, then
+times `app.journal.replay` and checks it rebuilt exactly the same rows.
+Writes to DATABASE_URL, so point it at a scratch database.
+"""
+import argparse
+import random
+import sys
+import time
+
+from app import crud, journal, models, seed as seeder
+from app.database import Base, SessionLocal, engine
+
+CHUNK = 5000
+
+
+def append_events(db, group_ids, members, events, rng):
+    per_group = events // len(group_ids)
+    for group_id in group_ids:
+        member_ids = members[group_id]
+        written = 0
+        while written < per_group:
+            size = min(CHUNK, per_group - written)
+            expenses = []
+            for _ in range(size):
+                amount = rng.randint(100, 50000)
+                expenses.append({
+                    "added_by": rng.choice(member_ids),
+                    "amount": amount,
+                    "description": "Replay bench",
+                    "split_type": "equal",
+                    "shares": crud.split_shares(member_ids, amount, "equal"),
+                })
+            crud.record_expenses(db, group_id, expenses)
+            db.commit()
+            written += size
+    return per_group * len(group_ids)
+
+
+def snapshot(db):
+    rows = db.query(models.Balance.group_id, models.Balance.user_id, models.Balance.owe_to, models.Balance.amount)
+    return {(group_id, debtor, creditor): amount for group_id, debtor, creditor, amount in rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--members", type=int, default=8, help="members per group")
+    parser.add_argument("--batch", type=int, default=journal.BATCH_SIZE, help="event ids per replay transaction")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        group_ids = seeder.seed(db, args.groups, args.members, 0, args.seed)
+        members = {group_id: [user.id for user in crud.get_group_members(db, group_id)] for group_id in group_ids}
+
+        start = time.perf_counter()
+        appended = append_events(db, group_ids, members, args.events, random.Random(args.seed))
+        print(f"appended {appended} events in {time.perf_counter() - start:.1f}s")
+        expected = snapshot(db)
+
+        start = time.perf_counter()
+        journal.replay(db, args.batch, restart=True, log=lambda message: None)
+        elapsed = time.perf_counter() - start
+        rebuilt = snapshot(db)
+    finally:
+        db.close()
+
+    print(f"replayed {appended} events in {elapsed:.1f}s ({appended / elapsed:,.0f} events/s)")
+    if rebuilt != expected:
+        print("FAIL: the replayed projection differs from the incremental one")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
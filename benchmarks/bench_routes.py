@@ -0,0 +1,239 @@
+"""Benchmark every route in app.main in process.
+
+Usage:
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.bench_routes \
+        [--groups 20 --users 8 --expenses 200] [--iterations 50] [--cold] \
+        [--save-baseline benchmarks/routes.json | --baseline benchmarks/routes.json]
+
+Seeds a fresh data set through app.seed, then calls each route --iterations
+times through FastAPI's TestClient and reports p50/p95 latency and the
+statements issued per call. --cold turns the read-through cache off so the
+database path is measured. Every route registered on the app must appear in
+ROUTES, so new endpoints cannot go unmeasured. Jobs queued by the routes
+are not run (the TestClient never starts the worker pool), so only the
+requests themselves are timed.
+
+--save-baseline writes the p50s and statements per call to a JSON file;
+--baseline compares against one and exits non-zero when a route got slower
+than --tolerance allows or issues more statements per call than it did
+(the statement counts get no tolerance beyond STATEMENT_SLACK).
+Writes to DATABASE_URL, so point it at a scratch database. The group
+listings page from the seeded groups, so whatever else the database holds
+does not change what they issue.
+
+Latency baselines only mean something on the machine that saved them, but
+statement counts are the same anywhere. route_statements.json next to this
+file is committed, and tests/test_bench_routes.py checks every run of the
+test suite against it with STATEMENTS_ARGS. After a change that
+deliberately alters a route's statements, regenerate it with:
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.bench_routes \
+        --statements-only --groups 5 --users 4 --expenses 20 --iterations 3 \
+        --save-baseline benchmarks/route_statements.json
+"""
+import argparse
+import os
+import sys
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import crud, jobs, query_plans, seed as seeder
+from app.cache import cache
+from app.database import Base, SessionLocal, async_engine, engine
+from app.main import app
+
+from . import baseline
+from .load_test import percentile
+
+# Baseline keys for statements per call are the route name plus this
+STATEMENTS_SUFFIX = " statements"
+# Averages may shift by a fraction when a cache miss moves between
+# iterations; one more statement on every call always fails
+STATEMENT_SLACK = 0.5
+
+# The committed statement baseline and the run it was saved from
+STATEMENTS_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "route_statements.json")
+STATEMENTS_ARGS = ["--statements-only", "--groups", "5", "--users", "4", "--expenses", "20", "--iterations", "3"]
+
+
+def make_routes(first_group, group_id, member_ids, scratch_group, export_job):
+    """(method, route template, call) triples; call(i) returns request arguments for iteration i."""
+    payer, leaver = member_ids[0], member_ids[-1]
+    return [
+        ("GET", "/", lambda i: ("GET", f"/?after={first_group - 1}", {})),
+        ("GET", "/create-group", lambda i: ("GET", "/create-group", {})),
+        ("POST", "/create-group", lambda i: ("POST", "/create-group", {"data": {
+            "group_name": f"Bench {i}", "user_names": ["Bench A", "Bench B"],
+            "user_emails": ["bench-a@example.com", "bench-b@example.com"],
+        }})),
+        ("GET", "/add-expense", lambda i: ("GET", "/add-expense", {})),
+        ("POST", "/add-expense", lambda i: ("POST", "/add-expense", {"data": {
+            "group_id": group_id, "added_by": payer, "amount": "12.50",
+            "description": f"Bench {i}", "split_type": "equal",
+        }})),
+        ("POST", "/group/{group_id}/expenses/bulk", lambda i: ("POST", f"/group/{group_id}/expenses/bulk", {
+            "data": f'{{"added_by": {payer}, "amount": "3.10", "split_type": "equal"}}\n'.encode() * 100,
+            "headers": {"Content-Type": "application/x-ndjson"},
+        })),
+        ("POST", "/delete-group/{group_id}", lambda i: ("POST", f"/delete-group/{scratch_group(i)}", {})),
+        ("GET", "/manage-group-users/{group_id}", lambda i: ("GET", f"/manage-group-users/{group_id}", {})),
+        ("POST", "/add-user-to-group/{group_id}", lambda i: ("POST", f"/add-user-to-group/{group_id}", {"data": {
+            "user_name": "Bench Joiner", "user_email": "bench-joiner@example.com",
+        }})),
+        ("POST", "/remove-user-from-group/{group_id}/{user_id}",
+         lambda i: ("POST", f"/remove-user-from-group/{group_id}/{leaver}", {})),
+        ("GET", "/api/group-users/{group_id}", lambda i: ("GET", f"/api/group-users/{group_id}", {})),
+        ("GET", "/group/{group_id}/ledger", lambda i: ("GET", f"/group/{group_id}/ledger", {})),
+        # Only the snapshot event, so the stream ends: measures the per-connect cost
+        ("GET", "/group/{group_id}/stream", lambda i: ("GET", f"/group/{group_id}/stream?events=1", {})),
+        ("GET", "/group/{group_id}/ledger.csv", lambda i: ("GET", f"/group/{group_id}/ledger.csv", {})),
+        ("GET", "/group/{group_id}/ledger.ndjson", lambda i: ("GET", f"/group/{group_id}/ledger.ndjson", {})),
+        ("GET", "/group/{group_id}/settle-up", lambda i: ("GET", f"/group/{group_id}/settle-up", {})),
+        ("GET", "/group/{group_id}/balances",
+         lambda i: ("GET", f"/group/{group_id}/balances?as_of=2030-01-01T00:00:00", {})),
+        ("POST", "/api/groups", lambda i: ("POST", "/api/groups", {"json": {
+            "name": f"Bench API {i}",
+            "users": [{"name": f"Bench {n}", "email": f"bench-{n}@example.com"} for n in range(i, i + 50)],
+        }})),
+        ("DELETE", "/api/groups/{group_id}", lambda i: ("DELETE", f"/api/groups/{scratch_group(i)}", {})),
+        ("GET", "/api/groups", lambda i: ("GET", f"/api/groups?after={first_group - 1}", {})),
+        ("GET", "/api/users/{user_id}/summary", lambda i: ("GET", f"/api/users/{payer}/summary", {})),
+        ("GET", "/api/groups/balances", lambda i: ("GET", f"/api/groups/balances?ids={group_id}", {})),
+        ("GET", "/api/groups/{group_id}/expenses", lambda i: ("GET", f"/api/groups/{group_id}/expenses", {})),
+        ("POST", "/api/groups/{group_id}/settlements",
+         lambda i: ("POST", f"/api/groups/{group_id}/settlements", {"json": {
+             "from_user": member_ids[1], "to_user": payer, "amount": "1.00",
+         }})),
+        ("POST", "/api/jobs", lambda i: ("POST", "/api/jobs", {"json": {
+            "kind": "export_ledger", "params": {"group_id": group_id},
+        }})),
+        ("GET", "/api/jobs/{job_id}", lambda i: ("GET", f"/api/jobs/{export_job}", {})),
+        ("GET", "/api/jobs/{job_id}/download", lambda i: ("GET", f"/api/jobs/{export_job}/download", {})),
+        ("GET", "/api/cache/stats", lambda i: ("GET", "/api/cache/stats", {})),
+        ("GET", "/metrics", lambda i: ("GET", "/metrics", {})),
+        ("GET", "/healthz", lambda i: ("GET", "/healthz", {})),
+        ("GET", "/readyz", lambda i: ("GET", "/readyz", {})),
+    ]
+
+
+def uncovered(routes):
+    return query_plans.uncovered(app, {(method, path) for method, path, _ in routes})
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def run(client, routes, iterations):
+    counter = StatementCounter()
+    engines = (engine, async_engine.sync_engine)
+    for target in engines:
+        event.listen(target, "before_cursor_execute", counter)
+    results = {}
+    try:
+        for method, template, call in routes:
+            timings = []
+            counter.count = 0
+            for i in range(iterations):
+                verb, path, kwargs = call(i)
+                start = time.perf_counter()
+                response = client.request(verb, path, allow_redirects=False, **kwargs)
+                timings.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{verb} {path}: HTTP {response.status_code} {response.text[:200]}")
+            timings.sort()
+            results[f"{method} {template}"] = {
+                "p50_ms": percentile(timings, 0.50) * 1000,
+                "p95_ms": percentile(timings, 0.95) * 1000,
+                "statements": counter.count / iterations,
+            }
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", counter)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--users", type=int, default=8, help="members per group")
+    parser.add_argument("--expenses", type=int, default=200, help="expenses per group")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cold", action="store_true", help="bypass the read-through cache")
+    parser.add_argument("--baseline", help="fail if slower than this JSON baseline")
+    parser.add_argument("--save-baseline", help="write this run's p50s to a JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=baseline.DEFAULT_TOLERANCE)
+    parser.add_argument(
+        "--statements-only", action="store_true",
+        help="save and compare only statements per call (implies --cold); the same on any machine"
+    )
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        group_ids = seeder.seed(db, args.groups, args.users, args.expenses, args.seed)
+        group_id = group_ids[-1]
+        member_ids = [user.id for user in crud.get_group_members(db, group_id)]
+        # Two group-deletion routes use up a scratch group per call
+        scratch = iter(seeder.seed(db, args.iterations * 2, 2, 5, args.seed))
+        # A finished export for the job status and download routes; run
+        # directly, as claim() could hand out an older queued export
+        job = jobs.enqueue(db, "export_ledger", {"group_id": group_id})
+        db.commit()
+        export_job = job.id
+        jobs.run(db, job)
+    finally:
+        db.close()
+
+    routes = make_routes(group_ids[0], group_id, member_ids, lambda i: next(scratch), export_job)
+    missing = uncovered(routes)
+    if missing:
+        print("FAIL: routes missing from the benchmark: " + ", ".join(missing))
+        return 1
+
+    # Warm runs average in wherever the cache misses fall, so statement
+    # counts are only exact with it off
+    cache.enabled = not (args.cold or args.statements_only)
+    try:
+        results = run(TestClient(app), routes, args.iterations)
+    finally:
+        cache.enabled = True
+
+    print(f"{'route':<52} {'p50 ms':>8} {'p95 ms':>8} {'stmts':>6}")
+    for name, stats in results.items():
+        print(f"{name:<52} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['statements']:>6.1f}")
+
+    latencies = {name: stats["p50_ms"] for name, stats in results.items()}
+    statements = {name + STATEMENTS_SUFFIX: stats["statements"] for name, stats in results.items()}
+    if args.statements_only:
+        latencies = {}
+    if args.save_baseline:
+        baseline.save(args.save_baseline, {**latencies, **statements})
+        print(f"saved baseline to {args.save_baseline}")
+    if args.baseline:
+        saved = baseline.load(args.baseline)
+        regressions = baseline.compare(
+            {name: value for name, value in saved.items() if not name.endswith(STATEMENTS_SUFFIX)},
+            latencies, args.tolerance
+        )
+        # Baselines saved before statement counts were recorded just skip this
+        regressions += baseline.compare(
+            {name: value for name, value in saved.items() if name.endswith(STATEMENTS_SUFFIX)},
+            statements, tolerance=0, slack=STATEMENT_SLACK
+        )
+        for regression in regressions:
+            print("REGRESSION", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
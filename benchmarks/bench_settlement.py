@@ -0,0 +1,63 @@
+"""Benchmark the settlement engine.
+
+Usage:
+    python -m benchmarks.bench_settlement [--members 10000] [--runs 5]
+
+Times the greedy matcher on a large random group and compares its transfer
+count against the exact solver on small groups.
+"""
+import argparse
+import random
+import sys
+import time
+
+from app import settlement
+
+
+def random_group(members, rng):
+    # Cent balances that sum to exactly zero
+    cents = [rng.randint(-50000, 50000) for _ in range(members - 1)]
+    cents.append(-sum(cents))
+    return dict(enumerate(cents, start=1))
+
+
+def bench_greedy(members, runs, rng):
+    balances = random_group(members, rng)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        transfers = settlement.greedy_transfers(balances)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(f"greedy, {members} members: {len(transfers)} transfers, best of {runs}: {best * 1000:.1f} ms")
+    return best
+
+
+def compare_small(groups, rng):
+    extra = 0
+    for _ in range(groups):
+        balances = random_group(rng.randint(2, settlement.EXACT_LIMIT), rng)
+        extra += len(settlement.greedy_transfers(balances)) - len(settlement.exact_transfers(balances))
+    print(f"exact vs greedy on {groups} small groups: greedy used {extra} extra transfer(s) in total")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--members", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds allowed for the large group")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    best = bench_greedy(args.members, args.runs, rng)
+    compare_small(200, rng)
+
+    if best > args.budget:
+        print(f"FAIL: {best:.3f}s exceeds the {args.budget:.3f}s budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
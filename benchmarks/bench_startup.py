@@ -0,0 +1,161 @@
+"""Measure cold start and per-worker memory of `python -m app.serve`.
+
+Usage:
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.bench_startup \
+        [--workers 4] [--requests 200] [--mode preload --mode no-preload]
+
+For each mode it times `import app.main` in a fresh interpreter, then
+starts the server on --port and reports:
+
+* ready: seconds from launch until GET /readyz first answers 200
+* all workers: seconds until every worker has answered a request
+* RSS of the parent and the average per worker, plus each worker's PSS
+  (shared pages split between the processes sharing them) and private
+  memory, read from /proc after --requests requests to / warmed every
+  worker up (database engines included)
+
+Preloading shows up as lower worker PSS and private memory and a faster
+"all workers". Linux only (/proc). Needs httpx (requirements-dev.txt).
+The database must already have the schema; nothing here writes to it.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+MODES = {"preload": [], "no-preload": ["--no-preload"]}
+
+
+def import_seconds(env):
+    code = "import time; start = time.perf_counter(); import app.main; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True)
+    return float(output.stdout.split()[-1])
+
+
+def children(pid):
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # The command name may contain spaces; the parent pid follows it
+                fields = stat.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            found.append(int(entry))
+    return found
+
+
+def memory(pid):
+    """{"rss", "pss", "private"} in KiB, from smaps_rollup (falls back to RSS only)."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as rollup:
+            fields = {line.split(":")[0]: int(line.split()[1]) for line in rollup if line.endswith("kB\n")}
+        return {
+            "rss": fields["Rss"],
+            "pss": fields["Pss"],
+            "private": fields["Private_Clean"] + fields["Private_Dirty"],
+        }
+    except OSError:
+        with open(f"/proc/{pid}/status") as status:
+            rss = next(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+        return {"rss": rss, "pss": None, "private": None}
+
+
+def wait_ready(client, url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            if client.get(url + "/readyz").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"not ready after {timeout}s")
+
+
+def wait_all_workers(client, url, workers, timeout):
+    # A fresh connection per request lets the kernel hand it to any worker
+    seen = set()
+    deadline = time.monotonic() + timeout
+    while len(seen) < workers and time.monotonic() < deadline:
+        response = client.get(url + "/healthz", headers={"Connection": "close"})
+        seen.add(response.json()["pid"])
+        if len(seen) < workers:
+            time.sleep(0.01)
+    return len(seen) >= workers
+
+
+def measure(mode, args, env):
+    url = f"http://127.0.0.1:{args.port}"
+    command = [
+        sys.executable, "-m", "app.serve", "--port", str(args.port), "--workers", str(args.workers),
+        "--log-level", "warning", "--no-access-log", *MODES[mode],
+    ]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, env=env)
+    try:
+        with httpx.Client(timeout=10) as client:
+            wait_ready(client, url, process, args.timeout)
+            ready = time.perf_counter() - start
+            if not wait_all_workers(client, url, args.workers, args.timeout):
+                raise RuntimeError("not every worker answered")
+            all_workers = time.perf_counter() - start
+            for _ in range(args.requests):
+                client.get(url + "/", headers={"Connection": "close"})
+        parent = memory(process.pid)
+        workers = [memory(pid) for pid in children(process.pid)]
+    finally:
+        process.terminate()
+        process.wait(30)
+
+    def average(key):
+        values = [worker[key] for worker in workers if worker[key] is not None]
+        return sum(values) / len(values) / 1024 if values else float("nan")
+
+    return {
+        "ready_s": ready,
+        "all_workers_s": all_workers,
+        "parent_rss_mib": parent["rss"] / 1024,
+        "worker_rss_mib": average("rss"),
+        "worker_pss_mib": average("pss"),
+        "worker_private_mib": average("private"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--requests", type=int, default=200, help="warm-up requests to / before sampling memory")
+    parser.add_argument("--mode", action="append", choices=sorted(MODES), help="default: both")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, SLOW_QUERY_MS="-1")
+    env.setdefault("PYTHONPATH", os.getcwd())
+    print(f"import app.main: {import_seconds(env) * 1000:.0f} ms")
+
+    print(f"{'mode':<11} {'ready s':>8} {'all s':>7} {'parent':>8} {'rss':>8} {'pss':>8} {'private':>8}  (MiB per worker)")
+    for mode in args.mode or list(MODES):
+        try:
+            stats = measure(mode, args, env)
+        except RuntimeError as exc:
+            print(f"FAIL: {mode}: {exc}")
+            return 1
+        print(
+            f"{mode:<11} {stats['ready_s']:>8.2f} {stats['all_workers_s']:>7.2f} {stats['parent_rss_mib']:>8.1f} "
+            f"{stats['worker_rss_mib']:>8.1f} {stats['worker_pss_mib']:>8.1f} {stats['worker_private_mib']:>8.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Measure what idle live-balance viewers cost and how fast a write reaches them.
+
+Usage:
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.bench_stream [--viewers 5000] [--writes 20]
+
+Opens --viewers in-process subscriptions to one group, each consumed the way
+GET /group/{group_id}/stream consumes it, and reports the memory per viewer
+and the SQL statements they issue while idle (there should be none). It then
+posts --writes expenses through app.main and times how long each takes to
+reach every viewer. Needs httpx (requirements-dev.txt). Writes to
+DATABASE_URL, so point it at a scratch database.
+"""
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+
+import httpx
+from sqlalchemy import event
+
+from app import broadcast, crud, seed as seeder
+from app.database import Base, SessionLocal, async_engine, engine
+from app.main import app
+
+from .load_test import percentile
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+async def viewer(subscription, received):
+    stream = broadcast.event_stream(subscription, {"version": 0, "net": {}})
+    async for chunk in stream:
+        if chunk.startswith("event: balances"):
+            received.append(time.perf_counter())
+
+
+async def run(args, group_id, payer):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    received = []
+    tasks = []
+    for _ in range(args.viewers):
+        subscription = broadcast.hub.subscribe(group_id)
+        tasks.append(asyncio.ensure_future(viewer(subscription, received)))
+    await asyncio.sleep(0.1)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    per_viewer = sum(stat.size_diff for stat in after.compare_to(before, "filename")) / args.viewers
+
+    counter = StatementCounter()
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "before_cursor_execute", counter)
+    await asyncio.sleep(args.idle)
+    idle_statements = counter.count
+
+    fanout = []
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        for i in range(args.writes):
+            received.clear()
+            start = time.perf_counter()
+            response = await client.post("/add-expense", data={
+                "group_id": group_id, "added_by": payer, "amount": "9.99",
+                "description": f"Stream {i}", "split_type": "equal",
+            }, allow_redirects=False)
+            response.raise_for_status()
+            while len(received) < args.viewers:
+                await asyncio.sleep(0.001)
+            fanout.append(max(received) - start)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return per_viewer, idle_statements, sorted(fanout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--viewers", type=int, default=5000)
+    parser.add_argument("--writes", type=int, default=20)
+    parser.add_argument("--idle", type=float, default=1.0, help="seconds to count idle statements")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        group_id = seeder.seed(db, 1, 8, 50, args.seed)[0]
+        payer = crud.get_group_members(db, group_id)[0].id
+    finally:
+        db.close()
+
+    per_viewer, idle_statements, fanout = asyncio.run(run(args, group_id, payer))
+    print(f"{args.viewers} viewers: {per_viewer / 1024:.1f} KiB each, "
+          f"{idle_statements} statement(s) while idle for {args.idle:.1f}s")
+    print(f"write to all viewers: p50 {percentile(fanout, 0.5) * 1000:.1f} ms, "
+          f"p95 {percentile(fanout, 0.95) * 1000:.1f} ms")
+    return 1 if idle_statements else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
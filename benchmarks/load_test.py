@@ -0,0 +1,133 @@
+"""HTTP load test against a running server.
+
+Usage:
+    python -m benchmarks.load_test --url http://localhost:8000 --group 1 \
+        [--concurrency 200] [--duration 30] [--path / --path /group/{group}/ledger]
+
+Runs --concurrency clients in a closed loop for --duration seconds, each
+cycling through the given paths, then reports requests per second and
+p50/p95/p99 latency per path and overall. Needs httpx (requirements-dev.txt).
+
+--save-baseline stores the overall rps and p50/p95/p99 as JSON; --baseline
+compares against such a file and exits non-zero on a regression.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+from . import baseline
+
+DEFAULT_PATHS = ["/", "/group/{group}/ledger", "/api/group-users/{group}", "/group/{group}/settle-up"]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rps": len(values) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+    }
+
+
+async def client_loop(client, paths, deadline, offset, latencies, errors):
+    i = offset
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            latencies[path].append(time.perf_counter() - start)
+        else:
+            errors[path] += 1
+
+
+async def run(url, paths, concurrency, duration):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*[
+            client_loop(client, paths, deadline, n, latencies, errors) for n in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+    report = {
+        "concurrency": concurrency,
+        "duration_s": elapsed,
+        "paths": {path: summarize(latencies[path], errors[path], elapsed) for path in paths},
+        "overall": summarize(
+            [value for values in latencies.values() for value in values], sum(errors.values()), elapsed
+        ),
+    }
+    return report
+
+
+def print_report(report):
+    print(f"{'path':<40} {'reqs':>8} {'err':>5} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    rows = list(report["paths"].items()) + [("overall", report["overall"])]
+    for path, stats in rows:
+        print(
+            f"{path:<40} {stats['requests']:>8} {stats['errors']:>5} {stats['rps']:>9.1f} "
+            f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--group", type=int, default=1, help="group id substituted into {group}")
+    parser.add_argument("--path", action="append", dest="paths", help="path to request (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    parser.add_argument("--baseline", help="fail if worse than this JSON baseline")
+    parser.add_argument("--save-baseline", help="write this run's overall figures to a JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=baseline.DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    paths = [path.format(group=args.group) for path in (args.paths or DEFAULT_PATHS)]
+    report = asyncio.run(run(args.url, paths, args.concurrency, args.duration))
+    print_report(report)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    overall = report["overall"]
+    metrics = {key: overall[key] for key in ("rps", "p50_ms", "p95_ms", "p99_ms")}
+    if args.save_baseline:
+        baseline.save(args.save_baseline, metrics)
+    regressions = []
+    if args.baseline:
+        regressions = baseline.compare(
+            baseline.load(args.baseline), metrics, args.tolerance, higher_is_better={"rps"}
+        )
+        for regression in regressions:
+            print("REGRESSION", regression)
+    return 1 if overall["errors"] or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""Fire concurrent writers at one group and check the ledger stays consistent.
+
+Usage:
+    python -m benchmarks.stress_writes --url http://localhost:8000 [--writers 200] [--writes 10] [--members 20]
+    DATABASE_URL=sqlite:////tmp/stress.db python -m benchmarks.stress_writes --in-process
+
+Creates a fresh group through POST /api/groups, then runs --writers clients
+at once, each making --writes requests: mostly expenses, with settlements
+and members leaving and rejoining mixed in so that removals race expense
+splits. A single writer first does the same kind of work (up to 500
+requests) on another group for a serial baseline. Afterwards it checks, through the API:
+
+* the group's net balances sum to zero
+* the net balances match the pairwise debts they are derived from
+* no debt involves someone who is no longer a member
+
+and exits non-zero if an invariant fails, a request errors (5xx), or the
+concurrent run manages less than --min-ratio of the serial throughput.
+Requests refused with 4xx (e.g. an expense paid by a member who just left)
+are expected and only counted. --in-process drives app.main directly
+against DATABASE_URL instead of a server. Needs httpx (requirements-dev.txt).
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from decimal import Decimal
+
+import httpx
+
+
+async def writer(client, group_id, members, writes, rng, outcomes):
+    for _ in range(writes):
+        roll = rng.random()
+        payer, other = rng.sample(members, 2)
+        if roll < 0.8:
+            kind, response = "expense", await client.post("/add-expense", data={
+                "group_id": group_id, "added_by": payer["id"], "amount": f"{rng.randint(100, 10000) / 100:.2f}",
+                "description": "Stress", "split_type": "equal",
+            }, allow_redirects=False)
+        elif roll < 0.9:
+            kind, response = "settlement", await client.post(f"/api/groups/{group_id}/settlements", json={
+                "from_user": payer["id"], "to_user": other["id"], "amount": "1.00",
+            })
+        elif roll < 0.95:
+            kind, response = "remove", await client.post(
+                f"/remove-user-from-group/{group_id}/{other['id']}", allow_redirects=False
+            )
+        else:
+            kind, response = "rejoin", await client.post(f"/add-user-to-group/{group_id}", data={
+                "user_name": other["name"], "user_email": other["email"],
+            }, allow_redirects=False)
+        outcomes[(kind, response.status_code // 100)] += 1
+
+
+async def run_writers(client, group_id, members, writers, writes, seed):
+    outcomes = Counter()
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        writer(client, group_id, members, writes, random.Random(seed + n), outcomes) for n in range(writers)
+    ])
+    return outcomes, time.perf_counter() - started
+
+
+async def create_group(client, size):
+    tag = uuid.uuid4().hex[:8]
+    response = await client.post("/api/groups", json={
+        "name": f"Stress {tag}",
+        "users": [{"name": f"Stress {n}", "email": f"stress-{tag}-{n}@example.com"} for n in range(size)],
+    })
+    response.raise_for_status()
+    group = response.json()
+    return group["id"], group["members"]
+
+
+async def check(client, group_id):
+    """Invariant violations for the group, as messages."""
+    summary = (await client.get(f"/api/groups/balances?ids={group_id}")).json()["groups"][0]
+    member_ids = {user["id"] for user in (await client.get(f"/api/group-users/{group_id}")).json()}
+    nets = {row["user_id"]: Decimal(str(row["net"])) for row in summary["balances"]}
+
+    failures = []
+    if sum(nets.values()) != 0:
+        failures.append(f"net balances sum to {sum(nets.values())}")
+    derived = Counter()
+    for debt in summary["debts"]:
+        amount = Decimal(str(debt["amount"]))
+        derived[debt["to"]] += amount
+        derived[debt["from"]] -= amount
+        for user_id in (debt["from"], debt["to"]):
+            if user_id not in member_ids:
+                failures.append(f"debt {debt['from']} -> {debt['to']} involves non-member {user_id}")
+    for user_id in set(nets) | set(derived):
+        if nets.get(user_id, 0) != derived.get(user_id, 0):
+            failures.append(f"user {user_id}: net {nets.get(user_id, 0)} but debts add up to {derived.get(user_id, 0)}")
+    return failures
+
+
+def print_outcomes(label, outcomes, elapsed):
+    total = sum(outcomes.values())
+    print(f"{label}: {total} writes in {elapsed:.2f}s ({total / elapsed:,.0f} writes/s)")
+    for (kind, status), count in sorted(outcomes.items()):
+        print(f"  {kind:<11} {status}xx {count:>6}")
+
+
+async def stress(client, args):
+    group_id, members = await create_group(client, args.members)
+    serial_writes = min(args.writers * args.writes, 500)
+    serial, serial_elapsed = await run_writers(client, group_id, members, 1, serial_writes, args.seed)
+    print_outcomes("serial", serial, serial_elapsed)
+
+    group_id, members = await create_group(client, args.members)
+    concurrent, concurrent_elapsed = await run_writers(
+        client, group_id, members, args.writers, args.writes, args.seed
+    )
+    print_outcomes(f"{args.writers} writers", concurrent, concurrent_elapsed)
+
+    failures = await check(client, group_id)
+    errors = sum(count for (kind, status), count in concurrent.items() if status == 5)
+    if errors:
+        failures.append(f"{errors} request(s) failed with 5xx")
+    serial_rate = sum(serial.values()) / serial_elapsed
+    concurrent_rate = sum(concurrent.values()) / concurrent_elapsed
+    if concurrent_rate < serial_rate * args.min_ratio:
+        failures.append(f"throughput fell to {concurrent_rate:,.0f} writes/s from {serial_rate:,.0f} serially")
+    return failures
+
+
+async def main_async(args):
+    limits = httpx.Limits(max_connections=args.writers, max_keepalive_connections=args.writers)
+    if args.in_process:
+        from app.database import Base, engine
+        from app.main import app
+        Base.metadata.create_all(bind=engine)
+        client = httpx.AsyncClient(app=app, base_url="http://stress", timeout=120)
+    else:
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=120)
+    async with client:
+        return await stress(client, args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--in-process", action="store_true", help="drive app.main directly against DATABASE_URL")
+    parser.add_argument("--writers", type=int, default=200)
+    parser.add_argument("--writes", type=int, default=10, help="requests per writer")
+    parser.add_argument("--members", type=int, default=20)
+    parser.add_argument("--min-ratio", type=float, default=0.5,
+                        help="fail if concurrent writes/s drop below this share of the serial rate")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    failures = asyncio.run(main_async(args))
+    for failure in failures:
+        print("FAIL", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""add month-start balance snapshots
+
+Revision ID: 2e6a0d9c4f71
+Revises: b5f92c7e1d48
+Create Date: 2024-12-19 10:47:22.518306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '2e6a0d9c4f71'
+down_revision: Union[str, None] = 'b5f92c7e1d48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('balance_snapshots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('group_id', sa.Integer(), nullable=False),
+    sa.Column('taken_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['group_id'], ['groups.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('group_id', 'taken_at', name='uq_balance_snapshots_group_taken_at')
+    )
+    op.create_table('balance_snapshot_lines',
+    sa.Column('snapshot_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('owe_to', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['owe_to'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['snapshot_id'], ['balance_snapshots.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('snapshot_id', 'user_id', 'owe_to')
+    )
+    op.create_index('ix_ledger_events_group_kind_created', 'ledger_events', ['group_id', 'kind', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ledger_events_group_kind_created', table_name='ledger_events')
+    op.drop_table('balance_snapshot_lines')
+    op.drop_table('balance_snapshots')
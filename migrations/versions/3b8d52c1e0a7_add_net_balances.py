@@ -0,0 +1,44 @@
+"""add net_balances
+
+Revision ID: 3b8d52c1e0a7
+Revises: ffe641086f4c
+Create Date: 2024-12-08 10:12:41.503117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '3b8d52c1e0a7'
+down_revision: Union[str, None] = 'ffe641086f4c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('net_balances',
+    sa.Column('group_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('net', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['group_id'], ['groups.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('group_id', 'user_id')
+    )
+
+    # Backfill from the existing balance history
+    op.execute("""
+        INSERT INTO net_balances (group_id, user_id, net)
+        SELECT group_id, user_id, SUM(amount)
+        FROM (
+            SELECT group_id, owe_to AS user_id, amount FROM balances
+            UNION ALL
+            SELECT group_id, user_id, -amount FROM balances
+        ) AS legs
+        GROUP BY group_id, user_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('net_balances')
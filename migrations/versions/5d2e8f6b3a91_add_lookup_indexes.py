@@ -0,0 +1,39 @@
+"""add foreign-key lookup indexes
+
+Revision ID: 5d2e8f6b3a91
+Revises: c4e7a9b21f03
+Create Date: 2024-12-12 09:48:17.330582
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '5d2e8f6b3a91'
+down_revision: Union[str, None] = 'c4e7a9b21f03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Drop duplicate memberships (keeping the oldest) before enforcing uniqueness
+    op.execute("""
+        DELETE FROM group_memberships
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM group_memberships GROUP BY group_id, user_id
+        )
+    """)
+    # Also serves every `group_memberships.group_id = ?` filter
+    op.create_unique_constraint(
+        'uq_group_memberships_group_user', 'group_memberships', ['group_id', 'user_id']
+    )
+
+    # (group_id, user_id, ...) is already covered by uq_balances_group_pair
+    op.create_index('ix_balances_group_owe_to', 'balances', ['group_id', 'owe_to'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_balances_group_owe_to', table_name='balances')
+    op.drop_constraint('uq_group_memberships_group_user', 'group_memberships', type_='unique')
@@ -0,0 +1,52 @@
+"""store money as integer cents
+
+Revision ID: 7a3c5e9d2b14
+Revises: e81b3d47c5f6
+Create Date: 2024-12-17 09:12:44.381027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '7a3c5e9d2b14'
+down_revision: Union[str, None] = 'e81b3d47c5f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONEY_COLUMNS = [('expenses', 'amount', True), ('balances', 'amount', False)]
+
+
+def upgrade() -> None:
+    for table, column, nullable in MONEY_COLUMNS:
+        op.execute(f"UPDATE {table} SET {column} = ROUND({column} * 100)")
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(column, existing_type=sa.Float(), type_=sa.BigInteger(),
+                                  existing_nullable=nullable, postgresql_using=f'{column}::bigint')
+
+    # Rounding each net position on its own could leave a group a cent off
+    # zero, so rebuild them from the rounded pair totals instead
+    op.execute("DELETE FROM net_balances")
+    with op.batch_alter_table('net_balances') as batch_op:
+        batch_op.alter_column('net', existing_type=sa.Float(), type_=sa.BigInteger(),
+                              existing_nullable=False, postgresql_using='net::bigint')
+    op.execute("""
+        INSERT INTO net_balances (group_id, user_id, net)
+        SELECT group_id, user_id, SUM(amount)
+        FROM (
+            SELECT group_id, owe_to AS user_id, amount FROM balances
+            UNION ALL
+            SELECT group_id, user_id, -amount FROM balances
+        ) AS legs
+        GROUP BY group_id, user_id
+    """)
+
+
+def downgrade() -> None:
+    for table, column, nullable in MONEY_COLUMNS + [('net_balances', 'net', False)]:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(column, existing_type=sa.BigInteger(), type_=sa.Float(),
+                                  existing_nullable=nullable, postgresql_using=f'{column}::double precision')
+        op.execute(f"UPDATE {table} SET {column} = {column} / 100.0")
@@ -0,0 +1,174 @@
+"""partition expenses by month and balances by group; add group archives
+
+Revision ID: 8e4b27c6f3d1
+Revises: 6c1d93e0a5b2
+Create Date: 2024-12-27 09:41:36.902117
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '8e4b27c6f3d1'
+down_revision: Union[str, None] = '6c1d93e0a5b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Months of empty expense partitions created past the current one;
+# `python -m app.partitions ensure` keeps adding them afterwards
+MONTHS_AHEAD = 3
+BALANCE_PARTITIONS = 16
+
+
+def _next_month(month):
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+
+def _set_aside(bind, table, indexes, unique_constraints=()):
+    """Rename `table` to <table>_old, out of the way of the new table's names; returns its id sequence."""
+    sequence = bind.execute(sa.text(f"SELECT pg_get_serial_sequence('{table}', 'id')")).scalar()
+    # Index names are schema-wide, so the old table's must go first
+    for name in unique_constraints:
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}")
+    for name in indexes:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    op.execute(f"ALTER TABLE {table} RENAME CONSTRAINT {table}_pkey TO {table}_old_pkey")
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    return sequence
+
+
+def _take_over(table, sequence):
+    op.execute(f"INSERT INTO {table} SELECT * FROM {table}_old")
+    # The id sequence keeps counting where it was
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+    op.execute(f"DROP TABLE {table}_old")
+
+
+def _drop_foreign_keys_to(bind, referred, tables):
+    for table in tables:
+        for key in sa.inspect(bind).get_foreign_keys(table):
+            if key['referred_table'] == referred:
+                op.drop_constraint(key['name'], table, type_='foreignkey')
+
+
+def upgrade() -> None:
+    op.add_column('groups', sa.Column('archived_at', sa.DateTime(), nullable=True))
+    op.create_table('group_archives',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('group_id', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.Column('path', sa.String(), nullable=False),
+    sa.Column('sha256', sa.String(), nullable=False),
+    sa.Column('expense_count', sa.Integer(), nullable=False),
+    sa.Column('settlement_count', sa.Integer(), nullable=False),
+    sa.Column('total_amount', sa.BigInteger(), nullable=False),
+    sa.Column('first_expense_at', sa.DateTime(), nullable=True),
+    sa.Column('last_activity_at', sa.DateTime(), nullable=True),
+    sa.Column('member_totals', sa.JSON(), nullable=False),
+    sa.ForeignKeyConstraint(['group_id'], ['groups.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_group_archives_group_id'), 'group_archives', ['group_id'], unique=False)
+
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        # Declarative partitioning is PostgreSQL only; elsewhere the tables stay as they are
+        op.execute("UPDATE expenses SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+        return
+
+    # Rows are copied into the new tables, so run this with writes stopped
+
+    # expenses: range partitions by month of created_at, which must be set.
+    # A partitioned table's primary key has to include the partition key, and
+    # foreign keys can only point at a unique key, so expense_splits and
+    # ledger_events lose theirs to expenses.id
+    op.execute("UPDATE expenses SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+    first, = bind.execute(sa.text("SELECT MIN(created_at) FROM expenses")).one()
+    _drop_foreign_keys_to(bind, 'expenses', ['expense_splits', 'ledger_events'])
+    sequence = _set_aside(bind, 'expenses', ['ix_expenses_id', 'ix_expenses_group_created_id'])
+    op.execute("CREATE TABLE expenses (LIKE expenses_old INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+    op.execute("ALTER TABLE expenses ALTER COLUMN created_at SET NOT NULL")
+    op.execute("ALTER TABLE expenses ADD CONSTRAINT expenses_pkey PRIMARY KEY (id, created_at)")
+    op.create_foreign_key(None, 'expenses', 'groups', ['group_id'], ['id'])
+    op.create_foreign_key(None, 'expenses', 'users', ['added_by'], ['id'])
+    this_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    last = this_month
+    for _ in range(MONTHS_AHEAD):
+        last = _next_month(last)
+    month = min(first, this_month).replace(day=1, hour=0, minute=0, second=0, microsecond=0) if first else this_month
+    while month <= last:
+        end = _next_month(month)
+        op.execute(
+            f"CREATE TABLE expenses_{month:%Y_%m} PARTITION OF expenses "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        )
+        month = end
+    # Catches anything dated outside the monthly partitions (e.g. a backdated import)
+    op.execute("CREATE TABLE expenses_default PARTITION OF expenses DEFAULT")
+    _take_over('expenses', sequence)
+    op.create_index(
+        'ix_expenses_group_created_id',
+        'expenses',
+        ['group_id', sa.text('created_at DESC'), sa.text('id DESC')],
+        unique=False,
+    )
+
+    # balances: hash partitions by group_id; every lookup names the group, so
+    # it touches one partition
+    sequence = _set_aside(
+        bind, 'balances', ['ix_balances_id', 'ix_balances_group_owe_to'], ['uq_balances_group_pair']
+    )
+    op.execute("CREATE TABLE balances (LIKE balances_old INCLUDING DEFAULTS) PARTITION BY HASH (group_id)")
+    op.execute("ALTER TABLE balances ADD CONSTRAINT balances_pkey PRIMARY KEY (id, group_id)")
+    op.create_foreign_key(None, 'balances', 'groups', ['group_id'], ['id'])
+    op.create_foreign_key(None, 'balances', 'users', ['user_id'], ['id'])
+    op.create_foreign_key(None, 'balances', 'users', ['owe_to'], ['id'])
+    for remainder in range(BALANCE_PARTITIONS):
+        op.execute(
+            f"CREATE TABLE balances_p{remainder:02d} PARTITION OF balances "
+            f"FOR VALUES WITH (MODULUS {BALANCE_PARTITIONS}, REMAINDER {remainder})"
+        )
+    _take_over('balances', sequence)
+    op.create_unique_constraint('uq_balances_group_pair', 'balances', ['group_id', 'user_id', 'owe_to'])
+    op.create_index('ix_balances_group_owe_to', 'balances', ['group_id', 'owe_to'], unique=False)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        # Back to plain tables; dropping the old parent drops its partitions
+        sequence = _set_aside(
+            bind, 'balances', ['ix_balances_group_owe_to'], ['uq_balances_group_pair']
+        )
+        op.execute("CREATE TABLE balances (LIKE balances_old INCLUDING DEFAULTS)")
+        op.execute("ALTER TABLE balances ADD CONSTRAINT balances_pkey PRIMARY KEY (id)")
+        op.create_foreign_key(None, 'balances', 'groups', ['group_id'], ['id'])
+        op.create_foreign_key(None, 'balances', 'users', ['user_id'], ['id'])
+        op.create_foreign_key(None, 'balances', 'users', ['owe_to'], ['id'])
+        _take_over('balances', sequence)
+        op.create_index(op.f('ix_balances_id'), 'balances', ['id'], unique=False)
+        op.create_unique_constraint('uq_balances_group_pair', 'balances', ['group_id', 'user_id', 'owe_to'])
+        op.create_index('ix_balances_group_owe_to', 'balances', ['group_id', 'owe_to'], unique=False)
+
+        sequence = _set_aside(bind, 'expenses', ['ix_expenses_group_created_id'])
+        op.execute("CREATE TABLE expenses (LIKE expenses_old INCLUDING DEFAULTS)")
+        op.execute("ALTER TABLE expenses ADD CONSTRAINT expenses_pkey PRIMARY KEY (id)")
+        op.create_foreign_key(None, 'expenses', 'groups', ['group_id'], ['id'])
+        op.create_foreign_key(None, 'expenses', 'users', ['added_by'], ['id'])
+        _take_over('expenses', sequence)
+        op.create_index(op.f('ix_expenses_id'), 'expenses', ['id'], unique=False)
+        op.create_index(
+            'ix_expenses_group_created_id',
+            'expenses',
+            ['group_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            unique=False,
+        )
+        op.create_foreign_key(None, 'expense_splits', 'expenses', ['expense_id'], ['id'])
+        op.create_foreign_key(None, 'ledger_events', 'expenses', ['expense_id'], ['id'])
+
+    op.drop_index(op.f('ix_group_archives_group_id'), table_name='group_archives')
+    op.drop_table('group_archives')
+    op.drop_column('groups', 'archived_at')
@@ -0,0 +1,48 @@
+"""compact balances into one row per debtor/creditor pair
+
+Revision ID: 9f1c04a7d6e2
+Revises: 3b8d52c1e0a7
+Create Date: 2024-12-09 18:37:05.220914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '9f1c04a7d6e2'
+down_revision: Union[str, None] = '3b8d52c1e0a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Fold the per-expense history into one total per ordered pair.
+    # Self rows (user_id = owe_to) always net to zero, so they are dropped.
+    op.create_table('balances_compacted',
+    sa.Column('group_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('owe_to', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False)
+    )
+    op.execute("""
+        INSERT INTO balances_compacted (group_id, user_id, owe_to, amount)
+        SELECT group_id, user_id, owe_to, SUM(amount)
+        FROM balances
+        WHERE user_id <> owe_to
+        GROUP BY group_id, user_id, owe_to
+    """)
+    op.execute("DELETE FROM balances")
+    op.execute("""
+        INSERT INTO balances (group_id, user_id, owe_to, amount)
+        SELECT group_id, user_id, owe_to, amount FROM balances_compacted
+    """)
+    op.drop_table('balances_compacted')
+
+    op.create_unique_constraint('uq_balances_group_pair', 'balances', ['group_id', 'user_id', 'owe_to'])
+
+
+def downgrade() -> None:
+    # The per-expense rows cannot be recovered; only the constraint is removed
+    op.drop_constraint('uq_balances_group_pair', 'balances', type_='unique')
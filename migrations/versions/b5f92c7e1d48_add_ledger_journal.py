@@ -0,0 +1,73 @@
+"""add expense splits and the ledger journal
+
+Revision ID: b5f92c7e1d48
+Revises: 7a3c5e9d2b14
+Create Date: 2024-12-18 14:05:31.902177
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'b5f92c7e1d48'
+down_revision: Union[str, None] = '7a3c5e9d2b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('expense_splits',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('expense_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['expense_id'], ['expenses.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_expense_splits_expense_id'), 'expense_splits', ['expense_id'], unique=False)
+
+    op.create_table('ledger_events',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('group_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('expense_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('counterparty_id', sa.Integer(), nullable=True),
+    sa.Column('amount', sa.BigInteger(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['counterparty_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['expense_id'], ['expenses.id'], ),
+    sa.ForeignKeyConstraint(['group_id'], ['groups.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ledger_events_group_id', 'ledger_events', ['group_id', 'id'], unique=False)
+
+    op.create_table('projection_checkpoints',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('last_event_id', sa.BigInteger(), nullable=False),
+    sa.Column('target_event_id', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    # Existing expenses have no recorded split lines, so the journal starts
+    # from the current pair totals: one opening event per balance row
+    op.execute("""
+        INSERT INTO ledger_events (group_id, kind, user_id, counterparty_id, amount, created_at)
+        SELECT group_id, 'opening', user_id, owe_to, amount, CURRENT_TIMESTAMP
+        FROM balances
+        WHERE amount <> 0
+        ORDER BY id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('projection_checkpoints')
+    op.drop_index('ix_ledger_events_group_id', table_name='ledger_events')
+    op.drop_table('ledger_events')
+    op.drop_index(op.f('ix_expense_splits_expense_id'), table_name='expense_splits')
+    op.drop_table('expense_splits')
@@ -0,0 +1,39 @@
+"""expense ledger pagination index
+
+Revision ID: c4e7a9b21f03
+Revises: 9f1c04a7d6e2
+Create Date: 2024-12-11 14:05:52.871360
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'c4e7a9b21f03'
+down_revision: Union[str, None] = '9f1c04a7d6e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # description/created_at were previously added outside the migration chain
+    # (app/migrations/add_expense_description.py); bring them into it here.
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('expenses')}
+    if 'description' not in columns:
+        op.add_column('expenses', sa.Column('description', sa.String(), nullable=True))
+        op.execute("UPDATE expenses SET description = 'Expense' WHERE description IS NULL")
+    if 'created_at' not in columns:
+        op.add_column('expenses', sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True))
+
+    op.create_index(
+        'ix_expenses_group_created_id',
+        'expenses',
+        ['group_id', sa.text('created_at DESC'), sa.text('id DESC')],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_expenses_group_created_id', table_name='expenses')
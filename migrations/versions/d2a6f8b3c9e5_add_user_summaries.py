@@ -0,0 +1,43 @@
+"""add per-user summaries and the user-to-groups index
+
+Revision ID: d2a6f8b3c9e5
+Revises: 8e4b27c6f3d1
+Create Date: 2025-01-03 11:26:48.517304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'd2a6f8b3c9e5'
+down_revision: Union[str, None] = '8e4b27c6f3d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_group_memberships_user_group', 'group_memberships', ['user_id', 'group_id'], unique=False)
+    op.create_table('user_summaries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('group_count', sa.Integer(), nullable=False),
+    sa.Column('net', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Backfill from current memberships; deleted groups have none left
+    op.execute("""
+        INSERT INTO user_summaries (user_id, group_count, net)
+        SELECT group_memberships.user_id, COUNT(*), COALESCE(SUM(net_balances.net), 0)
+        FROM group_memberships
+        LEFT JOIN net_balances
+            ON net_balances.group_id = group_memberships.group_id
+            AND net_balances.user_id = group_memberships.user_id
+        GROUP BY group_memberships.user_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('user_summaries')
+    op.drop_index('ix_group_memberships_user_group', table_name='group_memberships')
@@ -0,0 +1,25 @@
+"""add groups.version
+
+Revision ID: e81b3d47c5f6
+Revises: 5d2e8f6b3a91
+Create Date: 2024-12-16 11:26:09.614452
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'e81b3d47c5f6'
+down_revision: Union[str, None] = '5d2e8f6b3a91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('groups', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('groups', 'version')
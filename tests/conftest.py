@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# app.database refuses to import without a URL; these tests bring their own data
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "tests.db"))
+os.environ.setdefault("SLOW_QUERY_MS", "-1")
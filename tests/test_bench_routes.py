@@ -0,0 +1,7 @@
+"""No route may issue more statements per call than the committed baseline (benchmarks/route_statements.json)."""
+from benchmarks import bench_routes
+
+
+def test_statements_per_route_match_the_baseline(capsys):
+    status = bench_routes.main(bench_routes.STATEMENTS_ARGS + ["--baseline", bench_routes.STATEMENTS_BASELINE])
+    assert status == 0, capsys.readouterr().out
@@ -0,0 +1,25 @@
+"""Bulk import records are validated one at a time, before anything is written."""
+from datetime import datetime
+
+import pytest
+
+from app import bulk_import
+
+NOW = datetime(2024, 6, 1)
+
+
+def test_offset_created_at_is_converted_to_naive_utc():
+    record = {"added_by": "1", "amount": "12.50", "split_type": "equal", "created_at": "2024-01-05T10:00:00+02:00"}
+    assert bulk_import.parse_record(record, {1, 2}, NOW)["created_at"] == datetime(2024, 1, 5, 8, 0)
+
+
+def test_naive_created_at_is_kept_and_missing_one_is_now():
+    record = {"added_by": "1", "amount": "12.50", "split_type": "equal", "created_at": "2024-01-05T10:00:00"}
+    assert bulk_import.parse_record(record, {1, 2}, NOW)["created_at"] == datetime(2024, 1, 5, 10, 0)
+    assert bulk_import.parse_record(dict(record, created_at=""), {1, 2}, NOW)["created_at"] == NOW
+
+
+def test_malformed_created_at_is_a_record_error():
+    record = {"added_by": "1", "amount": "12.50", "split_type": "equal", "created_at": "5 Jan"}
+    with pytest.raises(ValueError, match="ISO 8601"):
+        bulk_import.parse_record(record, {1, 2}, NOW)
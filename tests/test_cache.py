@@ -0,0 +1,101 @@
+import asyncio
+
+from app import cache as cache_module
+from app.cache import Cache, MemoryBackend, RedisBackend, members_key
+
+
+class FakeRedis:
+    """The slice of redis.Redis that RedisBackend uses, over a dict."""
+
+    def __init__(self):
+        self.data = {}
+        self.expiries = {}
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        self.expiries[key] = ex
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+            self.expiries.pop(key, None)
+
+    def incr(self, key):
+        value = int(self.data.get(key, b"0")) + 1
+        self.data[key] = str(value).encode()
+        return value
+
+
+class FakeSession:
+    """Just enough of AsyncSession for _read_through."""
+
+    def __init__(self, during_load=None):
+        self.sync_session = self
+        self.info = {}
+        self.during_load = during_load
+
+    async def run_sync(self, function, *args):
+        result = function(self, *args)
+        if self.during_load is not None:
+            self.during_load()
+        return result
+
+
+def read_members(cache, loader, session):
+    original = cache_module.cache
+    cache_module.cache = cache
+    try:
+        return asyncio.run(cache_module._read_through(session, "members", members_key, loader, [1]))
+    finally:
+        cache_module.cache = original
+
+
+def test_redis_backend_round_trip():
+    client = FakeRedis()
+    cache = Cache(RedisBackend(client), ttl=60)
+    cache.set_many({"a": {"x": [1, 2]}, "b": 3}, ttl=600)
+
+    assert cache.get_many("test", ["a", "b", "c"]) == {"a": {"x": [1, 2]}, "b": 3}
+    # Never kept longer than the cache's own TTL
+    assert client.expiries["splitwise:a"] == 60
+    cache.backend.delete(["a"])
+    assert cache.get_many("test", ["a"]) == {}
+
+
+def test_invalidation_drops_entries_on_both_backends():
+    for backend in (MemoryBackend(), RedisBackend(FakeRedis())):
+        cache = Cache(backend)
+        loads = []
+
+        def loader(db, group_ids):
+            loads.append(list(group_ids))
+            return {group_id: [{"id": len(loads)}] for group_id in group_ids}
+
+        assert read_members(cache, loader, FakeSession()) == {1: [{"id": 1}]}
+        assert read_members(cache, loader, FakeSession()) == {1: [{"id": 1}]}
+        cache.invalidate_group(1)
+        assert read_members(cache, loader, FakeSession()) == {1: [{"id": 2}]}
+        assert loads == [[1], [1]]
+
+
+def test_write_during_load_is_not_cached():
+    for backend in (MemoryBackend(), RedisBackend(FakeRedis())):
+        cache = Cache(backend)
+        current = {"members": "before"}
+
+        def loader(db, group_ids):
+            return {group_id: current["members"] for group_id in group_ids}
+
+        def write():
+            # Commits and invalidates after the reader loaded, before it stores
+            current["members"] = "after"
+            cache.invalidate_group(1)
+
+        assert read_members(cache, loader, FakeSession(during_load=write)) == {1: "before"}
+        # The stale load was stored under the old generation and is not served
+        assert read_members(cache, loader, FakeSession()) == {1: "after"}
+        assert read_members(cache, loader, FakeSession()) == {1: "after"}
+        assert cache.hits["members"] == 1
@@ -0,0 +1,53 @@
+"""Expense and settlement amounts must be positive and below money.MAX_CENTS on every write path."""
+import pytest
+from fastapi.testclient import TestClient
+
+from app import crud, database, models, money, seed as seeder
+from app.main import app
+
+
+@pytest.fixture(scope="module")
+def group():
+    database.Base.metadata.create_all(bind=database.get_engine())
+    db = database.SessionLocal()
+    try:
+        group_id, = seeder.seed(db, groups=1, users_per_group=3, expenses_per_group=2, seed=53)
+        return group_id, [user.id for user in crud.get_group_members(db, group_id)]
+    finally:
+        db.close()
+
+
+def expense_count(group_id):
+    db = database.SessionLocal()
+    try:
+        return db.query(models.Expense).filter(models.Expense.group_id == group_id).count()
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("amount", ["-30", "0", "1e30", str(money.MAX_CENTS // 100 + 1)])
+def test_form_rejects_out_of_range_amounts(group, amount):
+    group_id, members = group
+    before = expense_count(group_id)
+    response = TestClient(app).post("/add-expense", data={
+        "group_id": group_id, "added_by": members[0], "amount": amount, "description": "Bad", "split_type": "equal",
+    }, allow_redirects=False)
+    assert response.status_code == 400
+    assert expense_count(group_id) == before
+
+
+def test_largest_amount_is_accepted(group):
+    group_id, members = group
+    response = TestClient(app).post("/add-expense", data={
+        "group_id": group_id, "added_by": members[0], "amount": str(money.from_cents(money.MAX_CENTS)),
+        "description": "Big", "split_type": "equal",
+    }, allow_redirects=False)
+    assert response.status_code == 303
+
+
+def test_settlement_rejects_overflowing_amount(group):
+    group_id, members = group
+    response = TestClient(app).post(f"/api/groups/{group_id}/settlements", json={
+        "from_user": members[0], "to_user": members[1], "amount": "1e30",
+    })
+    assert response.status_code == 400
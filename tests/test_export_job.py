@@ -0,0 +1,43 @@
+"""Export jobs write the ledger a partition at a time, renewing their lease as they go."""
+import csv
+from datetime import datetime
+
+from app import crud, database, exports, jobs, models, seed as seeder, writes
+
+
+def test_export_job_renews_its_lease_and_writes_a_consistent_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(exports, "PARTITION_SIZE", 7)
+    monkeypatch.setattr(jobs, "EXPORT_DIR", str(tmp_path))
+    database.Base.metadata.create_all(bind=database.get_engine())
+    db = database.SessionLocal()
+    try:
+        group_id, = seeder.seed(db, groups=1, users_per_group=3, expenses_per_group=30, seed=61)
+        member = crud.get_group_members(db, group_id)[0].id
+        expected = [row.id for row in db.execute(exports.ledger_statement(group_id))]
+
+        leases = []
+        renew = jobs.report
+
+        def report(db, job_id, **progress):
+            renew(db, job_id, **progress)
+            leases.append(progress["rows"])
+            if len(leases) == 1:
+                # Dated into a page not yet written; the export must still leave it out
+                writes.write_group_sync(
+                    db, group_id, crud.create_expense, group_id, member, 500, "Late", "equal",
+                    created_at=datetime(2100, 1, 1)
+                )
+
+        monkeypatch.setattr(jobs, "report", report)
+        job = jobs.enqueue(db, "export_ledger", {"group_id": group_id})
+        db.commit()
+        jobs.run(db, job)
+        db.expire_all()
+        finished = db.get(models.Job, job.id)
+    finally:
+        db.close()
+
+    assert finished.status == jobs.DONE
+    assert leases == [7, 14, 21, 28, 30]
+    with open(finished.result["path"], newline="") as exported:
+        assert [int(row["id"]) for row in csv.DictReader(exported)] == expected
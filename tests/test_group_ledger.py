@@ -0,0 +1,31 @@
+"""The ledger page must render settle-up transfers that name people who are no longer members."""
+from fastapi.testclient import TestClient
+
+from app import database, models, seed as seeder
+from app.main import app
+
+
+def test_ledger_names_departed_counterparties():
+    database.Base.metadata.create_all(bind=database.get_engine())
+    db = database.SessionLocal()
+    try:
+        group_id, = seeder.seed(db, groups=1, users_per_group=4, expenses_per_group=10, seed=31)
+        # The legacy shape: balances still name users whose memberships are gone
+        debtors = sorted({
+            user_id for user_id, in db.query(models.NetBalance.user_id).filter(
+                models.NetBalance.group_id == group_id, models.NetBalance.net < 0
+            )
+        })
+        db.query(models.GroupMembership).filter(
+            models.GroupMembership.group_id == group_id, models.GroupMembership.user_id.in_(debtors)
+        ).delete(synchronize_session=False)
+        db.commit()
+        names = [db.get(models.User, user_id).name for user_id in debtors]
+    finally:
+        db.close()
+
+    client = TestClient(app)
+    response = client.get(f"/group/{group_id}/ledger")
+    assert response.status_code == 200
+    assert all(name in response.text for name in names)
+    assert client.get(f"/group/{group_id}/settle-up").status_code == 200
@@ -0,0 +1,66 @@
+"""home() must build its page on a fixed number of statements, however many groups and members it shows."""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import database, models, seed as seeder
+from app.cache import cache
+from app.main import app
+
+# Group list, memberships, net balances, pair balances
+HOME_STATEMENTS = 4
+
+
+@pytest.fixture(scope="module")
+def client():
+    database.Base.metadata.create_all(bind=database.get_engine())
+    cache.enabled = False
+    try:
+        yield TestClient(app)
+    finally:
+        cache.enabled = True
+
+
+def home_statements(client, path="/"):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    target = database.get_async_engine().sync_engine
+    event.listen(target, "before_cursor_execute", count)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(target, "before_cursor_execute", count)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize("groups, members, expenses", [(1, 2, 3), (5, 8, 20), (20, 3, 10), (30, 12, 5)])
+def test_home_statement_count_is_constant(client, groups, members, expenses):
+    # Paged from this case's own groups, so the page holds exactly what it
+    # seeded and nothing other test modules left behind
+    db = database.SessionLocal()
+    try:
+        group_ids = seeder.seed(db, groups=groups, users_per_group=members, expenses_per_group=expenses, seed=groups)
+    finally:
+        db.close()
+    assert home_statements(client, f"/?after={min(group_ids) - 1}") <= HOME_STATEMENTS
+
+
+def test_home_fetches_departed_counterparties_in_one_statement(client):
+    db = database.SessionLocal()
+    try:
+        group_id, = seeder.seed(db, groups=1, users_per_group=4, expenses_per_group=10, seed=99)
+        # Dropping memberships directly leaves balances naming non-members,
+        # as data from before member removal cleared balances does
+        debtors = [user_id for user_id, in db.query(models.Balance.user_id).filter(models.Balance.group_id == group_id)]
+        db.query(models.GroupMembership).filter(
+            models.GroupMembership.group_id == group_id, models.GroupMembership.user_id.in_(debtors[:2])
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    # Paged so the group is on the page whatever the other tests seeded
+    assert home_statements(client, f"/?after={group_id - 1}") <= HOME_STATEMENTS + 1
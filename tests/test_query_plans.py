@@ -0,0 +1,17 @@
+"""Every route's statements must be served by indexes (app.query_plans), on SQLite here."""
+from app import query_plans
+from app.main import app
+
+
+def test_every_route_uses_indexes(capsys):
+    status = query_plans.main(["--seed", "--create-tables"])
+    assert status == 0, capsys.readouterr().out
+
+
+def test_routes_missing_from_the_check_are_reported():
+    calls = query_plans.route_calls(1, 2, 3, [4, 5], 6)
+    covered = {(method, template) for method, template, _, _ in calls}
+    assert query_plans.uncovered(app, covered) == []
+    assert query_plans.uncovered(app, covered - {("GET", "/group/{group_id}/balances")}) == [
+        "GET /group/{group_id}/balances"
+    ]
@@ -0,0 +1,69 @@
+"""The rebuild_balances job refolds each group from its journal under the group's lock."""
+from app import crud, database, jobs, journal, models, seed as seeder, writes
+from app.cache import cache, members_key
+
+
+def stored_summaries(db):
+    rows = db.query(models.UserSummary.user_id, models.UserSummary.group_count, models.UserSummary.net)
+    return {user_id: (group_count, net) for user_id, group_count, net in rows if group_count or net}
+
+
+def balances(db, group_id):
+    pairs = db.query(models.Balance.user_id, models.Balance.owe_to, models.Balance.amount).filter(
+        models.Balance.group_id == group_id, models.Balance.amount != 0
+    )
+    return sorted(pairs), crud.get_group_net_balances(db, group_id)
+
+
+def test_rebuild_job_restores_the_projection_and_drops_stale_pages():
+    database.Base.metadata.create_all(bind=database.get_engine())
+    db = database.SessionLocal()
+    try:
+        group_id, other_id = seeder.seed(db, groups=2, users_per_group=4, expenses_per_group=12, seed=7)
+        # A removal in the middle of the journal: later expenses must not bring the member back
+        leaver = crud.get_group_members(db, group_id)[-1].id
+        writes.write_group_sync(db, group_id, crud.remove_member, group_id, leaver)
+        member = crud.get_group_members(db, group_id)[0].id
+        writes.write_group_sync(db, group_id, crud.create_expense, group_id, member, 3000, "After", "equal")
+        expected = {gid: balances(db, gid) for gid in (group_id, other_id)}
+        summaries = stored_summaries(db)
+
+        # Drift the projection the way a faulty write would, and cache what it shows
+        db.query(models.Balance).filter(models.Balance.group_id == group_id).delete(synchronize_session=False)
+        first, second = [user.id for user in crud.get_group_members(db, other_id)][:2]
+        crud.apply_net_deltas(db, other_id, {first: 100, second: -100})
+        db.commit()
+        versions = crud.get_group_versions(db, [group_id, other_id])
+        cache.set(members_key(group_id), ["stale"])
+
+        job = jobs.enqueue(db, "rebuild_balances", {})
+        db.commit()
+        jobs.run(db, job)
+        db.expire_all()
+
+        live = db.query(models.Group).filter(models.Group.deleted_at.is_(None)).count()
+        assert db.get(models.Job, job.id).result == {"groups": live}
+        assert {gid: balances(db, gid) for gid in (group_id, other_id)} == expected
+        assert all(leaver not in pair[:2] for pair in expected[group_id][0])
+        assert stored_summaries(db) == summaries
+        assert {
+            gid: version - versions[gid] for gid, version in crud.get_group_versions(db, [group_id, other_id]).items()
+        } == {group_id: 1, other_id: 1}
+        assert cache.get("members", members_key(group_id)) is None
+    finally:
+        db.close()
+
+
+def test_rebuild_group_matches_a_full_replay():
+    database.Base.metadata.create_all(bind=database.get_engine())
+    db = database.SessionLocal()
+    try:
+        group_id, = seeder.seed(db, groups=1, users_per_group=5, expenses_per_group=20, seed=11)
+        writes.write_group_sync(db, group_id, crud.remove_member, group_id, crud.get_group_members(db, group_id)[1].id)
+        journal.replay(db, batch_size=7, restart=True, log=lambda message: None)
+        replayed = balances(db, group_id)
+
+        writes.write_group_sync(db, group_id, journal.rebuild_group, group_id)
+        assert balances(db, group_id) == replayed
+    finally:
+        db.close()
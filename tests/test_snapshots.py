@@ -0,0 +1,38 @@
+"""Backdated writes and as-of reads accept timestamps that carry a UTC offset."""
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app import crud, database, models, seed as seeder, snapshots, writes
+from app.main import app
+
+
+def test_offset_timestamps_are_stored_as_naive_utc():
+    database.Base.metadata.create_all(bind=database.get_engine())
+    db = database.SessionLocal()
+    try:
+        group_id, = seeder.seed(db, groups=1, users_per_group=3, expenses_per_group=5, seed=41, days=1)
+        member = crud.get_group_members(db, group_id)[0].id
+        writes.write_group_sync(
+            db, group_id, crud.create_expense, group_id, member, 9000, "Old", "equal",
+            created_at=datetime(2024, 1, 31, 23, 0)
+        )
+        assert snapshots.build(db, group_id, now=datetime(2024, 3, 15)) == 2
+        db.commit()
+
+        # 2024-02-01 01:00 at +05:00 is 2024-01-31 20:00 UTC, before both snapshots
+        expense_id = writes.write_group_sync(
+            db, group_id, crud.create_expense, group_id, member, 3000, "Backdated", "equal",
+            created_at=datetime.fromisoformat("2024-02-01T01:00:00+05:00")
+        )
+        assert db.get(models.Expense, expense_id).created_at == datetime(2024, 1, 31, 20, 0)
+        assert db.query(models.BalanceSnapshot).filter(models.BalanceSnapshot.group_id == group_id).count() == 0
+    finally:
+        db.close()
+
+    response = TestClient(app).get(
+        f"/group/{group_id}/balances", params={"as_of": "2024-02-01T00:30:00+01:00"}
+    )
+    assert response.status_code == 200
+    assert response.json()["as_of"] == "2024-01-31T23:30:00"
+    assert response.json()["balances"]